@@ -0,0 +1,168 @@
+"""Сквозной замер производительности парсера на локальном тестовом сервере
+
+Запускает fake_its_server в фоновом потоке, прогоняет main.py против него
+и выводит число сохраненных страниц, страниц в секунду, затраченное
+процессорное время, пиковую память и статистику запросов к серверу.
+
+Запуск:
+    python benchmarks/e2e_throughput.py --pages 100 --latency 20
+    python benchmarks/e2e_throughput.py --pages 100 --json result.json -- --discover-depth 1
+
+Аргументы после "--" передаются main.py без изменений.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from fake_its_server import DATABASE, add_documentation_arguments, documentation_from_args, start_server
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+class TreeMemorySampler:
+    """Периодически замеряет суммарную RSS процесса и всех его потомков (нужен psutil)"""
+    
+    def __init__(self, pid: int, interval: float = 0.2) -> None:
+        self.pid: int = pid
+        self.interval: float = interval
+        self.peak_rss: int = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self) -> None:
+        try:
+            root = psutil.Process(self.pid)
+        except psutil.Error:
+            return
+        while not self._stop.is_set():
+            try:
+                processes = [root] + root.children(recursive=True)
+                rss = 0
+                for process in processes:
+                    try:
+                        rss += process.memory_info().rss
+                    except psutil.Error:
+                        pass
+                self.peak_rss = max(self.peak_rss, rss)
+            except psutil.Error:
+                break
+            self._stop.wait(self.interval)
+    
+    def start(self) -> None:
+        self._thread.start()
+    
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+def run_benchmark(args: argparse.Namespace, main_args: List[str]) -> dict:
+    documentation = documentation_from_args(args)
+    server = start_server(documentation, latency=args.latency / 1000,
+                          username=args.username, password=args.password)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='its-bench-')
+    
+    command = [
+        sys.executable, MAIN_SCRIPT,
+        '--url', f"{server.base_url}/db/{DATABASE}",
+        '--login', f"{server.base_url}/login",
+        '--username', args.username,
+        '--password', args.password,
+        '--headless',
+    ] + main_args
+    print(f"Тестовый сервер: {server.base_url}, каталог запуска: {workdir}")
+    print(' '.join(command))
+    
+    rusage_before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    started = time.perf_counter()
+    output_log = open(os.path.join(workdir, 'main.log'), 'w', encoding='utf-8')
+    process = subprocess.Popen(command, cwd=workdir, stdout=output_log, stderr=subprocess.STDOUT)
+    sampler: Optional[TreeMemorySampler] = None
+    if psutil:
+        sampler = TreeMemorySampler(process.pid)
+        sampler.start()
+    exit_code = process.wait()
+    elapsed = time.perf_counter() - started
+    output_log.close()
+    if sampler:
+        sampler.stop()
+    server.shutdown()
+    server.server_close()
+    
+    saved_pages = len(glob.glob(os.path.join(workdir, 'out', 'page_*', 'page.html')))
+    result = {
+        'exit_code': exit_code,
+        'pages_expected': documentation.pages if not args.limit else min(args.limit, documentation.pages),
+        'pages_saved': saved_pages,
+        'seconds': round(elapsed, 3),
+        'pages_per_second': round(saved_pages / elapsed, 3) if elapsed else 0,
+        'server_requests': dict(server.stats),
+        'server_bytes': server.bytes_sent,
+        'log': os.path.join(workdir, 'main.log'),
+    }
+    if rusage_before:
+        rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result['cpu_user_seconds'] = round(rusage.ru_utime - rusage_before.ru_utime, 3)
+        result['cpu_system_seconds'] = round(rusage.ru_stime - rusage_before.ru_stime, 3)
+        # ru_maxrss - пик самого большого из завершенных дочерних процессов (в КБ на Linux)
+        result['max_child_rss_mb'] = round(rusage.ru_maxrss / 1024, 1)
+    if sampler:
+        result['peak_tree_rss_mb'] = round(sampler.peak_rss / 1024 / 1024, 1)
+    return result
+
+def main() -> None:
+    argv = sys.argv[1:]
+    main_args: List[str] = []
+    if '--' in argv:
+        separator = argv.index('--')
+        argv, main_args = argv[:separator], argv[separator + 1:]
+    
+    parser = argparse.ArgumentParser(description='Сквозной замер производительности парсера на тестовом сервере')
+    add_documentation_arguments(parser)
+    parser.add_argument('--limit', type=int, help='Передать --limit в main.py')
+    parser.add_argument('--workdir', help='Каталог запуска main.py (по умолчанию - временный)')
+    parser.add_argument('--json', help='Сохранить результат в JSON-файл')
+    args = parser.parse_args(argv)
+    if args.limit:
+        main_args = ['--limit', str(args.limit)] + main_args
+    
+    result = run_benchmark(args, main_args)
+    
+    print()
+    print(f"Код завершения main.py: {result['exit_code']}")
+    print(f"Сохранено страниц: {result['pages_saved']} из {result['pages_expected']}")
+    print(f"Время: {result['seconds']} с, {result['pages_per_second']} стр/с")
+    if 'cpu_user_seconds' in result:
+        print(f"Процессорное время: user {result['cpu_user_seconds']} с, system {result['cpu_system_seconds']} с")
+        print(f"Пиковая память крупнейшего процесса: {result['max_child_rss_mb']} МБ")
+    if 'peak_tree_rss_mb' in result:
+        print(f"Пиковая память всех процессов (main.py, chromedriver, Chrome): {result['peak_tree_rss_mb']} МБ")
+    print(f"Запросы к серверу: {result['server_requests']}, передано {result['server_bytes']} байт")
+    print(f"Журнал main.py: {result['log']}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    
+    if result['exit_code'] != 0:
+        sys.exit(result['exit_code'])
+
+if __name__ == '__main__':
+    main()
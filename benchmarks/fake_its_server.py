@@ -0,0 +1,333 @@
+"""Локальный тестовый сервер, имитирующий сайт ИТС
+
+Воспроизводит то, на что опирается парсер: форму входа с полями username/password,
+оглавление .tree со свернутыми узлами, страницы с iframe w_metadata_doc_frame и
+изображения, доступные только после авторизации. Размер документации и задержка
+ответов настраиваются.
+
+Запуск:
+    python benchmarks/fake_its_server.py --pages 200 --latency 50
+
+После запуска парсер можно направить на сервер:
+    python main.py --url http://127.0.0.1:8800/db/testdoc --login http://127.0.0.1:8800/login \\
+        --username user --password pass --headless
+"""
+from __future__ import annotations
+
+import argparse
+import secrets
+import struct
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DATABASE = 'testdoc'
+SESSION_COOKIE = 'its_session'
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """Создает PNG заданного размера, заполненный одним цветом"""
+    color = bytes(((seed * 53) % 256, (seed * 97) % 256, (seed * 193) % 256))
+    raw = b''.join(b'\x00' + color * width for _ in range(height))
+    
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
+
+class FakeDocumentation:
+    """Сгенерированная документация: дерево оглавления, тексты страниц и изображения"""
+    
+    def __init__(self, pages: int = 50, depth: int = 3, branching: int = 5, images_per_page: int = 3,
+                 image_size: int = 64, hidden_pages: int = 0, paragraphs: int = 20,
+                 duplicate_entries: int = 0) -> None:
+        self.pages: int = pages
+        self.hidden_pages: int = hidden_pages
+        self.duplicate_entries: int = duplicate_entries
+        self.images_per_page: int = images_per_page
+        self.image_size: int = image_size
+        self.paragraphs: int = paragraphs
+        self.children: Dict[int, List[int]] = {0: []}
+        self._build_tree(depth, branching)
+    
+    def _build_tree(self, depth: int, branching: int) -> None:
+        # Обход в ширину: узлы верхних уровней заполняются первыми
+        pending: deque = deque([(0, -1)])
+        next_id = 1
+        while pending and next_id <= self.pages:
+            parent, level = pending.popleft()
+            if level + 1 >= depth:
+                continue
+            for _ in range(branching):
+                if next_id > self.pages:
+                    break
+                self.children[parent].append(next_id)
+                self.children[next_id] = []
+                pending.append((next_id, level + 1))
+                next_id += 1
+        # Если глубины не хватило, оставшиеся страницы добавляем в корень
+        while next_id <= self.pages:
+            self.children[0].append(next_id)
+            self.children[next_id] = []
+            next_id += 1
+    
+    def render_tree(self, node: int = 0) -> str:
+        items = []
+        for child in self.children[node]:
+            nested = self.children[child]
+            css_class = ' class="collapsed"' if nested else ''
+            item = f'<li{css_class}><span class="expand"></span>'
+            item += f'<a href="/db/{DATABASE}/content/{child}/hdoc">Раздел {child}</a>'
+            if nested:
+                item += f'<ul style="display: none">{self.render_tree(child)}</ul>'
+            items.append(item + '</li>')
+        if node == 0:
+            items.extend(self.render_duplicate_entries())
+        return ''.join(items)
+    
+    def render_duplicate_entries(self) -> List[str]:
+        """Записи оглавления, ведущие на уже существующие документы: закладки с перенаправлением и варианты адреса"""
+        items = []
+        for number in range(1, self.duplicate_entries + 1):
+            page_id = (number - 1) % self.pages + 1
+            if number % 2:
+                href = f'/db/{DATABASE}/bookmark/{page_id}/mark{number}'
+            else:
+                href = f'/db/{DATABASE}/content/{page_id}/hdoc?utm_source=toc#mark{number}'
+            items.append(f'<li><span class="expand"></span><a href="{href}">Закладка {number}</a></li>')
+        return items
+    
+    def render_document(self, page_id: int) -> str:
+        total = self.pages + self.hidden_pages
+        body = [f'<h1>Раздел {page_id}</h1>']
+        for paragraph in range(self.paragraphs):
+            body.append(f'<p onclick="track({paragraph})">Текст раздела {page_id}, абзац {paragraph}. '
+                        'Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>')
+        for image in range(1, self.images_per_page + 1):
+            body.append(f'<p><img class="incomplete" src="img/{page_id}_{image}.png" '
+                        f'style="width: {self.image_size}px; height: {self.image_size}px"></p>')
+        # Ссылки на соседние страницы, в том числе на страницы вне оглавления
+        links = {page_id % total + 1, (page_id * 7) % total + 1}
+        if self.hidden_pages:
+            links.add(self.pages + page_id % self.hidden_pages + 1)
+        for target in sorted(links):
+            body.append(f'<p><a href="/db/{DATABASE}/content/{target}/hdoc#p1">См. раздел {target}</a></p>')
+        body.append('<table><tr><th>Параметр</th><th>Значение</th></tr><tr><td>A</td><td>1</td></tr></table>')
+        body.append(f'<div class="note" style="background-image: url(&quot;/db/{DATABASE}/note.png&quot;)">Примечание</div>')
+        return (
+            '<!DOCTYPE html><html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8">'
+            f'<title>Раздел {page_id}</title><link rel="stylesheet" href="/db/{DATABASE}/style.css">'
+            '<script>function track(n) { console.log(n); }</script></head>'
+            f'<body>{"".join(body)}</body></html>'
+        )
+
+class FakeItsServer(ThreadingHTTPServer):
+    """HTTP-сервер с состоянием: документация, сессии и статистика запросов"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address: Tuple[str, int], documentation: FakeDocumentation, latency: float = 0,
+                 username: str = 'user', password: str = 'pass') -> None:
+        super().__init__(address, _FakeItsRequestHandler)
+        self.documentation: FakeDocumentation = documentation
+        self.latency: float = latency
+        self.username: str = username
+        self.password: str = password
+        self.sessions: set = set()
+        self.stats: Counter = Counter()
+        self.bytes_sent: int = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def record(self, kind: str, size: int) -> None:
+        with self._lock:
+            self.stats[kind] += 1
+            self.bytes_sent += size
+
+class _FakeItsRequestHandler(BaseHTTPRequestHandler):
+
+    server: FakeItsServer
+    head_only: bool = False
+    
+    def _send(self, status: int, body: bytes = b'', content_type: str = 'text/html; charset=utf-8',
+              headers: Optional[Dict[str, str]] = None, kind: str = 'other') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not self.head_only:
+            self.wfile.write(body)
+        self.server.record(kind, len(body))
+    
+    def _authorized(self) -> bool:
+        cookies = self.headers.get('Cookie', '')
+        for part in cookies.split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == SESSION_COOKIE and value in self.server.sessions:
+                return True
+        return False
+    
+    def do_GET(self) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        
+        documentation = self.server.documentation
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        parts = path.split('/')
+        
+        if path == '/login':
+            self._send(200, LOGIN_FORM.encode('utf-8'), kind='login')
+            return
+        if path in ('', '/'):
+            self._send(302, headers={'Location': f'/db/{DATABASE}'})
+            return
+        if not self._authorized():
+            status = 403 if path.endswith('.png') else 302
+            self._send(status, headers={'Location': '/login'}, kind='denied')
+            return
+        
+        if path == f'/db/{DATABASE}':
+            body = TOC_PAGE.format(tree=documentation.render_tree())
+            self._send(200, body.encode('utf-8'), kind='toc')
+        elif path == f'/db/{DATABASE}/style.css':
+            self._send(200, STYLE_CSS.encode('utf-8'), 'text/css', kind='asset')
+        elif path == f'/db/{DATABASE}/fonts.css':
+            self._send(200, FONTS_CSS.encode('utf-8'), 'text/css', kind='asset')
+        elif path == f'/db/{DATABASE}/fonts/doc.woff2':
+            self._send(200, b'wOF2' + bytes(256), 'font/woff2', kind='asset')
+        elif path in (f'/db/{DATABASE}/bg.png', f'/db/{DATABASE}/note.png'):
+            self._send(200, make_png(8, 8, len(path)), 'image/png', kind='asset')
+        elif len(parts) == 6 and parts[3] == 'bookmark' and parts[4].isdigit():
+            # /db/testdoc/bookmark/<id>/<метка> - закладка, перенаправляющая на место в документе
+            self._send(302, headers={'Location': f'/db/{DATABASE}/content/{parts[4]}/hdoc#{parts[5]}'}, kind='redirect')
+        elif len(parts) == 6 and parts[3] == 'content' and parts[4].isdigit():
+            # /db/testdoc/content/<id>/hdoc - страница с документом во фрейме
+            body = DOC_PAGE.format(tree=documentation.render_tree(), src=f'/db/content/{DATABASE}/src/{parts[4]}.htm')
+            self._send(200, body.encode('utf-8'), kind='page')
+        elif path.startswith(f'/db/content/{DATABASE}/src/img/') and path.endswith('.png'):
+            name = parts[-1][:-4]
+            seed = sum(int(number) for number in name.split('_') if number.isdigit())
+            size = documentation.image_size
+            self._send(200, make_png(size, size, seed), 'image/png', kind='image')
+        elif path.startswith(f'/db/content/{DATABASE}/src/') and path.endswith('.htm'):
+            page_id = parts[-1][:-4]
+            total = documentation.pages + documentation.hidden_pages
+            if not page_id.isdigit() or not 1 <= int(page_id) <= total:
+                self._send(404, kind='missing')
+                return
+            self._send(200, documentation.render_document(int(page_id)).encode('utf-8'), kind='document')
+        else:
+            self._send(404, kind='missing')
+    
+    def do_HEAD(self) -> None:
+        self.head_only = True
+        self.do_GET()
+    
+    def do_POST(self) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        
+        if urllib.parse.urlsplit(self.path).path.rstrip('/') != '/login':
+            self._send(404, kind='missing')
+            return
+        
+        length = int(self.headers.get('Content-Length', 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        username = form.get('username', [''])[0]
+        password = form.get('password', [''])[0]
+        if username != self.server.username or password != self.server.password:
+            self._send(401, LOGIN_FORM.encode('utf-8'), kind='login')
+            return
+        
+        token = secrets.token_hex(16)
+        self.server.sessions.add(token)
+        self._send(302, headers={'Location': f'/db/{DATABASE}',
+                                 'Set-Cookie': f'{SESSION_COOKIE}={token}; Path=/'}, kind='login')
+    
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+LOGIN_FORM = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Вход</title></head>
+<body>
+<form method="post" action="/login">
+    <input type="hidden" name="execution" value="e1s1">
+    <input type="text" name="username">
+    <input type="password" name="password">
+    <input type="submit" value="Войти">
+</form>
+</body></html>"""
+
+TOC_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Тестовая документация</title></head>
+<body><div class="tree"><ul>{tree}</ul></div></body></html>"""
+
+DOC_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Тестовая документация</title></head>
+<body>
+<div class="tree"><ul>{tree}</ul></div>
+<iframe id="w_metadata_doc_frame" src="{src}" width="800" height="600"></iframe>
+</body></html>"""
+
+STYLE_CSS = """@import url("fonts.css");
+body { font-family: "Doc Sans", sans-serif; background: url(bg.png) repeat-x; }
+.note { padding-left: 20px; }"""
+
+FONTS_CSS = """@font-face { font-family: "Doc Sans"; src: url('fonts/doc.woff2') format('woff2'); }"""
+
+def start_server(documentation: FakeDocumentation, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0, username: str = 'user', password: str = 'pass') -> FakeItsServer:
+    """Запускает сервер в фоновом потоке (port=0 - любой свободный порт)"""
+    server = FakeItsServer((host, port), documentation, latency, username, password)
+    threading.Thread(target=server.serve_forever, name='fake-its-server', daemon=True).start()
+    return server
+
+def add_documentation_arguments(parser: argparse.ArgumentParser) -> None:
+    """Добавляет параметры размера документации и задержки ответов"""
+    parser.add_argument('--pages', type=int, default=50, help='Количество страниц в оглавлении (по умолчанию 50)')
+    parser.add_argument('--hidden-pages', type=int, default=0, help='Количество страниц, доступных только по ссылкам (по умолчанию 0)')
+    parser.add_argument('--depth', type=int, default=3, help='Глубина дерева оглавления (по умолчанию 3)')
+    parser.add_argument('--branching', type=int, default=5, help='Количество дочерних разделов у узла (по умолчанию 5)')
+    parser.add_argument('--images-per-page', type=int, default=3, help='Количество изображений на странице (по умолчанию 3)')
+    parser.add_argument('--image-size', type=int, default=64, help='Сторона изображения в пикселях (по умолчанию 64)')
+    parser.add_argument('--paragraphs', type=int, default=20, help='Количество абзацев текста на странице (по умолчанию 20)')
+    parser.add_argument('--duplicate-entries', type=int, default=0,
+                        help='Количество записей оглавления, ведущих на уже существующие документы (закладки с перенаправлением и варианты адреса, по умолчанию 0)')
+    parser.add_argument('--latency', type=float, default=0, help='Задержка каждого ответа в миллисекундах (по умолчанию 0)')
+    parser.add_argument('--username', default='user', help='Логин для формы входа (по умолчанию user)')
+    parser.add_argument('--password', default='pass', help='Пароль для формы входа (по умолчанию pass)')
+
+def documentation_from_args(args: argparse.Namespace) -> FakeDocumentation:
+    return FakeDocumentation(args.pages, args.depth, args.branching, args.images_per_page,
+                             args.image_size, args.hidden_pages, args.paragraphs, args.duplicate_entries)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Локальный тестовый сервер, имитирующий сайт ИТС')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес сервера (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8800, help='Порт сервера (по умолчанию 8800)')
+    add_documentation_arguments(parser)
+    args = parser.parse_args()
+    
+    server = FakeItsServer((args.host, args.port), documentation_from_args(args), args.latency / 1000,
+                           args.username, args.password)
+    print(f"Тестовый сервер ИТС: {server.base_url}/db/{DATABASE} (вход: {server.base_url}/login)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Обработано запросов: {dict(server.stats)}")
+
+if __name__ == '__main__':
+    main()
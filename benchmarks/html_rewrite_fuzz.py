@@ -0,0 +1,154 @@
+"""Проверка времени работы правок HTML на злонамеренных и случайных документах
+
+Каждая функция обработки тегов img из main.py прогоняется на наборе
+документов, построенных так, чтобы вызвать откаты регулярных выражений
+(незакрытые теги и кавычки, тысячи атрибутов, длинные пути без расширения),
+для размеров N, 2N и 4N. При линейном времени работы рост в 4 раза дает
+примерно четырехкратное замедление, при квадратичном - шестнадцатикратное.
+Затем функции прогоняются на случайных документах из опасных фрагментов.
+
+Запуск:
+    python benchmarks/html_rewrite_fuzz.py
+    python benchmarks/html_rewrite_fuzz.py --size 400000 --iterations 2000 --json result.json
+
+Код завершения 1, если рост времени превысил --max-growth или документ
+обрабатывался дольше --max-seconds.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+# Документы размера около n символов, на которых регулярные выражения вида
+# <img[^>]*?src="..."[^>]*?width=... откатываются квадратично
+ADVERSARIAL_DOCUMENTS: Dict[str, Callable[[int], str]] = {
+    'незакрытые теги img': lambda n: '<img src="x" ' * (n // 13),
+    'незакрытая кавычка': lambda n: '<img src="' + 'images/a/' * (n // 9),
+    'тысячи атрибутов': lambda n: '<img ' + 'width="1" ' * (n // 10) + '>',
+    'атрибуты без src': lambda n: ('<img ' + 'data-x="y" ' * 200 + 'width="1">') * (n // 2217 + 1),
+    'путь без расширения': lambda n: '<img src="images/' + 'a/' * (n // 2) + '">',
+    'кодированный путь без расширения': lambda n: '<img src="' + 'images/%' * (n // 8) + '">',
+    'пути в тексте': lambda n: 'images/a/b%c.png' * (n // 16),
+    'src без кавычек': lambda n: '<img src=' + 'images/' * (n // 7) + '>',
+    'незакрытые head и meta': lambda n: '<head<meta charset' * (n // 18),
+    'большой документ': lambda n: ('<p>Текст <img class="incomplete" src="http://h/a/b/c.png" width="10" height="20" '
+                                  'style="x"><img src="images/d%20e.gif"></p>\n') * (n // 110 + 1),
+}
+
+# Фрагменты для случайных документов
+FUZZ_TOKENS = [
+    '<img', '<IMG ', '<img ', '<img/', '<head', '<head>', '<meta ', ' src=', ' SRC=', ' width=', ' height=',
+    ' class=', ' data-src=', '"', "'", '=', '>', '/>', '/', ' ', '\n', 'images/', 'img/', '%', '%20',
+    '.png', '.jpg', '.jpeg', '.gif', 'http://h/', 'incomplete', 'charset=', 'http-equiv="Content-Type"',
+    'a', 'b', '1', '<p>', '</p>', '&quot;', '<!--', '-->',
+]
+
+def rewrite_functions(page_dir: str) -> Dict[str, Callable[[str], str]]:
+    return {
+        'prepare_iframe_html': main.prepare_iframe_html,
+        'post_process_html_content': main.post_process_html_content,
+        'clean_img_tags': main.clean_img_tags,
+        'simplify_image_paths_content': lambda content: main.simplify_image_paths_content(content, {'a.png': 'image001.png'}),
+        'size_page_images': lambda content: main.size_page_images(content, page_dir),
+    }
+
+def measure(function: Callable[[str], str], content: str, repeat: int) -> float:
+    """Лучшее время из repeat запусков, в секундах"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(content)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def run_scaling(functions: Dict[str, Callable[[str], str]], size: int, repeat: int) -> List[dict]:
+    results = []
+    for case, build in ADVERSARIAL_DOCUMENTS.items():
+        documents = [build(size * factor) for factor in (1, 2, 4)]
+        for name, function in functions.items():
+            times = [measure(function, document, repeat) for document in documents]
+            # Очень быстрые прогоны дают шумное отношение, снизу время ограничено 10 мс
+            growth = max(times[2], 0.01) / max(times[0], 0.01)
+            results.append({
+                'case': case,
+                'function': name,
+                'chars': [len(document) for document in documents],
+                'seconds': [round(value, 4) for value in times],
+                'growth': round(growth, 2),
+            })
+    return results
+
+def run_fuzz(functions: Dict[str, Callable[[str], str]], iterations: int, length: int, seed: int) -> dict:
+    generator = random.Random(seed)
+    slowest = {'seconds': 0.0}
+    errors = []
+    for iteration in range(iterations):
+        content = ''.join(generator.choice(FUZZ_TOKENS) for _ in range(generator.randint(1, length)))
+        for name, function in functions.items():
+            started = time.perf_counter()
+            try:
+                function(content)
+            except Exception as e:
+                errors.append({'iteration': iteration, 'function': name, 'error': repr(e), 'document': content[:200]})
+                continue
+            elapsed = time.perf_counter() - started
+            if elapsed > slowest['seconds']:
+                slowest = {'seconds': round(elapsed, 4), 'function': name, 'iteration': iteration, 'chars': len(content)}
+    return {'iterations': iterations, 'slowest': slowest, 'errors': errors}
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description='Проверка линейного времени правок тегов img на злонамеренных документах')
+    parser.add_argument('--size', type=int, default=100000, help='Базовый размер злонамеренного документа в символах (по умолчанию 100000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Число запусков для замера, берется лучшее время (по умолчанию 3)')
+    parser.add_argument('--iterations', type=int, default=500, help='Число случайных документов (по умолчанию 500)')
+    parser.add_argument('--fuzz-length', type=int, default=2000, help='Наибольшее число фрагментов случайного документа (по умолчанию 2000)')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора случайных документов (по умолчанию 1)')
+    parser.add_argument('--max-growth', type=float, default=8, help='Наибольший допустимый рост времени при увеличении документа в 4 раза (по умолчанию 8)')
+    parser.add_argument('--max-seconds', type=float, default=2, help='Наибольшее допустимое время обработки одного документа (по умолчанию 2)')
+    parser.add_argument('--json', help='Сохранить результат в JSON-файл')
+    options = parser.parse_args()
+    main.args = argparse.Namespace(verbose=False, headless=True)
+    
+    with tempfile.TemporaryDirectory(prefix='its-fuzz-') as page_dir:
+        functions = rewrite_functions(page_dir)
+        scaling = run_scaling(functions, options.size, options.repeat)
+        fuzz = run_fuzz(functions, options.iterations, options.fuzz_length, options.seed)
+    
+    failures = []
+    print(f"{'Документ':<34} {'Функция':<30} {'N, с':>8} {'4N, с':>8} {'Рост':>6}")
+    for result in scaling:
+        slow = result['growth'] > options.max_growth or result['seconds'][2] > options.max_seconds
+        if slow:
+            failures.append(result)
+        print(f"{result['case']:<34} {result['function']:<30} {result['seconds'][0]:>8.4f} "
+              f"{result['seconds'][2]:>8.4f} {result['growth']:>6.2f}{'  !' if slow else ''}")
+    
+    print()
+    print(f"Случайных документов: {fuzz['iterations']}, ошибок: {len(fuzz['errors'])}")
+    print(f"Самая долгая обработка: {fuzz['slowest']}")
+    for error in fuzz['errors'][:10]:
+        print(f"Ошибка: {error}")
+    if fuzz['slowest']['seconds'] > options.max_seconds:
+        failures.append(fuzz['slowest'])
+    
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump({'scaling': scaling, 'fuzz': fuzz, 'failures': failures}, f, ensure_ascii=False, indent=2)
+    
+    if failures or fuzz['errors']:
+        print(f"\nПревышены ограничения: {len(failures)}, ошибок: {len(fuzz['errors'])}")
+        sys.exit(1)
+    print("\nВремя работы всех правок растет линейно")
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,152 @@
+"""Проверка пиковой памяти парсера на эталонных базах тестового сервера
+
+Для каждой эталонной базы запускает сквозной замер (e2e_throughput) с параметром
+main.py --memory-profile и сравнивает пиковую память Python (tracemalloc), пиковую
+RSS процесса Python и, если задано, процессов браузера с сохраненными базовыми
+значениями. Базовые значения зависят от машины и версий Chrome и Python, поэтому
+создаются на эталонной машине параметром --update-baseline.
+
+Запуск:
+    python benchmarks/memory_regression.py --update-baseline
+    python benchmarks/memory_regression.py --tolerance 0.1 --json result.json
+    python benchmarks/memory_regression.py --databases large-pages -- --transform-workers 2
+
+Аргументы после "--" передаются main.py без изменений. Код завершения 1, если
+пиковая память превысила базовую больше чем на --tolerance (и --slack МБ) или
+main.py завершился с ошибкой.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Dict, List
+
+from e2e_throughput import run_benchmark
+from fake_its_server import add_documentation_arguments
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'memory_baseline.json')
+
+# Эталонные базы: параметры тестового сервера, нагружающие разные этапы сохранения
+REFERENCE_DATABASES: Dict[str, List[str]] = {
+    'many-pages': ['--pages', '200', '--images-per-page', '3', '--paragraphs', '20'],
+    'large-pages': ['--pages', '30', '--images-per-page', '10', '--paragraphs', '3000'],
+    'large-images': ['--pages', '40', '--images-per-page', '30', '--image-size', '512'],
+}
+
+METRICS = {
+    'traced_peak_mb': 'пик памяти Python (tracemalloc)',
+    'python_rss_mb': 'пик RSS процесса Python',
+    'browser_rss_mb': 'пик RSS процессов браузера',
+}
+
+def measure_database(name: str, server_args: List[str], main_args: List[str]) -> dict:
+    parser = argparse.ArgumentParser()
+    add_documentation_arguments(parser)
+    options = parser.parse_args(server_args)
+    options.limit = None
+    options.workdir = tempfile.mkdtemp(prefix=f'its-memory-{name}-')
+    
+    result = run_benchmark(options, ['--memory-profile'] + main_args)
+    measured = {'exit_code': result['exit_code'], 'pages_saved': result['pages_saved'], 'seconds': result['seconds']}
+    profile_path = os.path.join(options.workdir, 'out', 'memory_profile.json')
+    if not os.path.exists(profile_path):
+        return measured
+    with open(profile_path, 'r', encoding='utf-8') as f:
+        profile = json.load(f)
+    measured['traced_peak_mb'] = round(profile['traced_peak'] / 1048576, 1)
+    measured['python_rss_mb'] = round(profile['rss_peaks']['python'] / 1048576, 1)
+    if 'browser' in profile['rss_peaks']:
+        measured['browser_rss_mb'] = round(profile['rss_peaks']['browser'] / 1048576, 1)
+    measured['stage_peaks_mb'] = {stage: round(size / 1048576, 1) for stage, size in profile['stage_peaks'].items()}
+    return measured
+
+def compare(measured: Dict[str, dict], baseline: Dict[str, dict], metrics: List[str],
+            tolerance: float, slack: float) -> List[dict]:
+    """Возвращает метрики, превысившие базовое значение больше допустимого"""
+    regressions = []
+    for name, values in measured.items():
+        for metric in metrics:
+            base = baseline.get(name, {}).get(metric)
+            if base is None or metric not in values:
+                continue
+            allowed = base * (1 + tolerance) + slack
+            if values[metric] > allowed:
+                regressions.append({'database': name, 'metric': metric, 'baseline': base,
+                                    'measured': values[metric], 'allowed': round(allowed, 1)})
+    return regressions
+
+def main() -> None:
+    argv = sys.argv[1:]
+    main_args: List[str] = []
+    if '--' in argv:
+        separator = argv.index('--')
+        argv, main_args = argv[:separator], argv[separator + 1:]
+    
+    parser = argparse.ArgumentParser(description='Проверка пиковой памяти парсера на эталонных базах тестового сервера')
+    parser.add_argument('--databases', default=','.join(REFERENCE_DATABASES),
+                        help=f"Эталонные базы через запятую (по умолчанию все: {', '.join(REFERENCE_DATABASES)})")
+    parser.add_argument('--metrics', default='traced_peak_mb,python_rss_mb',
+                        help=f"Проверяемые метрики через запятую: {', '.join(METRICS)} (по умолчанию traced_peak_mb,python_rss_mb)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Файл базовых значений (по умолчанию benchmarks/memory_baseline.json)')
+    parser.add_argument('--update-baseline', action='store_true', help='Сохранить результаты замера как базовые значения')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Допустимый рост относительно базового значения (по умолчанию 0.15 - 15%%)')
+    parser.add_argument('--slack', type=float, default=5, help='Допустимый рост в МБ сверх --tolerance, сглаживает шум на малых значениях (по умолчанию 5)')
+    parser.add_argument('--json', help='Сохранить результат в JSON-файл')
+    options = parser.parse_args(argv)
+    
+    names = [name.strip() for name in options.databases.split(',') if name.strip()]
+    unknown = [name for name in names if name not in REFERENCE_DATABASES]
+    if unknown:
+        parser.error(f"неизвестные эталонные базы: {', '.join(unknown)}")
+    metrics = [metric.strip() for metric in options.metrics.split(',') if metric.strip()]
+    
+    measured: Dict[str, dict] = {}
+    for name in names:
+        print(f"\n=== {name}: {' '.join(REFERENCE_DATABASES[name])}")
+        measured[name] = measure_database(name, REFERENCE_DATABASES[name], main_args)
+    
+    failed = [name for name, values in measured.items() if values['exit_code'] != 0 or 'traced_peak_mb' not in values]
+    print()
+    print(f"{'База':<14} {'tracemalloc, МБ':>16} {'RSS Python, МБ':>15} {'RSS браузера, МБ':>17}")
+    for name, values in measured.items():
+        print(f"{name:<14} {values.get('traced_peak_mb', '-'):>16} {values.get('python_rss_mb', '-'):>15} "
+              f"{values.get('browser_rss_mb', '-'):>17}")
+    
+    baseline: Dict[str, dict] = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = [] if options.update_baseline else compare(measured, baseline, metrics, options.tolerance, options.slack)
+    
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump({'measured': measured, 'baseline': baseline, 'regressions': regressions, 'failed': failed},
+                      f, ensure_ascii=False, indent=2)
+    
+    if failed:
+        print(f"\nЗамер не выполнен (ошибка main.py или нет профиля памяти): {', '.join(failed)}")
+        sys.exit(1)
+    if options.update_baseline or not baseline:
+        for name, values in measured.items():
+            baseline[name] = {metric: values[metric] for metric in METRICS if metric in values}
+        with open(options.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовые значения сохранены в {options.baseline}")
+        return
+    
+    missing = [name for name in measured if name not in baseline]
+    if missing:
+        print(f"\nНет базовых значений для: {', '.join(missing)} (обновите их параметром --update-baseline)")
+    for regression in regressions:
+        print(f"{regression['database']}: {METRICS.get(regression['metric'], regression['metric'])} "
+              f"{regression['measured']} МБ при базовом {regression['baseline']} МБ (допустимо до {regression['allowed']} МБ)")
+    if regressions:
+        print(f"\nПиковая память выросла: {len(regressions)} превышений")
+        sys.exit(1)
+    print("\nПиковая память не превышает базовую")
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,152 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import difflib
+import email
+import gzip
+import html
+import inspect
+import json
+import mimetypes
 import os
+import queue
 import re
 import shutil
+import signal
+import sqlite3
+import struct
+import sys
+import threading
 import time
+import tracemalloc
 import urllib.parse
-from typing import List, Optional
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 import hashlib
 
-IMG_TAG_PATTERN = r'<img[^>]*?src="([^"]+)"[^>]*?>'
+# Разбор тегов (iter_tags): в выражениях нет вложенных повторений, время разбора линейно
+TAG_START_PATTERN = r'<{name}(?=[\s/>])'
+TAG_SPACE_PATTERN = r'[\s/]*'
+ATTRIBUTE_NAME_PATTERN = r'[^\s/>=]+|=[^\s/>=]*'
+UNQUOTED_VALUE_PATTERN = r'[^\s>]*'
+IMAGE_EXTENSION_PATTERN = r'\.(?:png|jpg|gif|jpeg)'
+LINK_HREF_PATTERN = r'(<a\b[^>]*?\bhref=")([^"]*)(")'
+LINK_TAG_PATTERN = r'<a\b[^>]*?\bhref="([^"]*)"[^>]*>(.*?)</a>'
+# Ссылки на уже сохраненные страницы, которые не нужно переписывать повторно
+LOCAL_PAGE_LINK_PATTERN = r'^\.\./page_\d{4,}/page\.html(?:#|$)'
+# Фрагменты вида #content:123:hdoc на ИТС - это маршрут к странице, а не якорь
+ROUTE_FRAGMENT_PATTERN = r'^(content|bookmark|browse):'
+# Параметры запроса, не влияющие на документ (метки рекламных кампаний, защита от кэширования)
+IGNORED_QUERY_PARAMETER_PATTERN = r'^(utm_\w+|_|rnd|nocache)$'
+UNRESOLVED_LINKS_FILE = 'unresolved_links.txt'
+PAGE_SIZES_FILE = 'page_sizes.txt'
+DEDUP_REPORT_FILE = 'duplicates.txt'
+DEDUP_INDEX_FILE = 'duplicates.json'
+ASSETS_DIR = 'assets'
+ASSETS_INDEX_FILE = 'index.json'
+# Снятый из браузера HTML до обработки, по нему команда reprocess повторяет обработку
+PAGE_SOURCE_FILE = 'source.html.gz'
+PAGE_MHTML_FILE = 'page.mhtml'
+CAPTURE_MODES = ('dom', 'mhtml')
+BROWSER_BACKENDS = ('selenium', 'playwright')
+LOGIN_MODES = ('auto', 'http', 'browser')
+LINK_ELEMENT_PATTERN = r'<link\b[^>]*>'
+STYLE_BLOCK_PATTERN = r'(<style\b[^>]*>)(.*?)(</style>)'
+STYLE_ATTRIBUTE_PATTERN = r'(\bstyle=")([^"]*)(")'
+# Ссылки в CSS: @import "файл" либо url(...) (в том числе @import url(...)), кавычки в атрибутах экранированы
+CSS_REFERENCE_PATTERN = r'(@import\s+)([\'"])(.*?)\2|(@import\s+)?url\(\s*(&quot;|[\'"]?)(.*?)\5\s*\)'
+LINK_FRONTIER_FILE = '.link_frontier.sqlite'
+CRAWL_JOURNAL_FILE = '.crawl_journal.sqlite'
+# Профиль памяти (--memory-profile): глубина стеков tracemalloc для отнесения памяти к этапам
+# (каждый кадр стека замедляет выделения памяти) и рост отслеживаемой памяти,
+# после которого снимается новый snapshot
+MEMORY_PROFILE_FILE = 'memory_profile.json'
+MEMORY_TRACE_FRAMES = 8
+MEMORY_SNAPSHOT_GROWTH = 0.1
+# Код завершения при остановке по ограничениям запуска: загрузку нужно продолжить с --resume
+BUDGET_EXIT_CODE = 75
+CRAWL_JOURNAL_VERSION = 1
+# Пакет документации в одном файле SQLite (команды pack и serve)
+PACK_FORMAT = 'its-doc-pack'
+PACK_VERSION = 1
+PACK_BATCH_SIZE = 500
+PACK_MMAP_SIZE = 1 << 30
+# Поиск повторов (команда analyze): шинглы из N слов, MinHash-подпись из N значений,
+# разбитая на полосы для LSH, и минимальная длина повторяющегося блока в словах
+DEDUP_SHINGLE_WORDS = 5
+DEDUP_SIGNATURE_SIZE = 64
+DEDUP_BANDS = 16
+DEDUP_MIN_BLOCK_WORDS = 8
+DEDUP_BLOCK_ELEMENTS = ('p', 'li', 'pre', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'dt', 'dd', 'table', 'div', 'caption')
+HISTORY_FORMAT = 'its-doc-history'
+HISTORY_VERSION = 1
+# Файлы, которые при изменении хранятся как разница с предыдущей версией
+HISTORY_DELTA_EXTENSIONS = ('.html', '.txt', '.css', '.json')
+HISTORY_MAX_DELTA_CHAIN = 16
+# Признаки ссылок на страницы документации
+DOC_URL_KEYWORDS = ("content", "bookmark", "browse")
+DISCOVERED_SECTION_TITLE = "Страницы вне оглавления"
+STRUCTURE_FILE_FORMAT = 'its-doc-structure'
+STRUCTURE_FILE_VERSION = 1
+# Очистка HTML документов: элементы, которые удаляются вместе с содержимым
+SANITIZE_DROP_ELEMENTS = ('script', 'noscript', 'iframe', 'frame', 'object', 'embed', 'applet', 'template')
+# Атрибуты, которые сохраняются при строгой очистке
+SANITIZE_KEEP_ATTRIBUTES = (
+    'href', 'src', 'alt', 'title', 'id', 'name', 'class', 'style', 'lang', 'dir',
+    'width', 'height', 'align', 'valign', 'border', 'cellpadding', 'cellspacing',
+    'colspan', 'rowspan', 'span', 'scope', 'headers', 'start', 'type', 'value',
+    'rel', 'media', 'charset', 'target',
+    # Оформление таблиц и устаревшее оформление текста
+    'bgcolor', 'background', 'nowrap', 'color', 'face', 'size', 'frame', 'rules', 'char', 'charoff',
+    'abbr', 'axis', 'summary', 'hspace', 'vspace', 'clear', 'noshade', 'compact', 'reversed',
+)
+# Элементы, внутри которых при строгой очистке сохраняются все атрибуты: геометрия
+# и оформление SVG задаются атрибутами (d, points, viewBox, fill, transform...)
+SANITIZE_KEEP_ALL_ATTRIBUTES_ELEMENTS = ('svg', 'math')
+SANITIZE_LEVELS = ('none', 'basic', 'strict')
+# Элементы, в которых пробелы значимы и не сжимаются
+PRESERVE_WHITESPACE_ELEMENTS = ('pre', 'textarea', 'style')
+# Размер начала файла изображения, по которому определяются его размеры
+IMAGE_HEADER_SIZE = 32
+# Часть длинной страницы: браузер пропускает отрисовку частей за пределами экрана
+PAGE_PART_TAG = '<div class="page-part" id="page-part-{number}" style="content-visibility: auto; contain-intrinsic-size: auto 1000px">'
+VOID_ELEMENTS = (
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'param', 'source', 'track', 'wbr',
+)
 
 # Загрузка переменных окружения из .env файла
 load_dotenv()
 
 import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.remote.webelement import WebElement
-from selenium.common.exceptions import TimeoutException, NoSuchFrameException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Selenium импортируется внутри функций, работающих с браузером, чтобы команды
+# без браузера (reprocess) запускались без его загрузки
+if TYPE_CHECKING:
+    from selenium.webdriver.chrome.webdriver import WebDriver
+    from selenium.webdriver.remote.webelement import WebElement
 
 class DocPage:
     """Класс для хранения информации о странице документации"""
     
+    __slots__ = ('url', 'title', 'level', 'number')
+    
     def __init__(self, url: str, title: str, level: int = 0, number: str = "") -> None:
         self.url: str = url
         self.title: str = title
@@ -35,66 +155,456 @@ class DocPage:
         
     def __str__(self) -> str:
         return f"{self.number} {'  ' * self.level}{self.title}"
+    
+    def to_list(self) -> list:
+        """Компактное представление страницы для файла структуры"""
+        return [self.url, self.title, self.level, self.number]
+    
+    @classmethod
+    def from_list(cls, data: list) -> DocPage:
+        """Восстанавливает страницу из компактного представления"""
+        url, title, level, number = data
+        return cls(url, title, level, number)
 
-def download_image(browser: WebDriver, img_element: WebElement, save_dir: str) -> Optional[str]:
-    """Скачивает изображение и заменяет путь в HTML"""
+def write_file_atomic(path: str, data) -> None:
+    """Записывает файл (str в UTF-8 или bytes) через временный файл и переименование
+    
+    При сбое или прерывании на диске остается либо прежний, либо новый файл целиком
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        src = img_element.get_attribute('src')
-        if not src:
+        if isinstance(data, bytes):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class RunBudget:
+    """Ограничения запуска: продолжительность, объем загруженных данных и частота запросов
+    
+    Запросы к сайту (открытие страниц в браузере, загрузка изображений и ресурсов)
+    перед выполнением проходят через acquire, который равномерно распределяет их
+    во времени. Исчерпание времени или объема проверяется перед каждой страницей
+    (см. exhausted), страницы, уже переданные в обработку, дописываются
+    """
+    
+    def __init__(self, max_duration: float = 0, max_bytes: int = 0, requests_per_minute: float = 0) -> None:
+        self.max_duration: float = max_duration
+        self.max_bytes: int = max_bytes
+        self.interval: float = 60 / requests_per_minute if requests_per_minute > 0 else 0
+        self.started: float = time.monotonic()
+        self.bytes: int = 0
+        self.requests: int = 0
+        self.waited: float = 0
+        self._next_request: float = self.started
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Учитывает запрос и при ограничении частоты ждет его очереди"""
+        with self._lock:
+            self.requests += 1
+            if not self.interval:
+                return
+            now = time.monotonic()
+            slot = max(now, self._next_request)
+            self._next_request = slot + self.interval
+            self.waited += slot - now
+        if slot > now:
+            time.sleep(slot - now)
+    
+    def add_bytes(self, size: int) -> None:
+        with self._lock:
+            self.bytes += size
+    
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+    
+    def exhausted(self) -> Optional[str]:
+        """Причина остановки, если время или объем исчерпаны, иначе None"""
+        if self.max_duration and self.elapsed() >= self.max_duration:
+            return f"истекло время работы ({self.max_duration / 60:g} мин)"
+        if self.max_bytes and self.bytes >= self.max_bytes:
+            return f"получено {self.bytes / 1048576:.1f} МБ при ограничении {self.max_bytes / 1048576:.1f} МБ"
+        return None
+
+class BudgetAdapter(requests.adapters.HTTPAdapter):
+    """Транспорт HTTP-сессии, учитывающий запросы и загруженные байты в RunBudget"""
+    
+    def __init__(self, budget: RunBudget) -> None:
+        super().__init__()
+        self.budget: RunBudget = budget
+    
+    def send(self, request, stream=False, **kwargs):
+        self.budget.acquire()
+        response = super().send(request, stream=stream, **kwargs)
+        if not stream:
+            self.budget.add_bytes(len(response.content))
+        return response
+
+# Ограничения текущего запуска (параметры --max-duration, --max-bytes, --max-requests-per-minute)
+_run_budget: Optional[RunBudget] = None
+
+def parse_size(value: str) -> int:
+    """Разбирает размер в байтах с необязательным суффиксом K, M или G (например, 500M)"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*', value, re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"неверный размер: {value}")
+    return int(float(match.group(1)) * 1024 ** ' KMG'.index(match.group(2).upper() or ' '))
+
+class MemoryProfiler:
+    """Профиль памяти запуска (параметр --memory-profile)
+    
+    tracemalloc отслеживает выделения памяти Python. Когда отслеживаемый объем превышает
+    прежний максимум на MEMORY_SNAPSHOT_GROWTH, снимается snapshot, и память на этот момент
+    распределяется по этапам (stages: имя -> функция этапа) по стекам выделений, поэтому
+    этапы, работающие параллельно в разных потоках, учитываются раздельно. Отдельный поток
+    раз в interval секунд замеряет RSS процесса Python, процессов браузера и остальных
+    дочерних процессов (нужен psutil, без него - только пик RSS Python по getrusage)
+    """
+    
+    def __init__(self, stages: Dict[str, Callable], interval: float = 0.5, top: int = 10) -> None:
+        self.interval: float = interval
+        self.top: int = top
+        # Строки исходного кода функций этапов: (файл, номер строки) -> этап
+        self._stage_lines: Dict[Tuple[str, int], str] = {}
+        for name, function in stages.items():
+            lines, start = inspect.getsourcelines(function)
+            filename = inspect.getsourcefile(function)
+            for lineno in range(start, start + len(lines)):
+                self._stage_lines[(filename, lineno)] = name
+        self.stage_peaks: Dict[str, int] = {name: 0 for name in stages}
+        self.peak_snapshot: Optional[dict] = None
+        self.rss_peaks: Dict[str, int] = {'python': 0, 'browser': 0, 'other': 0}
+        self.samples: int = 0
+        self._snapshot_size: int = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-profiler', daemon=True)
+    
+    def start(self) -> None:
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+        self._thread.start()
+    
+    def _run(self) -> None:
+        process = psutil.Process() if psutil is not None else None
+        while not self._stop.wait(self.interval):
+            self.sample(process)
+    
+    def sample(self, process=None) -> None:
+        """Замеряет RSS процессов и снимает snapshot, если отслеживаемая память выросла"""
+        self.samples += 1
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self._snapshot_size * (1 + MEMORY_SNAPSHOT_GROWTH):
+            self._snapshot_size = current
+            # Память самого профилировщика и загрузчика модулей в отчет не попадает
+            self._analyze(tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+            ]))
+        if process is None:
+            return
+        try:
+            self.rss_peaks['python'] = max(self.rss_peaks['python'], process.memory_info().rss)
+            browser = other = 0
+            for child in process.children(recursive=True):
+                try:
+                    rss = child.memory_info().rss
+                    if 'chrom' in child.name().lower():
+                        browser += rss
+                    else:
+                        other += rss
+                except psutil.Error:
+                    pass
+            self.rss_peaks['browser'] = max(self.rss_peaks['browser'], browser)
+            self.rss_peaks['other'] = max(self.rss_peaks['other'], other)
+        except psutil.Error:
+            pass
+    
+    def _analyze(self, snapshot: tracemalloc.Snapshot) -> None:
+        """Распределяет память snapshot по этапам и запоминает места наибольших выделений"""
+        stages = {name: 0 for name in self.stage_peaks}
+        traced = 0
+        # Выделения с одинаковым стеком сгруппированы, стек каждой группы просматривается один раз
+        for statistic in snapshot.statistics('traceback'):
+            traced += statistic.size
+            for frame in statistic.traceback:
+                stage = self._stage_lines.get((frame.filename, frame.lineno))
+                if stage is not None:
+                    stages[stage] += statistic.size
+                    break
+        for name, size in stages.items():
+            self.stage_peaks[name] = max(self.stage_peaks[name], size)
+        top = snapshot.statistics('lineno')[:self.top]
+        self.peak_snapshot = {
+            'traced': traced,
+            'stages': stages,
+            'top': [(f"{short_source_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}", stat.size, stat.count)
+                    for stat in top],
+        }
+    
+    def stop(self) -> dict:
+        """Останавливает замеры и возвращает отчет (размеры в байтах)"""
+        self._stop.set()
+        self._thread.join()
+        self.sample(psutil.Process() if psutil is not None else None)
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if psutil is None and resource is not None:
+            # ru_maxrss - в КБ на Linux и в байтах на macOS
+            self.rss_peaks['python'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        return {
+            'traced_peak': traced_peak,
+            'rss_peaks': self.rss_peaks if psutil is not None else {'python': self.rss_peaks['python']},
+            'stage_peaks': self.stage_peaks,
+            'peak_snapshot': self.peak_snapshot,
+            'samples': self.samples,
+        }
+
+def short_source_path(filename: str) -> str:
+    """Короткое имя файла исходного кода для отчета: requests/models.py, json/__init__.py, main.py"""
+    parts = filename.replace('\\', '/').split('/')
+    if 'site-packages' in parts:
+        return '/'.join(parts[parts.index('site-packages') + 1:])
+    return '/'.join(parts[-2:]) if parts[-1] == '__init__.py' else parts[-1]
+
+def write_memory_report(report: dict, output_dir: str = 'out') -> None:
+    """Выводит профиль памяти запуска и сохраняет его в output_dir/memory_profile.json"""
+    mb = lambda size: round(size / 1048576, 1)
+    print(f"Пик памяти Python по tracemalloc: {mb(report['traced_peak'])} МБ")
+    rss = report['rss_peaks']
+    print(f"Пик RSS: Python {mb(rss['python'])} МБ" +
+          (f", браузер {mb(rss['browser'])} МБ, другие процессы {mb(rss['other'])} МБ" if 'browser' in rss else ''))
+    print("Память этапов в момент наибольшего выделения: " +
+          ', '.join(f"{name} {mb(size)} МБ" for name, size in report['stage_peaks'].items()))
+    if report['peak_snapshot']:
+        print("Места наибольших выделений памяти Python:")
+        for line, size, count in report['peak_snapshot']['top']:
+            print(f"  {line}: {mb(size)} МБ в {count} блоках")
+    write_file_atomic(os.path.join(output_dir, MEMORY_PROFILE_FILE), json.dumps(report, ensure_ascii=False, indent=1))
+
+# Профиль памяти текущего запуска (параметр --memory-profile)
+_memory_profiler: Optional[MemoryProfiler] = None
+
+# HTTP-сессии, привязанные к браузерам: куки авторизации и соединения переиспользуются
+_http_sessions: Dict[int, requests.Session] = {}
+
+def get_http_session(browser: WebDriver) -> requests.Session:
+    """Возвращает HTTP-сессию браузера, создавая ее с куками браузера при первом обращении"""
+    session = _http_sessions.get(id(browser))
+    if session is None:
+        session = register_http_session(browser, requests.Session())
+        sync_http_session(browser)
+    return session
+
+def register_http_session(browser, session: requests.Session) -> requests.Session:
+    """Привязывает HTTP-сессию к браузеру; запросы сессии учитываются в ограничениях запуска (RunBudget)
+    
+    Через эту функцию проходят все сессии в _http_sessions, в том числе созданные при входе по HTTP
+    """
+    if _run_budget is not None and not isinstance(session.get_adapter('https://'), BudgetAdapter):
+        adapter = BudgetAdapter(_run_budget)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    _http_sessions[id(browser)] = session
+    return session
+
+def sync_http_session(browser: WebDriver) -> None:
+    """Копирует текущие куки браузера в его HTTP-сессию"""
+    session = get_http_session(browser)
+    for cookie in browser.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'])
+
+def close_http_session(browser: WebDriver) -> None:
+    """Закрывает HTTP-сессию браузера"""
+    session = _http_sessions.pop(id(browser), None)
+    if session is not None:
+        session.close()
+
+def transfer_http_session(old_browser: WebDriver, new_browser: WebDriver) -> None:
+    """Передает HTTP-сессию перезапущенному браузеру, чтобы конвейер продолжил работать с ней"""
+    session = _http_sessions.pop(id(old_browser), None)
+    if session is not None:
+        register_http_session(new_browser, session)
+
+_TAG_STARTS: Dict[str, re.Pattern] = {}
+_TAG_SPACE = re.compile(TAG_SPACE_PATTERN)
+_ATTRIBUTE_NAME = re.compile(ATTRIBUTE_NAME_PATTERN)
+_SPACE = re.compile(r'\s*')
+_UNQUOTED_VALUE = re.compile(UNQUOTED_VALUE_PATTERN)
+_IMAGE_EXTENSION = re.compile(IMAGE_EXTENSION_PATTERN)
+
+class HtmlTag:
+    """Открывающий тег, найденный iter_tags: положение в документе и атрибуты в исходном порядке
+    
+    Значения атрибутов хранятся как в разметке, без раскрытия сущностей. Измененный
+    тег (changed) пересобирается методом render, неизмененный остается как был
+    """
+    
+    __slots__ = ('name', 'start', 'end', 'attributes', 'closed', 'changed')
+    
+    def __init__(self, name: str, start: int, end: int, attributes: List[List[Optional[str]]], closed: bool) -> None:
+        self.name: str = name
+        self.start: int = start
+        self.end: int = end
+        # [имя в нижнем регистре, значение или None для атрибута без значения, кавычка]
+        self.attributes: List[List[Optional[str]]] = attributes
+        self.closed: bool = closed
+        self.changed: bool = False
+    
+    def get(self, name: str) -> Optional[str]:
+        for attribute in self.attributes:
+            if attribute[0] == name:
+                return attribute[1] if attribute[1] is not None else ''
+        return None
+    
+    def set(self, name: str, value: str) -> None:
+        """Меняет значение атрибута, отсутствующий атрибут добавляется в конец"""
+        for attribute in self.attributes:
+            if attribute[0] == name:
+                if attribute[1] != value:
+                    attribute[1], attribute[2] = value, '"'
+                    self.changed = True
+                return
+        self.attributes.append([name, value, '"'])
+        self.changed = True
+    
+    def remove(self, *names: str) -> None:
+        attributes = [attribute for attribute in self.attributes if attribute[0] not in names]
+        if len(attributes) != len(self.attributes):
+            self.attributes = attributes
+            self.changed = True
+    
+    def replace(self, attributes: List[Tuple[str, str]]) -> None:
+        """Заменяет все атрибуты тега"""
+        self.attributes = [[name, value, '"'] for name, value in attributes]
+        self.changed = True
+    
+    def render(self) -> str:
+        parts = [f'<{self.name}']
+        for name, value, quote in self.attributes:
+            if value is None:
+                parts.append(f" {name}")
+            else:
+                if quote != "'" and '"' in value:
+                    quote = "'"
+                elif quote != "'":
+                    quote = '"'
+                parts.append(f" {name}={quote}{value}{quote}")
+        parts.append(' />' if self.closed else '>')
+        return ''.join(parts)
+
+def parse_tag(content: str, start: int, name: str) -> Optional[HtmlTag]:
+    """Разбирает открывающий тег name, начинающийся в позиции start, по правилам токенизатора HTML
+    
+    Каждый символ тега просматривается один раз, символ > внутри значения в кавычках
+    тег не завершает. Для незавершенного тега (нет > или закрывающей кавычки до конца
+    документа) возвращает None
+    """
+    length = len(content)
+    position = start + 1 + len(name)
+    attributes: List[List[Optional[str]]] = []
+    closed = False
+    while True:
+        match = _TAG_SPACE.match(content, position)
+        closed = '/' in match.group(0)
+        position = match.end()
+        if position >= length:
             return None
-            
-        # Получаем абсолютный URL изображения
-        if src.startswith('/db/'):
-            base_url = "https://its.1c.ru"
-            src = f"{base_url}{src}"
-        elif src.startswith('/'):
-            base_url = urllib.parse.urlparse(browser.current_url).netloc
-            src = f"https://{base_url}{src}"
-        elif not src.startswith('http'):
-            current_path = urllib.parse.urlparse(browser.current_url).path
-            base_path = os.path.dirname(current_path)
-            src = f"https://its.1c.ru{base_path}/{src}"
-            
+        if content[position] == '>':
+            return HtmlTag(name, start, position + 1, attributes, closed)
+        
+        name_match = _ATTRIBUTE_NAME.match(content, position)
+        attribute_name = name_match.group(0).lower()
+        position = name_match.end()
+        value: Optional[str] = None
+        quote = ''
+        after_name = _SPACE.match(content, position).end()
+        if after_name < length and content[after_name] == '=':
+            position = _SPACE.match(content, after_name + 1).end()
+            if position < length and content[position] in '"\'':
+                quote = content[position]
+                closing = content.find(quote, position + 1)
+                if closing < 0:
+                    return None
+                value = content[position + 1:closing]
+                position = closing + 1
+            else:
+                value_match = _UNQUOTED_VALUE.match(content, position)
+                value = value_match.group(0)
+                position = value_match.end()
+        attributes.append([attribute_name, value, quote])
+
+def iter_tags(content: str, name: str):
+    """Перебирает открывающие теги name документа за один проход"""
+    pattern = _TAG_STARTS.get(name)
+    if pattern is None:
+        pattern = _TAG_STARTS[name] = re.compile(TAG_START_PATTERN.format(name=name), re.IGNORECASE)
+    position = 0
+    while True:
+        match = pattern.search(content, position)
+        if match is None:
+            return
+        tag = parse_tag(content, match.start(), name)
+        if tag is None:
+            # Незавершенный тег поглощает документ до конца, как и в браузере
+            return
+        yield tag
+        position = tag.end
+
+def rewrite_tags(content: str, name: str, rewrite: Callable[[HtmlTag], None]) -> str:
+    """Вызывает rewrite для каждого тега name и пересобирает документ с измененными тегами
+    
+    Время работы линейно по длине документа при любой разметке
+    """
+    parts = []
+    position = 0
+    for tag in iter_tags(content, name):
+        rewrite(tag)
+        if tag.changed:
+            parts.append(content[position:tag.start])
+            parts.append(tag.render())
+            position = tag.end
+    if not parts:
+        return content
+    parts.append(content[position:])
+    return ''.join(parts)
+
+def image_filename(src: str, counters: Dict[str, int]) -> str:
+    """Возвращает локальное имя imageNNN.ext для изображения, нумерация ведется по расширениям"""
+    # Определяем расширение файла из URL
+    file_ext = os.path.splitext(urllib.parse.urlparse(src).path)[1]
+    if not file_ext:
+        file_ext = '.png'  # По умолчанию используем png
+    counters[file_ext] = counters.get(file_ext, 0) + 1
+    return f"image{counters[file_ext]:03d}{file_ext}"
+
+def download_image(session: requests.Session, src: str, save_path: str, referer: str) -> bool:
+    """Скачивает изображение по абсолютному URL в файл save_path"""
+    try:
         # Загружаем изображение
         if args.verbose:
             print(f"Скачиваем изображение: {src}")
-            
-        os.makedirs(save_dir, exist_ok=True)
-        
-        # Определяем расширение файла из URL
-        url_path = urllib.parse.urlparse(src).path
-        file_ext = os.path.splitext(url_path)[1]
-        if not file_ext:
-            file_ext = '.png'  # По умолчанию используем png
-        
-        # Создаем имя файла на основе счетчика изображений в папке
-        existing_images = len([f for f in os.listdir(save_dir) if f.endswith(file_ext)])
-        new_filename = f"image{existing_images+1:03d}{file_ext}"
-        
-        # Путь для сохранения файла
-        save_path = os.path.join(save_dir, new_filename)
-        
-        cookies = {}
-        for cookie in browser.get_cookies():
-            cookies[cookie['name']] = cookie['value']
         
         headers = {
-            'Referer': browser.current_url,
+            'Referer': referer,
         }
         
-        response = requests.get(
+        response = session.get(
             src,
-            cookies=cookies,
             headers=headers,
             allow_redirects=True
         )
         
         if response.status_code == 200:
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
+            write_file_atomic(save_path, response.content)
             if args.verbose:
                 print(f"Сохранено изображение: {save_path}")
-            return new_filename
+            return True
         else:
             if args.verbose:
                 print(f"Ошибка при скачивании {src}: статус {response.status_code}")
@@ -103,118 +613,462 @@ def download_image(browser: WebDriver, img_element: WebElement, save_dir: str) -
     except Exception as e:
         if args.verbose:
             print(f"Ошибка при скачивании изображения {src}: {str(e)}")
-    return None
+    return False
 
-def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
-    """Извлекает структуру документации из оглавления"""
-    print("Извлекаем структуру документации...")
+def rewrite_css_references(css: str, resolve: Callable[[str, bool], Optional[str]]) -> str:
+    """Заменяет ссылки @import и url(...) в CSS
     
-    # Ждем загрузки дерева
-    tree = WebDriverWait(browser, 15).until(
-        EC.presence_of_element_located((By.CLASS_NAME, "tree"))
-    )
+    resolve получает ссылку и признак @import и возвращает новую ссылку или None, чтобы оставить прежнюю
+    """
+    def replace_reference(match: re.Match) -> str:
+        if match.group(1):
+            prefix, quote, reference = match.group(1), match.group(2), match.group(3)
+            new_reference = resolve(reference, True)
+            if new_reference is None:
+                return match.group(0)
+            return f"{prefix}{quote}{new_reference}{quote}"
+        prefix, quote, reference = match.group(4) or '', match.group(5), match.group(6)
+        if not reference:
+            return match.group(0)
+        new_reference = resolve(reference, bool(prefix))
+        if new_reference is None:
+            return match.group(0)
+        return f"{prefix}url({quote}{new_reference}{quote})"
     
-    # Разворачиваем все узлы дерева
-    browser.execute_script("""
-        function expandAllManually(element) {
-            // Находим все свернутые узлы
-            const collapsedNodes = element.querySelectorAll('.collapsed');
-            console.log('Найдено свернутых узлов:', collapsedNodes.length);
-            
-            let changed = 0;
-            
-            // Вместо клика просто изменяем классы напрямую
-            for (let i = 0; i < collapsedNodes.length; i++) {
-                try {
-                    const node = collapsedNodes[i];
-                    
-                    // Прокручиваем к узлу для уверенности
-                    node.scrollIntoView({behavior: 'auto', block: 'center'});
-                    
-                    // Непосредственное изменение классов
-                    node.classList.remove('collapsed');
-                    node.classList.add('expanded');
-                    
-                    // Делаем дочерние элементы видимыми
-                    const childUls = node.querySelectorAll('ul');
-                    childUls.forEach(ul => {
-                        ul.style.display = 'block';
-                        ul.style.visibility = 'visible';
-                    });
-                    
-                    changed++;
-                } catch (e) {
-                    console.error('Ошибка при развертывании узла:', e);
-                }
+    return re.sub(CSS_REFERENCE_PATTERN, replace_reference, css, flags=re.IGNORECASE | re.DOTALL)
+
+def rewrite_html_assets(content: str, resolve: Callable[[str, bool], Optional[str]]) -> str:
+    """Заменяет ссылки на таблицы стилей, шрифты и фоновые изображения в HTML
+    
+    Обрабатываются <link rel="stylesheet">, блоки <style> и атрибуты style.
+    resolve получает ссылку и признак таблицы стилей, см. rewrite_css_references
+    """
+    def replace_link(match: re.Match) -> str:
+        tag = match.group(0)
+        rel = re.search(r'\brel="([^"]*)"', tag, flags=re.IGNORECASE)
+        if not rel or 'stylesheet' not in rel.group(1).lower():
+            return tag
+        href = re.search(r'\bhref="([^"]*)"', tag, flags=re.IGNORECASE)
+        if not href:
+            return tag
+        new_href = resolve(href.group(1), True)
+        if new_href is None:
+            return tag
+        return f'{tag[:href.start(1)]}{new_href}{tag[href.end(1):]}'
+    
+    def replace_css(match: re.Match) -> str:
+        start, css, end = match.groups()
+        return f"{start}{rewrite_css_references(css, resolve)}{end}"
+    
+    content = re.sub(LINK_ELEMENT_PATTERN, replace_link, content, flags=re.IGNORECASE)
+    content = re.sub(STYLE_BLOCK_PATTERN, replace_css, content, flags=re.IGNORECASE | re.DOTALL)
+    content = re.sub(STYLE_ATTRIBUTE_PATTERN, replace_css, content, flags=re.IGNORECASE)
+    return content
+
+def resolve_asset_url(reference: str, base_url: str) -> Optional[str]:
+    """Возвращает абсолютный URL ресурса или None для встроенных данных и якорей"""
+    reference = html.unescape(reference).strip()
+    if not reference or reference.startswith(('#', 'data:', 'about:', 'javascript:')):
+        return None
+    url = urllib.parse.urljoin(base_url, reference)
+    if urllib.parse.urlsplit(url).scheme not in ('http', 'https'):
+        return None
+    return urllib.parse.urldefrag(url)[0]
+
+def collect_html_assets(content: str, base_url: str) -> List[Tuple[str, bool]]:
+    """Возвращает ресурсы HTML (абсолютный URL, признак таблицы стилей) без повторов"""
+    found: Dict[str, bool] = {}
+    
+    def collect(reference: str, stylesheet: bool) -> None:
+        url = resolve_asset_url(reference, base_url)
+        if url is not None:
+            found[url] = found.get(url, False) or stylesheet
+        return None
+    
+    rewrite_html_assets(content, collect)
+    return list(found.items())
+
+def localize_html_assets(content: str, base_url: str, assets: Dict[str, str]) -> str:
+    """Заменяет ссылки на ресурсы локальными путями из assets (URL -> путь)
+    
+    Ресурсы, которые не удалось скачать, получают абсолютные ссылки, чтобы работать хотя бы при наличии сети
+    """
+    def localize(reference: str, stylesheet: bool) -> Optional[str]:
+        url = resolve_asset_url(reference, base_url)
+        if url is None:
+            return None
+        return assets.get(url, url)
+    
+    return rewrite_html_assets(content, localize)
+
+def load_assets_index(output_dir: str = 'out') -> Dict[str, str]:
+    """Загружает assets/index.json, возвращает пути к ресурсам относительно каталогов страниц"""
+    index_path = os.path.join(output_dir, ASSETS_DIR, ASSETS_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, 'r', encoding='utf-8') as f:
+        names = json.load(f)
+    return {url: f"../{ASSETS_DIR}/{name}" for url, name in names.items()}
+
+class AssetStore:
+    """Общий для всех страниц каталог assets/ с таблицами стилей, шрифтами и фоновыми изображениями
+    
+    Каждый URL скачивается один раз за обход. Таблицы стилей сохраняются под именем по хешу URL,
+    ссылки внутри них (@import, url(...)) тоже скачиваются и заменяются локальными.
+    Остальные файлы называются по хешу содержимого, поэтому одинаковые файлы с разных URL
+    хранятся в одном экземпляре. Потокобезопасен.
+    """
+    
+    def __init__(self, assets_dir: str, session: requests.Session) -> None:
+        self.assets_dir: str = assets_dir
+        self.session: requests.Session = session
+        self.downloaded: int = 0
+        self._names: Dict[str, Optional[str]] = {}
+        self._pending: Set[str] = set()
+        self._reserved: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+    
+    @staticmethod
+    def _digest(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+    
+    def fetch(self, url: str, stylesheet: bool = False, referer: Optional[str] = None) -> Optional[str]:
+        """Возвращает имя файла ресурса в каталоге assets/, скачивая его при первом обращении
+        
+        Для ресурса, который не удалось скачать, возвращает None
+        """
+        with self._changed:
+            while True:
+                if url in self._names:
+                    return self._names[url]
+                # Скачанная таблица стилей, которая еще сохраняется, - ее имя уже известно,
+                # поэтому взаимные @import не приводят к ожиданию
+                if url in self._reserved:
+                    return self._reserved[url]
+                if url not in self._pending:
+                    self._pending.add(url)
+                    break
+                # Ресурс уже скачивается в другом потоке
+                self._changed.wait()
+        
+        name = None
+        try:
+            if stylesheet:
+                name = self._save_stylesheet(url, referer)
+            else:
+                data = self._download(url, referer)
+                if data is not None:
+                    extension = os.path.splitext(urllib.parse.urlsplit(url).path)[1].lower()
+                    name = f"{self._digest(data)}{extension}"
+                    self._write(name, data)
+        finally:
+            # Соответствие записывается только для сохраненного файла, страницы с не скачанным
+            # ресурсом сохраняют ссылку на исходный URL
+            with self._changed:
+                self._names[url] = name
+                self._reserved.pop(url, None)
+                self._pending.discard(url)
+                self._changed.notify_all()
+        return name
+    
+    def _download(self, url: str, referer: Optional[str]) -> Optional[bytes]:
+        try:
+            if args.verbose:
+                print(f"Скачиваем ресурс: {url}")
+            response = self.session.get(url, headers={'Referer': referer or url}, allow_redirects=True)
+            if response.status_code == 200:
+                return response.content
+            if args.verbose:
+                print(f"Ошибка при скачивании {url}: статус {response.status_code}")
+        except Exception as e:
+            if args.verbose:
+                print(f"Ошибка при скачивании ресурса {url}: {str(e)}")
+        return None
+    
+    def _write(self, name: str, data: bytes) -> None:
+        path = os.path.join(self.assets_dir, name)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.assets_dir, exist_ok=True)
+        write_file_atomic(path, data)
+        with self._lock:
+            self.downloaded += 1
+    
+    def _save_stylesheet(self, url: str, referer: Optional[str]) -> Optional[str]:
+        data = self._download(url, referer)
+        if data is None:
+            return None
+        css = data.decode('utf-8', errors='replace')
+        name = f"{self._digest(url.encode('utf-8'))}.css"
+        with self._changed:
+            self._reserved[url] = name
+            self._changed.notify_all()
+        
+        def localize(reference: str, is_import: bool) -> Optional[str]:
+            asset_url = resolve_asset_url(reference, url)
+            if asset_url is None:
+                return None
+            # Все ресурсы лежат в одном каталоге с таблицей стилей
+            asset_name = self.fetch(asset_url, is_import or asset_url.lower().endswith('.css'), url)
+            return asset_name or asset_url
+        
+        self._write(name, rewrite_css_references(css, localize).encode('utf-8'))
+        return name
+    
+    def load_index(self) -> None:
+        """Загружает assets/index.json прошлого запуска, чтобы не скачивать ресурсы повторно"""
+        index_path = os.path.join(self.assets_dir, ASSETS_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        with self._lock:
+            for url, name in names.items():
+                if os.path.exists(os.path.join(self.assets_dir, name)):
+                    self._names.setdefault(url, name)
+    
+    def save_index(self) -> None:
+        """Сохраняет соответствие URL ресурсов файлам в assets/index.json для команды reprocess"""
+        with self._lock:
+            names = {url: name for url, name in self._names.items() if name}
+        if not names:
+            return
+        os.makedirs(self.assets_dir, exist_ok=True)
+        write_file_atomic(os.path.join(self.assets_dir, ASSETS_INDEX_FILE), json.dumps(names, ensure_ascii=False, indent=0))
+    
+    def fetch_page_assets(self, content: str, base_url: str, referer: str) -> Dict[str, str]:
+        """Скачивает ресурсы страницы, возвращает пути к ним относительно каталога страницы"""
+        local_paths: Dict[str, str] = {}
+        for url, stylesheet in collect_html_assets(content, base_url):
+            name = self.fetch(url, stylesheet or url.lower().endswith('.css'), referer)
+            if name:
+                local_paths[url] = f"../{ASSETS_DIR}/{name}"
+        return local_paths
+
+# Скрипты разбора оглавления, общие для всех способов управления браузером
+TREE_EXPAND_SCRIPT = """
+    function expandAllManually(element) {
+        // Находим все свернутые узлы
+        const collapsedNodes = element.querySelectorAll('.collapsed');
+        console.log('Найдено свернутых узлов:', collapsedNodes.length);
+        
+        let changed = 0;
+        
+        // Вместо клика просто изменяем классы напрямую
+        for (let i = 0; i < collapsedNodes.length; i++) {
+            try {
+                const node = collapsedNodes[i];
+                
+                // Прокручиваем к узлу для уверенности
+                node.scrollIntoView({behavior: 'auto', block: 'center'});
+                
+                // Непосредственное изменение классов
+                node.classList.remove('collapsed');
+                node.classList.add('expanded');
+                
+                // Делаем дочерние элементы видимыми
+                const childUls = node.querySelectorAll('ul');
+                childUls.forEach(ul => {
+                    ul.style.display = 'block';
+                    ul.style.visibility = 'visible';
+                });
+                
+                changed++;
+            } catch (e) {
+                console.error('Ошибка при развертывании узла:', e);
             }
-            
-            console.log('Изменено узлов:', changed);
-            return changed;
         }
         
-        function waitAndExpandManually() {
-            const tree = document.querySelector('.tree');
-            if (!tree) {
-                console.error('Дерево не найдено!');
-                return;
-            }
-            
-            // Подготовка дерева - делаем все элементы видимыми
-            // Сначала убираем ограничения высоты
-            tree.style.maxHeight = 'none';
-            tree.style.overflow = 'visible';
-            
-            let attempts = 0;
+        console.log('Изменено узлов:', changed);
+        return changed;
+    }
+    
+    function waitAndExpandManually() {
+        const tree = document.querySelector('.tree');
+        if (!tree) {
+            console.error('Дерево не найдено!');
+            return;
+        }
+        
+        // Подготовка дерева - делаем все элементы видимыми
+        // Сначала убираем ограничения высоты
+        tree.style.maxHeight = 'none';
+        tree.style.overflow = 'visible';
+        
+        let attempts = 0;
+        
+        // Запускаем функцию разворачивания каждые 500мс
+        let interval = setInterval(() => {
+            const count = expandAllManually(tree);
+            console.log('Попытка', attempts, 'изменено:', count);
+            attempts++;
             
-            // Запускаем функцию разворачивания каждые 500мс
-            let interval = setInterval(() => {
-                const count = expandAllManually(tree);
-                console.log('Попытка', attempts, 'изменено:', count);
-                attempts++;
+            // Продолжаем до 15 попыток или пока не останется свернутых узлов
+            if (count === 0 || attempts >= 15) {
+                clearInterval(interval);
                 
-                // Продолжаем до 15 попыток или пока не останется свернутых узлов
-                if (count === 0 || attempts >= 15) {
-                    clearInterval(interval);
-                    
-                    // Финальный проход по всем элементам дерева
-                    // Показываем все ul элементы
-                    const allULs = tree.querySelectorAll('ul');
-                    allULs.forEach(ul => {
-                        ul.style.display = 'block';
-                        ul.style.visibility = 'visible';
-                    });
+                // Финальный проход по всем элементам дерева
+                // Показываем все ul элементы
+                const allULs = tree.querySelectorAll('ul');
+                allULs.forEach(ul => {
+                    ul.style.display = 'block';
+                    ul.style.visibility = 'visible';
+                });
+                
+                // Показываем все li элементы
+                const allLIs = tree.querySelectorAll('li');
+                allLIs.forEach(li => {
+                    li.style.visibility = 'visible';
+                    li.style.display = 'block';
                     
-                    // Показываем все li элементы
-                    const allLIs = tree.querySelectorAll('li');
-                    allLIs.forEach(li => {
-                        li.style.visibility = 'visible';
-                        li.style.display = 'block';
-                        
-                        // Иногда в li есть скрытые div с контентом
-                        const divs = li.querySelectorAll('div');
-                        divs.forEach(div => {
-                            div.style.display = 'block';
-                            div.style.visibility = 'visible';
-                        });
+                    // Иногда в li есть скрытые div с контентом
+                    const divs = li.querySelectorAll('div');
+                    divs.forEach(div => {
+                        div.style.display = 'block';
+                        div.style.visibility = 'visible';
                     });
+                });
+                
+                // Удаляем все обработчики событий на кнопках expand
+                // (чтобы предотвратить случайное сворачивание)
+                const expandButtons = tree.querySelectorAll('.expand');
+                expandButtons.forEach(button => {
+                    const clone = button.cloneNode(true);
+                    if (button.parentNode) {
+                        button.parentNode.replaceChild(clone, button);
+                    }
+                });
+                
+                console.log('Финальная обработка дерева завершена');
+            }
+        }, 500);
+    }
+    
+    waitAndExpandManually();
+"""
+
+TREE_LINKS_SCRIPT = """
+    function getAllLinksAndTexts() {
+        // Получаем все ссылки из DOM
+        const allLinks = Array.from(document.querySelectorAll('.tree a'));
+        
+        // Фильтруем и преобразуем
+        return allLinks
+            .filter(link => link.href && link.textContent.trim())
+            .map(link => {
+                // Определяем уровень вложенности на основе позиции в DOM
+                let level = 0;
+                let parent = link.parentElement;
+                
+                // Точнее определяем уровень вложенности
+                while (parent && parent.tagName !== 'BODY' && parent.className !== 'tree') {
+                    if (parent.tagName === 'UL') level++;
+                    parent = parent.parentElement;
+                }
+                
+                // Дополнительно проверяем количество родительских ul до элемента tree
+                const countParentULs = (elem) => {
+                    let count = 0;
+                    let current = elem;
                     
-                    // Удаляем все обработчики событий на кнопках expand
-                    // (чтобы предотвратить случайное сворачивание)
-                    const expandButtons = tree.querySelectorAll('.expand');
-                    expandButtons.forEach(button => {
-                        const clone = button.cloneNode(true);
-                        if (button.parentNode) {
-                            button.parentNode.replaceChild(clone, button);
-                        }
-                    });
+                    while (current && !current.classList.contains('tree')) {
+                        if (current.tagName === 'UL') count++;
+                        current = current.parentElement;
+                    }
                     
-                    console.log('Финальная обработка дерева завершена');
-                }
-            }, 500);
-        }
-        
-        waitAndExpandManually();
-    """)
+                    return count;
+                };
+                
+                const ulCount = countParentULs(link);
+                
+                // Корректируем уровень на основе нескольких признаков
+                // 1. Глубина вложенности ul
+                // 2. Отступ элемента (если доступен)
+                const computedStyle = window.getComputedStyle(link);
+                const paddingLeft = parseInt(computedStyle.paddingLeft) || 
+                                  parseInt(computedStyle.marginLeft) || 0;
+                
+                // Если есть большой отступ, учитываем его при определении уровня
+                const paddingLevel = Math.floor(paddingLeft / 20);
+                
+                // Выбираем наиболее правдоподобное значение уровня
+                const estimatedLevel = Math.max(level, ulCount, paddingLevel);
+                
+                // Проверяем, есть ли у ссылки особые классы, указывающие на уровень
+                const hasLevelClass = (link) => {
+                    for (let i = 0; i <= 10; i++) {
+                        if (link.classList.contains(`level-${i}`)) return i;
+                    }
+                    return -1;
+                };
+                
+                const classLevel = hasLevelClass(link);
+                if (classLevel >= 0) level = classLevel;
+                
+                return {
+                    url: link.href,
+                    title: link.textContent.trim(),
+                    level: estimatedLevel, 
+                    originalLevel: level,
+                    ulCount: ulCount,
+                    paddingLevel: paddingLevel
+                };
+            });
+    }
+    
+    return getAllLinksAndTexts();
+"""
+
+def doc_pages_from_tree_links(items: List[dict], processed_urls: set) -> List[DocPage]:
+    """Формирует страницы из ссылок, собранных скриптом TREE_LINKS_SCRIPT, нумеруя разделы в порядке дерева
+    
+    Ссылки из processed_urls пропускаются, добавленные страницы дописываются в processed_urls
+    """
+    pages: List[DocPage] = []
+    item_index = [0] * 10  # Поддерживаем счетчики для каждого уровня (до 10 уровней глубины)
+    
+    for item in items:
+        try:
+            url = item.get('url')
+            title = item.get('title')
+            level = item.get('level', 0)
+            
+            if url and title and url not in processed_urls and any(keyword in url for keyword in DOC_URL_KEYWORDS):
+                item_index[level] += 1
+                # Сбрасываем счетчики для всех более глубоких уровней
+                for i in range(level + 1, len(item_index)):
+                    item_index[i] = 0
+                
+                # Формируем номер раздела
+                section_number = '.'.join(str(num) for num in item_index[:level + 1] if num > 0) + '.'
+                
+                page = DocPage(url, title, level, section_number)
+                pages.append(page)
+                processed_urls.add(url)
+                if args.verbose:
+                    print(f"Добавлена страница через JS: {page}")
+        except Exception as e:
+            if args.verbose:
+                print(f"Ошибка при обработке JS результата: {str(e)}")
+    
+    return pages
+
+def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
+    """Извлекает структуру документации из оглавления"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    
+    print("Извлекаем структуру документации...")
+    
+    # Ждем загрузки дерева
+    tree = WebDriverWait(browser, 15).until(
+        EC.presence_of_element_located((By.CLASS_NAME, "tree"))
+    )
+    
+    # Разворачиваем все узлы дерева
+    browser.execute_script(TREE_EXPAND_SCRIPT)
     
     # Увеличиваем время ожидания для разворачивания сложного дерева
     time.sleep(10)
@@ -308,108 +1162,12 @@ def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
         if level == 0:
             try:
                 # Запускаем JavaScript для извлечения всех ссылок независимо от структуры DOM
-                js_results = browser.execute_script("""
-                    function getAllLinksAndTexts() {
-                        // Получаем все ссылки из DOM
-                        const allLinks = Array.from(document.querySelectorAll('.tree a'));
-                        
-                        // Фильтруем и преобразуем
-                        return allLinks
-                            .filter(link => link.href && link.textContent.trim())
-                            .map(link => {
-                                // Определяем уровень вложенности на основе позиции в DOM
-                                let level = 0;
-                                let parent = link.parentElement;
-                                
-                                // Точнее определяем уровень вложенности
-                                while (parent && parent.tagName !== 'BODY' && parent.className !== 'tree') {
-                                    if (parent.tagName === 'UL') level++;
-                                    parent = parent.parentElement;
-                                }
-                                
-                                // Дополнительно проверяем количество родительских ul до элемента tree
-                                const countParentULs = (elem) => {
-                                    let count = 0;
-                                    let current = elem;
-                                    
-                                    while (current && !current.classList.contains('tree')) {
-                                        if (current.tagName === 'UL') count++;
-                                        current = current.parentElement;
-                                    }
-                                    
-                                    return count;
-                                };
-                                
-                                const ulCount = countParentULs(link);
-                                
-                                // Корректируем уровень на основе нескольких признаков
-                                // 1. Глубина вложенности ul
-                                // 2. Отступ элемента (если доступен)
-                                const computedStyle = window.getComputedStyle(link);
-                                const paddingLeft = parseInt(computedStyle.paddingLeft) || 
-                                                  parseInt(computedStyle.marginLeft) || 0;
-                                
-                                // Если есть большой отступ, учитываем его при определении уровня
-                                const paddingLevel = Math.floor(paddingLeft / 20);
-                                
-                                // Выбираем наиболее правдоподобное значение уровня
-                                const estimatedLevel = Math.max(level, ulCount, paddingLevel);
-                                
-                                // Проверяем, есть ли у ссылки особые классы, указывающие на уровень
-                                const hasLevelClass = (link) => {
-                                    for (let i = 0; i <= 10; i++) {
-                                        if (link.classList.contains(`level-${i}`)) return i;
-                                    }
-                                    return -1;
-                                };
-                                
-                                const classLevel = hasLevelClass(link);
-                                if (classLevel >= 0) level = classLevel;
-                                
-                                return {
-                                    url: link.href,
-                                    title: link.textContent.trim(),
-                                    level: estimatedLevel, 
-                                    originalLevel: level,
-                                    ulCount: ulCount,
-                                    paddingLevel: paddingLevel
-                                };
-                            });
-                    }
-                    
-                    return getAllLinksAndTexts();
-                """)
+                js_results = browser.execute_script(TREE_LINKS_SCRIPT)
                 
                 # Преобразуем результаты из JavaScript в объекты DocPage
                 if js_results and len(js_results) > 0 and args.verbose:
                     print(f"JavaScript метод нашел {len(js_results)} ссылок")
-                    
-                    # Обрабатываем каждую ссылку
-                    item_index = [0] * 10  # Поддерживаем счетчики для каждого уровня (до 10 уровней глубины)
-                    
-                    for item in js_results:
-                        try:
-                            url = item.get('url')
-                            title = item.get('title')
-                            level = item.get('level', 0)
-                            
-                            if url and title and url not in processed_urls and any(keyword in url for keyword in ["content", "bookmark", "browse"]):
-                                item_index[level] += 1
-                                # Сбрасываем счетчики для всех более глубоких уровней
-                                for i in range(level + 1, len(item_index)):
-                                    item_index[i] = 0
-                                
-                                # Формируем номер раздела
-                                section_number = '.'.join(str(num) for num in item_index[:level + 1] if num > 0) + '.'
-                                
-                                page = DocPage(url, title, level, section_number)
-                                pages.append(page)
-                                processed_urls.add(url)
-                                if args.verbose:
-                                    print(f"Добавлена страница через JS: {page}")
-                        except Exception as e:
-                            if args.verbose:
-                                print(f"Ошибка при обработке JS результата: {str(e)}")
+                    pages.extend(doc_pages_from_tree_links(js_results, processed_urls))
             
             except Exception as e:
                 if args.verbose:
@@ -496,7 +1254,7 @@ def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
                 if not url or not title or url in processed_urls:
                     continue
                 
-                if any(keyword in url for keyword in ["content", "bookmark", "browse"]):
+                if any(keyword in url for keyword in DOC_URL_KEYWORDS):
                     item_index += 1
                     section_number = get_section_number(level, item_index)
                     page = DocPage(url, title, level, section_number)
@@ -530,77 +1288,7 @@ def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
                 print("Стандартный обход дал мало результатов, пробуем JavaScript метод")
                 
             # Запускаем JavaScript для извлечения всех ссылок независимо от структуры DOM
-            js_results = browser.execute_script("""
-                function getAllLinksAndTexts() {
-                    // Получаем все ссылки из DOM
-                    const allLinks = Array.from(document.querySelectorAll('.tree a'));
-                    
-                    // Фильтруем и преобразуем
-                    return allLinks
-                        .filter(link => link.href && link.textContent.trim())
-                        .map(link => {
-                            // Определяем уровень вложенности на основе позиции в DOM
-                            let level = 0;
-                            let parent = link.parentElement;
-                            
-                            // Точнее определяем уровень вложенности
-                            while (parent && parent.tagName !== 'BODY' && parent.className !== 'tree') {
-                                if (parent.tagName === 'UL') level++;
-                                parent = parent.parentElement;
-                            }
-                            
-                            // Дополнительно проверяем количество родительских ul до элемента tree
-                            const countParentULs = (elem) => {
-                                let count = 0;
-                                let current = elem;
-                                
-                                while (current && !current.classList.contains('tree')) {
-                                    if (current.tagName === 'UL') count++;
-                                    current = current.parentElement;
-                                }
-                                
-                                return count;
-                            };
-                            
-                            const ulCount = countParentULs(link);
-                            
-                            // Корректируем уровень на основе нескольких признаков
-                            // 1. Глубина вложенности ul
-                            // 2. Отступ элемента (если доступен)
-                            const computedStyle = window.getComputedStyle(link);
-                            const paddingLeft = parseInt(computedStyle.paddingLeft) || 
-                                              parseInt(computedStyle.marginLeft) || 0;
-                            
-                            // Если есть большой отступ, учитываем его при определении уровня
-                            const paddingLevel = Math.floor(paddingLeft / 20);
-                            
-                            // Выбираем наиболее правдоподобное значение уровня
-                            const estimatedLevel = Math.max(level, ulCount, paddingLevel);
-                            
-                            // Проверяем, есть ли у ссылки особые классы, указывающие на уровень
-                            const hasLevelClass = (link) => {
-                                for (let i = 0; i <= 10; i++) {
-                                    if (link.classList.contains(`level-${i}`)) return i;
-                                }
-                                return -1;
-                            };
-                            
-                            const classLevel = hasLevelClass(link);
-                            if (classLevel >= 0) level = classLevel;
-                            
-                            return {
-                                url: link.href,
-                                title: link.textContent.trim(),
-                                level: estimatedLevel, 
-                                originalLevel: level,
-                                ulCount: ulCount,
-                                paddingLevel: paddingLevel
-                            };
-                        });
-                }
-                
-                return getAllLinksAndTexts();
-            """)
+            js_results = browser.execute_script(TREE_LINKS_SCRIPT)
             
             if js_results and len(js_results) > 0 and args.verbose and len(pages) < len(js_results):
                 print(f"JavaScript извлек {len(js_results)} ссылок")
@@ -642,7 +1330,7 @@ def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
                     if not url or not title or url in processed_urls:
                         continue
                         
-                    if any(keyword in url for keyword in ["content", "bookmark", "browse"]):
+                    if any(keyword in url for keyword in DOC_URL_KEYWORDS):
                         # Если мы переходим на новый уровень или возвращаемся на предыдущий
                         # Сбрасываем счетчики для всех более глубоких уровней
                         if level <= max_level:
@@ -707,7 +1395,7 @@ def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
                     if not url or not title or url in processed_urls:
                         continue
                         
-                    if any(keyword in url for keyword in ["content", "bookmark", "browse"]):
+                    if any(keyword in url for keyword in DOC_URL_KEYWORDS):
                         page = DocPage(url, title, 0, f"{len(pages)+1}.")
                         pages.append(page)
                         processed_urls.add(url)
@@ -724,16 +1412,174 @@ def extract_doc_structure(browser: WebDriver) -> List[DocPage]:
     
     return pages
 
-def _generate_html_styles() -> str:
-    """Возвращает CSS стили для оглавления"""
-    return """
-        body { 
-            font-family: Arial, sans-serif; 
-            margin: 20px;
-            line-height: 1.6;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
+def save_structure(pages: List[DocPage], path: str, source_url: str) -> None:
+    """Сохраняет структуру документации в компактный версионированный файл (.gz - со сжатием)"""
+    data = {
+        'format': STRUCTURE_FILE_FORMAT,
+        'version': STRUCTURE_FILE_VERSION,
+        'created': time.time(),
+        'url': source_url,
+        'pages': [page.to_list() for page in pages],
+    }
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if path.endswith('.gz'):
+        payload = gzip.compress(payload)
+    
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    # Пишем во временный файл и подменяем, чтобы параллельные запуски не увидели половину файла
+    write_file_atomic(path, payload)
+    print(f"Структура документации сохранена в {path}")
+
+def load_structure(path: str, source_url: str, ttl_hours: float = 0) -> Optional[List[DocPage]]:
+    """Загружает структуру документации из файла
+    
+    Возвращает None, если файла нет, он устарел (ttl_hours > 0), относится к другой
+    документации, имеет неподдерживаемую версию или поврежден
+    """
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        with open(path, 'rb') as f:
+            payload = f.read()
+        if path.endswith('.gz'):
+            payload = gzip.decompress(payload)
+        data = json.loads(payload.decode('utf-8'))
+    except (OSError, ValueError) as e:
+        print(f"Не удалось прочитать файл структуры {path}: {str(e)}")
+        return None
+    
+    if not isinstance(data, dict) or data.get('format') != STRUCTURE_FILE_FORMAT or data.get('version') != STRUCTURE_FILE_VERSION:
+        print(f"Файл структуры {path} имеет неподдерживаемый формат, структура будет извлечена заново")
+        return None
+    if not isinstance(data.get('url'), str) or normalize_url(data['url']) != normalize_url(source_url):
+        print(f"Файл структуры {path} относится к другой документации ({data.get('url')})")
+        return None
+    
+    # Поврежденный или отредактированный вручную файл считается отсутствующим
+    try:
+        age_hours = (time.time() - data.get('created', 0)) / 3600
+        pages = [DocPage.from_list(item) for item in data['pages']]
+        for page in pages:
+            if not (isinstance(page.url, str) and isinstance(page.title, str)
+                    and isinstance(page.level, int) and isinstance(page.number, str)):
+                raise ValueError(f"некорректная запись страницы {page.to_list()!r}")
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Файл структуры {path} поврежден ({str(e)}), структура будет извлечена заново")
+        return None
+    if ttl_hours > 0 and age_hours > ttl_hours:
+        print(f"Файл структуры {path} устарел ({age_hours:.1f} ч.), структура будет извлечена заново")
+        return None
+    
+    print(f"Структура документации загружена из {path}: {len(pages)} страниц")
+    return pages
+
+def get_doc_structure(browser: WebDriver, url: str, structure_file: Optional[str] = None,
+                      structure_ttl: float = 0) -> List[DocPage]:
+    """Возвращает структуру документации из файла кэша или извлекает ее из оглавления на сайте"""
+    pages = None
+    if structure_file:
+        pages = load_structure(structure_file, url, structure_ttl)
+    
+    if pages is None:
+        print("Загрузка документации...")
+        if isinstance(browser, PlaywrightBrowser):
+            pages = browser.extract_doc_structure(url)
+        else:
+            browser.get(url)
+            time.sleep(2)
+            
+            pages = extract_doc_structure(browser)
+        if structure_file and pages:
+            save_structure(pages, structure_file, url)
+    
+    return pages
+
+class SectionIndex:
+    """Индекс страниц оглавления по номеру раздела (DocPage.number) для выбора поддеревьев
+    
+    Страницы раздела идут в оглавлении подряд за самим разделом, пока уровень вложенности
+    больше уровня раздела, поэтому поддерево находится по словарю номеров без перебора всех страниц
+    """
+    
+    def __init__(self, pages: List[DocPage]) -> None:
+        self.pages: List[DocPage] = pages
+        self._positions: Dict[str, int] = {}
+        for position, page in enumerate(pages):
+            self._positions.setdefault(page.number, position)
+    
+    @staticmethod
+    def normalize(number: str) -> str:
+        return number.strip().rstrip('.') + '.'
+    
+    def position(self, number: str) -> Optional[int]:
+        """Позиция раздела в списке страниц (с 0) или None, если раздела нет"""
+        return self._positions.get(self.normalize(number))
+    
+    def subtree(self, number: str) -> List[int]:
+        """Позиции страниц раздела вместе с вложенными разделами"""
+        start = self.position(number)
+        if start is None:
+            # Раздела нет в оглавлении отдельной записью - берем все страницы с таким префиксом номера
+            prefix = self.normalize(number)
+            return [position for position, page in enumerate(self.pages) if page.number.startswith(prefix)]
+        level = self.pages[start].level
+        end = start + 1
+        while end < len(self.pages) and self.pages[end].level > level:
+            end += 1
+        return list(range(start, end))
+
+def select_pages(pages: List[DocPage], sections: Optional[List[str]] = None, pattern: Optional[str] = None,
+                 max_depth: Optional[int] = None, from_section: Optional[str] = None) -> Optional[Set[int]]:
+    """Выбирает страницы оглавления для загрузки, возвращает их номера (с 1) или None, если отбор не задан
+    
+    sections - номера разделов, выбираются вместе с вложенными; pattern - регулярное выражение
+    для заголовка или URL; max_depth - наибольшее число уровней оглавления; from_section - раздел,
+    начиная с которого (включительно) берутся все следующие страницы. Условия объединяются через И
+    """
+    if not sections and pattern is None and max_depth is None and from_section is None:
+        return None
+    
+    index = SectionIndex(pages)
+    selected = set(range(len(pages)))
+    if sections:
+        in_sections = set()
+        for number in sections:
+            positions = index.subtree(number)
+            if not positions:
+                print(f"Раздел {number} не найден в оглавлении")
+            in_sections.update(positions)
+        selected &= in_sections
+    if from_section is not None:
+        start = index.position(from_section)
+        if start is None:
+            # Без отдельной записи раздела начинаем с первой страницы с таким префиксом номера
+            start = next(iter(index.subtree(from_section)), None)
+        if start is None:
+            print(f"Раздел {from_section} не найден в оглавлении")
+            start = len(pages)
+        selected = {position for position in selected if position >= start}
+    if max_depth is not None:
+        selected = {position for position in selected if pages[position].level < max_depth}
+    if pattern is not None:
+        expression = re.compile(pattern, re.IGNORECASE)
+        selected = {position for position in selected
+                    if expression.search(pages[position].title) or expression.search(pages[position].url)}
+    return {position + 1 for position in selected}
+
+def _generate_html_styles() -> str:
+    """Возвращает CSS стили для оглавления"""
+    return """
+        body { 
+            font-family: Arial, sans-serif; 
+            margin: 20px;
+            line-height: 1.6;
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 20px;
         }
         /* Отображать метаданные всегда, если включен режим */
         body.show-metadata .metadata {
@@ -934,15 +1780,15 @@ def _generate_html_styles() -> str:
         }
     """
 
-def _generate_toc_entry(page: DocPage, index: int) -> str:
-    """Генерирует HTML для одного элемента оглавления"""
+def _generate_toc_entry(page: DocPage, href: str) -> str:
+    """Генерирует HTML для одного элемента оглавления со ссылкой href на локальную копию"""
     # Добавляем больше отступов для корректного отображения уровней
     indentation = page.level * 30  # 30px на каждый уровень вложенности
     
     return f"""
         <div class="toc-entry level-{page.level}" style="margin-left: {indentation}px;">
             <div class="entry-row">
-                <a class="title" href="page_{index:04d}/page.html" title="{page.title}">{page.title}</a>
+                <a class="title" href="{href}" title="{page.title}">{page.title}</a>
                 <div class="actions">
                     <a href="{page.url}" target="_blank" class="original-link" title="Открыть оригинальную страницу">
                         <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
@@ -960,12 +1806,15 @@ def _generate_toc_entry(page: DocPage, index: int) -> str:
             </div>
         </div>"""
 
-def save_all_pages(browser: webdriver.WebDriver, pages: List[DocPage], limit: int = None) -> None:
-    """Сохраняет все страницы документации"""
-    if limit is not None:
-        pages = pages[:limit]
-        print(f"Ограничение: будет сохранено {len(pages)} страниц")
+def write_toc(pages: List[DocPage], output_dir: str = 'out',
+              targets: Optional[Dict[int, Tuple[int, str]]] = None,
+              available: Optional[Set[int]] = None) -> None:
+    """Сохраняет оглавление index.html со ссылками на страницы page_NNNN
     
+    targets (см. document_targets) задает для записей страницу с документом и якорь в ней,
+    записи без сопоставления ссылаются на собственную страницу. Если задан available,
+    записи, чьих страниц в нем нет (не загружались при выборочной загрузке), ссылаются на сайт
+    """
     # Создаем оглавление в HTML
     toc_html = f"""<!DOCTYPE html>
 <html>
@@ -992,17 +1841,25 @@ def save_all_pages(browser: webdriver.WebDriver, pages: List[DocPage], limit: in
     # Группируем страницы по основным разделам (уровень 0)
     current_level0 = None
     for i, page in enumerate(pages, 1):
-        if page.level == 0:
+        # Страницы, найденные по ссылкам внутри документов, собираем в отдельный раздел
+        is_first_discovered = page.number.startswith('+') and current_level0 != DISCOVERED_SECTION_TITLE
+        if page.level == 0 or is_first_discovered:
             if current_level0 is not None:
                 toc_html += "    </div>\n</div>\n"
             
+            section_title = DISCOVERED_SECTION_TITLE if is_first_discovered else page.title
             section_id = f"section_{i}"
             toc_html += f'<div class="section" id="{section_id}">\n'
-            toc_html += f'    <div class="section-title">{page.title}</div>\n'
+            toc_html += f'    <div class="section-title">{section_title}</div>\n'
             toc_html += '    <div class="section-content">\n'
-            current_level0 = page.title
+            current_level0 = section_title
             
-        toc_html += _generate_toc_entry(page, i)
+        target, anchor = targets.get(i, (i, '')) if targets else (i, '')
+        if available is not None and target not in available:
+            href = html.escape(page.url)
+        else:
+            href = f"page_{target:04d}/page.html" + (f"#{html.escape(anchor)}" if anchor else '')
+        toc_html += _generate_toc_entry(page, href)
     
     if current_level0 is not None:
         toc_html += "    </div>\n</div>\n"
@@ -1089,47 +1946,102 @@ def save_all_pages(browser: webdriver.WebDriver, pages: List[DocPage], limit: in
 </html>"""
     
     # Сохраняем оглавление
-    os.makedirs('out', exist_ok=True)
-    with open(os.path.join('out', 'index.html'), 'w', encoding='utf-8') as f:
-        f.write(toc_html)
+    os.makedirs(output_dir, exist_ok=True)
+    write_file_atomic(os.path.join(output_dir, 'index.html'), toc_html)
+
+class CapturedPage:
+    """Страница, снятая браузером и передаваемая между этапами конвейера"""
     
-    # Сохраняем страницы
-    total = len(pages)
-    for i, page in enumerate(pages, 1):
-        try:
-            if args.verbose:
-                print(f"\nОбработка страницы {i}/{total}")
-                print(f"Заголовок: {page.title}")
-                print(f"Уровень: {page.level}")
-                print(f"URL: {page.url}")
-            else:
-                print(f"Обработка: {i}/{total} - {page.title}")
-            
-            page_dir = os.path.join('out', f"page_{i:04d}")
-            os.makedirs(page_dir, exist_ok=True)
-            
-            with open(os.path.join(page_dir, 'metadata.txt'), 'w', encoding='utf-8') as f:
-                f.write(f"Title: {page.title}\n")
-                f.write(f"Level: {page.level}\n")
-                f.write(f"URL: {page.url}\n")
-            
-            browser.get(page.url)
-            time.sleep(3)
-            save_iframe_content(browser, "w_metadata_doc_frame", output_dir=page_dir)
-            
-            # Упрощаем пути к изображениям
-            if simplify_image_paths(page_dir):
-                if args.verbose:
-                    print(f"Упрощены пути к изображениям для страницы {page.title}")
-            
-        except Exception as e:
-            print(f"Ошибка при сохранении страницы {page.title}")
-            if args.verbose:
-                print(f"Детали: {str(e)}")
+    __slots__ = ('index', 'page', 'page_dir', 'html', 'mhtml', 'document_url', 'referer', 'images', 'assets',
+                 'unresolved', 'sizes', 'error')
+    
+    def __init__(self, index: int, page: DocPage, page_dir: str, html: str, document_url: str,
+                 referer: str, images: List[Tuple[str, str]]) -> None:
+        self.index: int = index
+        self.page: DocPage = page
+        self.page_dir: str = page_dir
+        self.html: Optional[str] = html
+        self.mhtml: Optional[str] = None  # снимок MHTML, который еще нужно распаковать (режим --capture mhtml)
+        self.document_url: str = document_url
+        self.referer: str = referer
+        self.images: List[Tuple[str, str]] = images  # (URL изображения, имя файла в images/)
+        self.assets: Dict[str, str] = {}  # URL ресурса -> путь в общем каталоге assets/
+        self.unresolved: List[str] = []
+        self.sizes: Optional[Tuple[int, int]] = None  # (размер снятого HTML, размер сохраненного) в байтах
+        self.error: Optional[Exception] = None
+
+# Скрипты снятия документа из iframe: сбор адресов изображений и замена их на локальные пути
+IFRAME_IMAGE_SOURCES_SCRIPT = """
+    return Array.prototype.map.call(document.querySelectorAll('img'), function (img) {
+        return img.getAttribute('src') ? img.src : null;
+    });
+"""
+
+IFRAME_IMAGE_PATHS_SCRIPT = """
+    var images = document.querySelectorAll('img');
+    var paths = arguments[0];
+    for (var i = 0; i < images.length && i < paths.length; i++) {
+        var img = images[i];
+        var path = paths[i];
+        if (!path) continue;
+        img.setAttribute('src', path);
+        if (img.hasAttribute('data-src')) {
+            img.setAttribute('data-src', path);
+        }
+        // Удаляем классы, которые могут мешать отображению
+        img.classList.remove('incomplete');
+        // Удаляем лишние стили, оставляя только размеры
+        var style = img.getAttribute('style');
+        if (style) {
+            var sizeStyles = [];
+            if (style.includes('width')) {
+                sizeStyles.push('width: ' + img.width + 'px');
+            }
+            if (style.includes('height')) {
+                sizeStyles.push('height: ' + img.height + 'px');
+            }
+            if (sizeStyles.length > 0) {
+                img.setAttribute('style', sizeStyles.join('; '));
+            } else {
+                img.removeAttribute('style');
+            }
+        }
+    }
+"""
+
+def assign_image_paths(sources: List[Optional[str]]) -> Tuple[List[Optional[str]], Dict[str, str]]:
+    """Назначает локальные имена изображениям, адреса которых собраны скриптом IFRAME_IMAGE_SOURCES_SCRIPT
+    
+    Возвращает пути images/... в порядке изображений (None - изображение без src) и словарь URL -> имя файла
+    """
+    processed_images: Dict[str, str] = {}
+    counters: Dict[str, int] = {}
+    local_paths: List[Optional[str]] = []
+    
+    for src in sources:
+        if not src:
+            local_paths.append(None)
             continue
+        if args.verbose:
+            print(f"Обрабатываем изображение: {src}")
+        
+        # Если такой URL уже обрабатывался, используем существующий путь
+        if src not in processed_images:
+            processed_images[src] = image_filename(src, counters)
+        local_paths.append(f"images/{processed_images[src]}")
+    
+    return local_paths, processed_images
 
-def save_iframe_content(browser, iframe_id, output_dir='out'):
-    """Сохраняем содержимое iframe"""
+def capture_iframe_content(browser: WebDriver, iframe_id: str) -> Tuple[str, str, List[Tuple[str, str]]]:
+    """Снимает HTML документа из iframe, заменив пути к изображениям на локальные
+    
+    Возвращает HTML, URL документа во фрейме и список изображений (URL, имя файла) для загрузки
+    """
+    from selenium.common.exceptions import NoSuchFrameException, TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    
     try:
         WebDriverWait(browser, 15).until(
             EC.frame_to_be_available_and_switch_to_it((By.ID, iframe_id))
@@ -1144,116 +2056,25 @@ def save_iframe_content(browser, iframe_id, output_dir='out'):
             if args.verbose:
                 print("readyState iframe complete")
             
-            images_dir = os.path.join(output_dir, 'images')
-            os.makedirs(images_dir, exist_ok=True)
-            
-            images = browser.find_elements(By.TAG_NAME, "img")
+            document_url = browser.execute_script("return document.URL")
+            # Адреса всех изображений собираются одним вызовом (src - уже абсолютный URL)
+            sources = browser.execute_script(IFRAME_IMAGE_SOURCES_SCRIPT) or []
             if args.verbose:
-                print(f"Найдено изображений: {len(images)}")
+                print(f"Найдено изображений: {len(sources)}")
             
-            # Словарь для отслеживания уже скачанных изображений
-            processed_images = {}
+            # Изображения скачиваются позже на отдельном этапе, здесь только назначаются имена
+            local_paths, processed_images = assign_image_paths(sources)
             
-            for img in images:
-                src = img.get_attribute('src')
-                if args.verbose:
-                    print(f"Обрабатываем изображение: {src}")
-                
-                # Если такой URL уже обрабатывался, используем существующий путь
-                if src in processed_images:
-                    new_src = processed_images[src]
-                    img_path = f"images/{new_src}"
-                    if args.verbose:
-                        print(f"Используем существующий путь: {img_path}")
-                else:
-                    # Загружаем новое изображение
-                    new_src = download_image(browser, img, images_dir)
-                    if new_src:
-                        img_path = f"images/{new_src}"
-                        processed_images[src] = new_src
-                        if args.verbose:
-                            print(f"Обновляем путь на: {img_path}")
-                    elif args.verbose:
-                        print(f"Не удалось скачать изображение: {src}")
-                        continue
-                
-                # Обновляем путь в HTML
-                browser.execute_script("""
-                    arguments[0].setAttribute('src', arguments[1]);
-                    if (arguments[0].hasAttribute('data-src')) {
-                        arguments[0].setAttribute('data-src', arguments[1]);
-                    }
-                    // Удаляем классы, которые могут мешать отображению
-                    arguments[0].classList.remove('incomplete');
-                    // Удаляем лишние стили, оставляя только размеры
-                    var style = arguments[0].getAttribute('style');
-                    if (style) {
-                        var sizeStyles = [];
-                        if (style.includes('width')) {
-                            sizeStyles.push('width: ' + arguments[0].width + 'px');
-                        }
-                        if (style.includes('height')) {
-                            sizeStyles.push('height: ' + arguments[0].height + 'px');
-                        }
-                        if (sizeStyles.length > 0) {
-                            arguments[0].setAttribute('style', sizeStyles.join('; '));
-                        } else {
-                            arguments[0].removeAttribute('style');
-                        }
-                    }
-                """, img, img_path)
+            # Обновляем пути в HTML всех изображений одним вызовом
+            if processed_images:
+                browser.execute_script(IFRAME_IMAGE_PATHS_SCRIPT, local_paths)
             
             # Получаем обновленный HTML-код
             iframe_content = browser.page_source
             
-            # Регулярное выражение для поиска тегов img с атрибутами width и height
-            img_pattern = re.compile(r'<img[^>]*src="images/([^"]+)"[^>]*width="([^"]+)"[^>]*height="([^"]+)"[^>]*>')
-            
-            # Находим все совпадения и заменяем на упрощенный тег
-            for match in img_pattern.finditer(iframe_content):
-                src, width, height = match.groups()
-                old_tag = match.group(0)
-                new_tag = f'<img src="images/{src}" width="{width}" height="{height}" alt="">'
-                iframe_content = iframe_content.replace(old_tag, new_tag)
-            
-            # Заменяем все оставшиеся сложные пути для изображений
-            iframe_content = re.sub(
-                r'src="[^"]*?/([^/"]+\.(png|jpg|gif|jpeg))"', 
-                r'src="images/\1"',
-                iframe_content
-            )
-            
-            # Обновляем или добавляем мета-тег с UTF-8
-            if '<meta charset=' not in iframe_content and '<meta http-equiv="Content-Type"' not in iframe_content:
-                iframe_content = re.sub(
-                    r'<head[^>]*>',
-                    r'<head>\n    <meta charset="utf-8">',
-                    iframe_content
-                )
-            else:
-                # Обновляем существующий мета-тег
-                iframe_content = re.sub(
-                    r'<meta[^>]*charset=[^>]*>',
-                    r'<meta charset="utf-8">',
-                    iframe_content
-                )
-                iframe_content = re.sub(
-                    r'<meta[^>]*Content-Type[^>]*>',
-                    r'<meta charset="utf-8">',
-                    iframe_content
-                )
-            
-            # Сохраняем содержимое в файл в UTF-8
-            output_file = os.path.join(output_dir, 'page.html')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(iframe_content)
-            if args.verbose:
-                print(f"Содержимое iframe сохранено в {output_file}")
-                
-            # Выполняем постобработку HTML для исправления путей к изображениям
-            if post_process_html(output_file):
-                if args.verbose:
-                    print(f"Выполнена постобработка HTML для {output_file}")
+            # Получаем абсолютные URL изображений относительно документа
+            image_urls = [(urllib.parse.urljoin(document_url, src), filename) for src, filename in processed_images.items()]
+            return iframe_content, document_url, image_urls
             
         finally:
             browser.switch_to.default_content()
@@ -1276,263 +2097,2745 @@ def save_iframe_content(browser, iframe_id, output_dir='out'):
             print(f"Детали: {str(e)}")
         raise
 
-def clean_output_directory(directory='out'):
-    """Очищает каталог вывода, если он существует"""
-    if os.path.exists(directory):
-        print(f"Очистка каталога {directory}")
-        shutil.rmtree(directory)
-    os.makedirs(directory, exist_ok=True)
+def capture_mhtml_snapshot(browser: WebDriver, iframe_id: str) -> Tuple[str, str]:
+    """Снимает страницу вместе с iframe и всеми ресурсами одним вызовом DevTools Page.captureSnapshot
+    
+    Возвращает MHTML и URL документа во фрейме
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+    
+    frame_state = f"""
+        var frame = document.getElementById('{iframe_id}');
+        if (!frame || !frame.contentDocument) return null;
+        return [frame.contentDocument.readyState, frame.contentDocument.URL];
+    """
+    
+    def frame_ready(driver: WebDriver) -> Optional[list]:
+        state = driver.execute_script(frame_state)
+        return state if state and state[0] == "complete" else None
+    
+    document_url = WebDriverWait(browser, 15).until(frame_ready)[1]
+    snapshot = browser.execute_cdp_cmd('Page.captureSnapshot', {'format': 'mhtml'})
+    if args.verbose:
+        print(f"Снимок MHTML: {len(snapshot['data'])} байт")
+    return snapshot['data'], document_url
 
-def post_process_html(html_file_path):
-    """Постобработка HTML файла для исправления путей к изображениям"""
-    try:
-        with open(html_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Регулярное выражение для поиска всех тегов img
-        img_tag_pattern = re.compile(IMG_TAG_PATTERN)
-        
-        # Ищем все теги img
-        for match in img_tag_pattern.finditer(content):
-            full_img_tag = match.group(0)
-            src = match.group(1)
-            
-            # Проверяем, требуется ли коррекция пути
-            if 'images/' not in src and ('/' in src or '%' in src or 'http' in src):
-                # Извлекаем имя файла из сложного пути
-                filename = src.split('/')[-1]
-                # Заменяем сложный путь на простой
-                new_src = f"images/{filename}"
-                new_img_tag = full_img_tag.replace(src, new_src)
-                content = content.replace(full_img_tag, new_img_tag)
-        
-        # Упрощаем все теги img
-        content = re.sub(
-            r'<img[^>]*?src="images/([^"]+)"[^>]*?width="([^"]*)"[^>]*?height="([^"]*)"[^>]*?>', 
-            r'<img src="images/\1" width="\2" height="\3" alt="">',
-            content
-        )
-        
-        # Убираем атрибуты, которые могут мешать отображению
-        content = re.sub(
-            r'<img([^>]*?)class="[^"]*?incomplete[^"]*?"([^>]*?)>', 
-            r'<img\1\2>', 
-            content
-        )
-        
-        # Заменяем все URL-закодированные пути
-        encoded_path_pattern = re.compile(r'images/[^"]*?%[^"]*?\.(?:png|jpg|gif|jpeg)')
-        
-        # Находим все закодированные пути
-        for match in encoded_path_pattern.finditer(content):
-            encoded_path = match.group(0)
-            # Формируем новый путь с порядковым номером
-            new_path = f"images/image{len(set(encoded_path_pattern.findall(content)))}.png"
-            content = content.replace(encoded_path, new_path)
-        
-        # Заменяем ссылки на файлы в подкаталогах на прямые ссылки
-        content = re.sub(
-            r'images/[^"]+?/([^/"]+\.(?:png|jpg|gif|jpeg))', 
-            r'images/\1',
-            content
-        )
-        
-        # Сохраняем обработанный файл
-        with open(html_file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-            
-        return True
-    except Exception as e:
-        if not args.headless:
-            print(f"Ошибка при постобработке HTML: {str(e)}")
-        return False
+def unpack_mhtml(mhtml: str, document_url: str, images_dir: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Извлекает из снимка MHTML документ фрейма и его изображения
+    
+    Изображения сохраняются в images_dir под именами imageNNN.ext, пути к ним в HTML
+    заменяются на images/... как при снятии DOM. Возвращает HTML документа и список
+    изображений (URL, имя файла), которых нет в снимке и которые нужно скачать
+    """
+    archive = email.message_from_string(mhtml)
+    documents: Dict[str, str] = {}
+    resources: Dict[str, email.message.Message] = {}
+    for part in archive.walk():
+        if part.is_multipart():
+            continue
+        location = part.get('Content-Location', '')
+        if part.get_content_type() == 'text/html':
+            payload = part.get_payload(decode=True) or b''
+            documents[location] = payload.decode(part.get_content_charset() or 'utf-8', errors='replace')
+        elif location:
+            resources[location] = part
+    
+    content = documents.get(document_url)
+    if content is None:
+        # Документ фрейма не нашелся по адресу: берем первый HTML, кроме самой страницы
+        candidates = [html_part for location, html_part in documents.items() if location != archive.get('Snapshot-Content-Location')]
+        if not candidates:
+            raise ValueError("В снимке MHTML нет документа фрейма")
+        content = candidates[0]
+    
+    filenames: Dict[str, str] = {}
+    counters: Dict[str, int] = {}
+    missing: List[Tuple[str, str]] = []
+    
+    def replace_src(tag: HtmlTag) -> None:
+        src = tag.get('src')
+        if not src or src.startswith('data:'):
+            return
+        url = urllib.parse.urljoin(document_url, html.unescape(src))
+        if url not in filenames:
+            filenames[url] = image_filename(url, counters)
+            part = resources.get(url)
+            if part is not None:
+                write_file_atomic(os.path.join(images_dir, filenames[url]), part.get_payload(decode=True) or b'')
+            else:
+                missing.append((url, filenames[url]))
+        tag.set('src', f"images/{filenames[url]}")
+    
+    content = rewrite_tags(content, 'img', replace_src)
+    if args.verbose:
+        print(f"Из снимка извлечено изображений: {len(filenames) - len(missing)}, не найдено: {len(missing)}")
+    return content, missing
 
-def clean_img_tags(html_content):
-    """Очищает теги img от ненужных атрибутов, оставляя только src, width, height и alt"""
-    # Регулярное выражение для поиска тегов img
-    img_pattern = re.compile(IMG_TAG_PATTERN)
+# Навигация запускается после возврата из скрипта, чтобы WebDriver не ждал загрузки страницы
+PREFETCH_NAVIGATION_SCRIPT = "var url = arguments[0]; setTimeout(function () { window.location.href = url; }, 0);"
+# Время, которое страница загружается перед снятием документа
+PAGE_SETTLE_SECONDS = 3
+
+class TabPrefetcher:
+    """Заранее загружает следующие страницы во вкладках того же браузера Selenium
     
-    # Словарь для хранения замен
-    replacements = {}
+    Пока в текущей вкладке снимается документ, следующие depth страниц уже
+    загружаются в соседних вкладках. Переход к следующей странице сводится
+    к переключению на ее вкладку, а освободившаяся вкладка используется повторно.
+    После перезапуска браузера состояние вкладок сбрасывается
+    """
+    
+    def __init__(self, depth: int) -> None:
+        self.depth: int = depth
+        self.browser: Optional[WebDriver] = None
+        # Вкладки со страницами в порядке обхода: (URL, вкладка, время начала загрузки)
+        self.tabs: deque = deque()
+        self.free_tabs: List[str] = []
+        self.hits: int = 0
     
-    # Обрабатываем каждый найденный тег img
-    for match in img_pattern.finditer(html_content):
-        full_tag = match.group(0)
-        src = match.group(1)
+    def open(self, browser: WebDriver, url: str, upcoming: List[str]) -> None:
+        """Открывает url в текущей вкладке и начинает загрузку следующих страниц upcoming
         
-        # Если тег уже обработан, пропускаем
-        if full_tag in replacements:
-            continue
+        Возвращается, когда страница загружалась не меньше PAGE_SETTLE_SECONDS
+        """
+        if browser is not self.browser:
+            self.browser = browser
+            self.tabs.clear()
+            self.free_tabs = []
         
-        # Получаем значения width и height, если они есть
-        width_match = re.search(r'width="([^"]+)"', full_tag)
-        width = width_match.group(1) if width_match else ""
+        current = browser.current_window_handle
+        if self.tabs and self.tabs[0][0] == url:
+            _, handle, started = self.tabs.popleft()
+            browser.switch_to.window(handle)
+            self.free_tabs.append(current)
+            self.hits += 1
+            if args.verbose:
+                print(f"Страница загружена заранее, прошло {time.monotonic() - started:.1f} с")
+        else:
+            # Порядок обхода изменился, заранее открытые страницы больше не нужны
+            self.free_tabs.extend(handle for _, handle, _ in self.tabs)
+            self.tabs.clear()
+            started = time.monotonic()
+            browser.get(url)
+        current = browser.current_window_handle
         
-        height_match = re.search(r'height="([^"]+)"', full_tag)
-        height = height_match.group(1) if height_match else ""
+        # Очередные страницы начинают загружаться, пока снимается текущая
+        queued = {tab[0] for tab in self.tabs}
+        for next_url in upcoming:
+            if len(self.tabs) >= self.depth:
+                break
+            if next_url in queued or next_url == url:
+                continue
+            if self.free_tabs:
+                browser.switch_to.window(self.free_tabs.pop())
+            else:
+                browser.switch_to.new_window('tab')
+            browser.execute_script(PREFETCH_NAVIGATION_SCRIPT, next_url)
+            self.tabs.append((next_url, browser.current_window_handle, time.monotonic()))
+            queued.add(next_url)
+        browser.switch_to.window(current)
         
-        # Создаем новый чистый тег
-        if width and height:
-            new_tag = f'<img src="{src}" width="{width}" height="{height}" alt="">'
-        elif width:
-            new_tag = f'<img src="{src}" width="{width}" alt="">'
-        elif height:
-            new_tag = f'<img src="{src}" height="{height}" alt="">'
+        remaining = PAGE_SETTLE_SECONDS - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+def capture_page(browser: WebDriver, page: DocPage, index: int, output_dir: str = 'out',
+                 prefetcher: Optional[TabPrefetcher] = None, upcoming: Optional[List[str]] = None) -> CapturedPage:
+    """Этап браузера: открывает страницу и снимает содержимое iframe с документом
+    
+    С prefetcher страница берется из заранее загруженной вкладки, а следующие
+    страницы upcoming начинают загружаться в соседних вкладках
+    """
+    page_dir = os.path.join(output_dir, f"page_{index:04d}")
+    os.makedirs(os.path.join(page_dir, 'images'), exist_ok=True)
+    
+    metadata = f"Title: {page.title}\nLevel: {page.level}\nURL: {page.url}\n"
+    write_file_atomic(os.path.join(page_dir, 'metadata.txt'), metadata)
+    
+    if _run_budget is not None:
+        _run_budget.acquire()
+    if isinstance(browser, PlaywrightBrowser):
+        html_content, mhtml, document_url, images, referer = browser.capture_document(page.url, "w_metadata_doc_frame")
+        sync_http_session(browser)
+    else:
+        if prefetcher is not None:
+            prefetcher.open(browser, page.url, upcoming or [])
+        else:
+            browser.get(page.url)
+            time.sleep(PAGE_SETTLE_SECONDS)
+        sync_http_session(browser)
+        if args.capture == 'mhtml':
+            # Документ и изображения снимаются одним вызовом, распаковка снимка - на этапе изображений
+            mhtml, document_url = capture_mhtml_snapshot(browser, "w_metadata_doc_frame")
+            html_content, images = None, []
         else:
-            new_tag = f'<img src="{src}" alt="">'
+            mhtml = None
+            html_content, document_url, images = capture_iframe_content(browser, "w_metadata_doc_frame")
+        referer = browser.current_url
+    document_url = document_url or page.url
+    write_file_atomic(os.path.join(page_dir, 'metadata.txt'), f"{metadata}Document URL: {document_url}\n")
+    if _run_budget is not None:
+        # Документ, снятый браузером, учитывается по размеру HTML или снимка
+        _run_budget.add_bytes(len((mhtml or html_content or '').encode('utf-8')))
+    
+    captured = CapturedPage(index, page, page_dir, html_content, document_url, referer, images)
+    captured.mhtml = mhtml
+    return captured
+
+def local_image_name(src: str) -> Optional[str]:
+    """Возвращает имя файла изображения из пути с каталогами (a/b/name.png -> name.png) или None"""
+    directory, separator, filename = src.rpartition('/')
+    if not separator:
+        return None
+    extension = filename.rpartition('.')[2]
+    if extension in ('png', 'jpg', 'gif', 'jpeg') and len(filename) > len(extension) + 1:
+        return filename
+    return None
+
+def prepare_iframe_html(content: str) -> str:
+    """Упрощает теги img со снятыми локальными путями и приводит кодировку к UTF-8"""
+    def simplify_img(tag: HtmlTag) -> None:
+        # Теги img с локальным путем и размерами заменяем упрощенным тегом
+        src = tag.get('src')
+        width = tag.get('width')
+        height = tag.get('height')
+        if src is not None and src.startswith('images/') and len(src) > 7 and width and height:
+            tag.replace([('src', src), ('width', width), ('height', height), ('alt', '')])
         
-        replacements[full_tag] = new_tag
+        # Заменяем все оставшиеся сложные пути для изображений
+        for name in ('src', 'data-src'):
+            value = tag.get(name)
+            filename = local_image_name(value) if value else None
+            if filename:
+                tag.set(name, f"images/{filename}")
     
-    # Применяем все замены
-    for old_tag, new_tag in replacements.items():
-        html_content = html_content.replace(old_tag, new_tag)
+    content = rewrite_tags(content, 'img', simplify_img)
     
-    return html_content
-
-def simplify_image_paths(page_dir):
-    """Копирует все изображения из сложных путей в простую директорию изображений"""
-    try:
-        # Находим все подкаталоги с изображениями
-        images_dir = os.path.join(page_dir, 'images')
-        if not os.path.exists(images_dir):
-            return False
-            
-        # Создаем простой каталог для изображений, если его нет
-        simple_images_dir = os.path.join(page_dir, 'img')
-        os.makedirs(simple_images_dir, exist_ok=True)
-        
-        # Счетчик изображений
-        image_counter = 1
-        
-        # Словарь для отслеживания соответствий между старыми и новыми путями к файлам
-        path_mapping = {}
-        
-        # Проходим по всем файлам в images и подкаталогах
-        for root, dirs, files in os.walk(images_dir):
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                    # Полный путь к исходному файлу
-                    src_path = os.path.join(root, file)
-                    
-                    # Получаем относительный путь от корня images
-                    rel_path = os.path.relpath(src_path, images_dir)
-                    
-                    # Определяем расширение файла
-                    _, ext = os.path.splitext(file)
-                    
-                    # Новое имя файла в формате imageNNN.ext
-                    new_filename = f"image{image_counter:03d}{ext}"
-                    dst_path = os.path.join(simple_images_dir, new_filename)
-                    
-                    # Копируем файл
-                    shutil.copy2(src_path, dst_path)
-                    
-                    # Сохраняем соответствие путей
-                    path_mapping[rel_path] = new_filename
-                    
-                    if args.verbose:
-                        print(f"Скопирован файл {rel_path} -> {new_filename}")
-                    
-                    image_counter += 1
+    # Обновляем или добавляем мета-тег с UTF-8
+    if '<meta charset=' not in content and '<meta http-equiv="Content-Type"' not in content:
+        parts = []
+        position = 0
+        for tag in iter_tags(content, 'head'):
+            parts.append(content[position:tag.start])
+            parts.append('<head>\n    <meta charset="utf-8">')
+            position = tag.end
+        parts.append(content[position:])
+        content = ''.join(parts)
+    else:
+        # Обновляем существующий мета-тег
+        def update_charset(tag: HtmlTag) -> None:
+            http_equiv = tag.get('http-equiv')
+            if tag.get('charset') is not None or (http_equiv is not None and http_equiv.lower() == 'content-type'):
+                tag.replace([('charset', 'utf-8')])
         
-        # Обновляем HTML-файл, чтобы использовать новые пути
-        html_file = os.path.join(page_dir, 'page.html')
-        if os.path.exists(html_file):
-            with open(html_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Получаем все ссылки на изображения в HTML
-            img_tags = re.findall(r'<img[^>]*?src="([^"]+)"[^>]*?>', content)
-            
-            # Словарь для новых соответствий путей
-            new_paths = {}
-            
-            # Обрабатываем каждую ссылку
-            for src in img_tags:
-                if src.startswith('images/'):
-                    # Удаляем префикс images/
-                    rel_path = src[7:]
-                    
-                    # Если есть соответствие в path_mapping, используем его
-                    if rel_path in path_mapping:
-                        new_paths[src] = f"img/{path_mapping[rel_path]}"
-                    else:
-                        # Попробуем найти подходящий файл по имени
-                        filename = os.path.basename(rel_path)
-                        for old_path, new_name in path_mapping.items():
-                            if os.path.basename(old_path) == filename:
-                                new_paths[src] = f"img/{new_name}"
-                                break
-                        else:
-                            # Если не нашли, просто копируем с порядковым номером
-                            new_name = f"image{len(new_paths)+1:03d}{os.path.splitext(filename)[1]}"
-                            new_paths[src] = f"img/{new_name}"
-            
-            # Заменяем пути в HTML
-            for old_path, new_path in new_paths.items():
-                content = content.replace(f'src="{old_path}"', f'src="{new_path}"')
-            
-            # Очищаем теги img от ненужных атрибутов
-            content = clean_img_tags(content)
-            
-            # Сохраняем обновленный HTML
-            with open(html_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-                
-            if args.verbose:
-                print(f"Обновлен HTML-файл {html_file}")
-                
-        return True
-    except Exception as e:
-        if args.verbose:
-            print(f"Ошибка при упрощении путей к изображениям: {str(e)}")
-        return False
+        content = rewrite_tags(content, 'meta', update_charset)
+    
+    return content
 
-def main():
-    global args  # Перемещаем объявление в начало функции
+class _HtmlSanitizer(HTMLParser):
+    """Пересобирает HTML документа без того, что не работает вне сайта
     
-    parser = argparse.ArgumentParser(
-        description="""
-Парсер документации 1С ИТС - инструмент для локального сохранения документации.
+    level: 'none' - разметка не меняется; 'basic' - удаляются скрипты, встроенные объекты,
+    обработчики событий и ссылки javascript:; 'strict' - дополнительно остаются только атрибуты
+    из SANITIZE_KEEP_ATTRIBUTES (внутри svg и math - все, кроме обработчиков событий),
+    из link - только таблицы стилей, из meta - только кодировка.
+    minify: сжатие пробелов в тексте и удаление комментариев.
+    Структура документа, таблицы и текст сохраняются.
+    """
+    
+    def __init__(self, level: str = 'basic', minify: bool = False) -> None:
+        super().__init__(convert_charrefs=False)
+        self.drop: bool = level != 'none'
+        self.strict: bool = level == 'strict'
+        self.minify: bool = minify
+        self.parts: List[str] = []
+        self._skip_tag: Optional[str] = None
+        self._skip_depth: int = 0
+        self._preserve_depth: int = 0
+        self._foreign_depth: int = 0
+    
+    def _attributes(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> Optional[str]:
+        """Возвращает отфильтрованные атрибуты тега или None, если тег нужно удалить"""
+        if self.strict:
+            attributes = dict(attrs)
+            if tag == 'link' and 'stylesheet' not in (attributes.get('rel') or '').lower():
+                return None
+            if tag == 'meta' and 'charset' not in attributes:
+                return None
+        
+        result = []
+        for name, value in attrs:
+            if self.drop:
+                if name.startswith('on'):
+                    continue
+                if name in ('href', 'src', 'xlink:href') and (value or '').strip().lower().startswith('javascript:'):
+                    continue
+            if self.strict and not self._foreign_depth and name not in SANITIZE_KEEP_ATTRIBUTES:
+                continue
+            if value is None:
+                result.append(f" {name}")
+            else:
+                value = value.replace('&', '&amp;').replace('"', '&quot;')
+                result.append(f' {name}="{value}"')
+        return ''.join(result)
+    
+    def _start(self, tag: str, attrs: List[Tuple[str, Optional[str]]], closed: bool) -> None:
+        if self._skip_tag is not None:
+            if tag == self._skip_tag and not closed:
+                self._skip_depth += 1
+            return
+        if self.drop and tag in SANITIZE_DROP_ELEMENTS:
+            # Удаляем элемент вместе с содержимым до закрывающего тега
+            if not closed and tag not in VOID_ELEMENTS:
+                self._skip_tag = tag
+                self._skip_depth = 1
+            return
+        
+        foreign = tag in SANITIZE_KEEP_ALL_ATTRIBUTES_ELEMENTS
+        if foreign:
+            self._foreign_depth += 1
+        attributes = self._attributes(tag, attrs)
+        if foreign and closed:
+            self._foreign_depth -= 1
+        if attributes is None:
+            return
+        self.parts.append(f"<{tag}{attributes}{' /' if closed else ''}>")
+        if tag in PRESERVE_WHITESPACE_ELEMENTS and not closed:
+            self._preserve_depth += 1
+    
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._start(tag, attrs, False)
+    
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._start(tag, attrs, True)
+    
+    def handle_endtag(self, tag: str) -> None:
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag in VOID_ELEMENTS or (self.drop and tag in SANITIZE_DROP_ELEMENTS):
+            return
+        if tag in PRESERVE_WHITESPACE_ELEMENTS and self._preserve_depth:
+            self._preserve_depth -= 1
+        if tag in SANITIZE_KEEP_ALL_ATTRIBUTES_ELEMENTS and self._foreign_depth:
+            self._foreign_depth -= 1
+        self.parts.append(f"</{tag}>")
+    
+    def handle_data(self, data: str) -> None:
+        if self._skip_tag is not None:
+            return
+        if self.minify and not self._preserve_depth:
+            # Неразрывные пробелы значимы, сжимаются только обычные
+            data = re.sub(r'[ \t\r\n\f]+', ' ', data)
+        self.parts.append(data)
+    
+    def handle_entityref(self, name: str) -> None:
+        if self._skip_tag is None:
+            self.parts.append(f"&{name};")
+    
+    def handle_charref(self, name: str) -> None:
+        if self._skip_tag is None:
+            self.parts.append(f"&#{name};")
+    
+    def handle_comment(self, data: str) -> None:
+        if self._skip_tag is None and not self.minify:
+            self.parts.append(f"<!--{data}-->")
+    
+    def handle_decl(self, decl: str) -> None:
+        if self._skip_tag is None:
+            self.parts.append(f"<!{decl}>")
+    
+    def handle_pi(self, data: str) -> None:
+        if self._skip_tag is None:
+            self.parts.append(f"<?{data}>")
+    
+    def unknown_decl(self, data: str) -> None:
+        if self._skip_tag is None:
+            self.parts.append(f"<![{data}]>")
 
-Примеры запуска:
-  Простой запуск:
-    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login
-  
-  С авторизацией через командную строку:
-    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login --username user --password pass
-  
-  С ограничением количества страниц и запуском в фоновом режиме:
-    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login --limit 20 --headless
-  
-  С расширенным выводом для отладки:
-    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login --verbose
-        """,
-        formatter_class=argparse.RawDescriptionHelpFormatter
-    )
-    parser.add_argument('--url', required=True, help='URL документации для загрузки (например, https://its.1c.ru/db/edtdoc)')
-    parser.add_argument('--login', required=True, help='URL страницы авторизации (например, https://login.1c.ru/login)')
-    parser.add_argument('--username', required=False, help='Имя пользователя (если не указано, берется из .env файла)')
-    parser.add_argument('--password', required=False, help='Пароль пользователя (если не указано, берется из .env файла)')
-    parser.add_argument('--limit', type=int, help='Ограничение количества страниц для загрузки (по умолчанию - все страницы)')
-    parser.add_argument('--headless', action='store_true', help='Запуск браузера в фоновом режиме без отображения окна')
-    parser.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
-    args = parser.parse_args()
+def sanitize_html(content: str, level: str = 'basic', minify: bool = False) -> str:
+    """Очищает HTML документа от скриптов и лишних атрибутов, при minify сжимает пробелы
+    
+    Уровни очистки описаны в _HtmlSanitizer
+    """
+    if level == 'none' and not minify:
+        return content
+    sanitizer = _HtmlSanitizer(level, minify)
+    sanitizer.feed(content)
+    sanitizer.close()
+    return ''.join(sanitizer.parts)
 
-    # Использование переменных окружения, если не указаны аргументы
-    if not args.username:
-        args.username = os.environ.get('USERNAME')
-    if not args.password:
-        args.password = os.environ.get('PASSWORD')
+class _OffsetHTMLParser(HTMLParser):
+    """Разбор HTML с переводом позиции текущего тега (getpos) в смещение в исходной строке"""
     
-    # Проверка наличия учетных данных
-    if not args.username or not args.password:
-        raise ValueError("Необходимо указать username и password в аргументах или в файле .env")
+    def __init__(self, content: str, convert_charrefs: bool = False) -> None:
+        super().__init__(convert_charrefs=convert_charrefs)
+        self.content = content
+        self.line_offsets: List[int] = [0]
+        for match in re.finditer('\n', content):
+            self.line_offsets.append(match.end())
+    
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
 
-    clean_output_directory()
+class _PageChunkParser(_OffsetHTMLParser):
+    """Находит в HTML границы элементов, по которым страницу можно разбить на части
+    
+    Для каждого элемента запоминаются смещения начала, содержимого и конца в исходной
+    строке. Незакрытые элементы считаются закрытыми перед закрывающим тегом родителя
+    """
+    
+    def __init__(self, content: str) -> None:
+        super().__init__(content)
+        # Элементы: [тег, глубина, начало содержимого, конец содержимого, конец элемента]
+        self.elements: List[list] = []
+        self._stack: List[list] = []
+    
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        end = self._offset() + len(self.get_starttag_text())
+        element = [tag, len(self._stack), end, end, end]
+        self.elements.append(element)
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(element)
+    
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        end = self._offset() + len(self.get_starttag_text())
+        self.elements.append([tag, len(self._stack), end, end, end])
+    
+    def handle_endtag(self, tag: str) -> None:
+        if not any(element[0] == tag for element in self._stack):
+            return
+        start = self._offset()
+        end = self.content.find('>', start) + 1
+        while self._stack:
+            element = self._stack.pop()
+            if element[0] == tag:
+                element[3], element[4] = start, end
+                break
+            element[3] = element[4] = start
+    
+    def close(self) -> None:
+        super().close()
+        # Элементы, не закрытые до конца документа
+        for element in self._stack:
+            element[3] = element[4] = len(self.content)
+        self._stack = []
+
+def split_page_content(content: str, chunk_size: int) -> str:
+    """Разбивает длинную страницу на части примерно по chunk_size символов
+    
+    Части - блоки div с якорями page-part-N, которые браузер не отрисовывает,
+    пока они за пределами экрана (content-visibility). Граница частей проходит между
+    элементами верхнего уровня: если <body> состоит из одной обертки, берутся ее потомки
+    """
+    if chunk_size <= 0 or len(content) <= chunk_size:
+        return content
+    parser = _PageChunkParser(content)
+    parser.feed(content)
+    parser.close()
+    
+    # Контейнер частей - <body>, а если его нет, весь документ
+    bodies = [element for element in parser.elements if element[0] == 'body']
+    if bodies:
+        depth, start, end = bodies[0][1] + 1, bodies[0][2], bodies[0][3]
+    else:
+        depth, start, end = 0, 0, len(content)
+    while True:
+        children = [element for element in parser.elements
+                    if element[1] == depth and start <= element[2] and element[4] <= end]
+        if len(children) != 1 or children[0][0] in VOID_ELEMENTS:
+            break
+        depth, start, end = depth + 1, children[0][2], children[0][3]
+    if len(children) < 2:
+        return content
+    
+    # Границы частей - концы элементов, после которых накопилось не меньше chunk_size
+    boundaries: List[int] = []
+    part_start = start
+    for child in children[:-1]:
+        if child[4] - part_start >= chunk_size:
+            boundaries.append(child[4])
+            part_start = child[4]
+    if not boundaries:
+        return content
+    
+    parts = [content[:start], PAGE_PART_TAG.format(number=1)]
+    previous = start
+    for number, boundary in enumerate(boundaries, 2):
+        parts.append(content[previous:boundary])
+        parts.append('</div>' + PAGE_PART_TAG.format(number=number))
+        previous = boundary
+    parts.extend([content[previous:end], '</div>', content[end:]])
+    return ''.join(parts)
+
+def save_page_source(page_dir: str, content: str) -> None:
+    """Сохраняет снятый HTML до обработки в source.html.gz"""
+    write_file_atomic(os.path.join(page_dir, PAGE_SOURCE_FILE), gzip.compress(content.encode('utf-8'), compresslevel=6))
+
+def transform_page_html(content: str, page_dir: str, document_url: str, url_index: Dict[str, int],
+                        assets: Optional[Dict[str, str]] = None) -> Tuple[str, List[str]]:
+    """Этап преобразования: все правки HTML страницы после снятия из браузера
+    
+    Изображения к этому моменту должны быть скачаны в images/, а ресурсы из assets
+    (URL -> локальный путь) - в общий каталог assets/. Возвращает итоговый HTML
+    и список внутренних ссылок, для которых нет локальной копии
+    """
+    content = prepare_iframe_html(content)
+    
+    # Исправляем пути к изображениям
+    content = post_process_html_content(content)
+    
+    # Упрощаем пути к изображениям
+    path_mapping = copy_images_to_simple_dir(page_dir)
+    if path_mapping is not None:
+        content = simplify_image_paths_content(content, path_mapping)
+    
+    # Удаляем скрипты и лишние атрибуты
+    content = sanitize_html(content, args.sanitize, args.minify)
+    
+    # Размеры изображений из заголовков файлов и отложенная загрузка
+    content = size_page_images(content, page_dir)
+    
+    # Длинные страницы делим на части, которые браузер отрисовывает по мере прокрутки
+    content = split_page_content(content, args.page_chunk_size * 1024)
+    
+    # Таблицы стилей, шрифты и фоновые изображения берем из общего каталога
+    content = localize_html_assets(content, document_url, assets or {})
+    
+    # Заменяем ссылки на другие страницы документации локальными
+    return rewrite_internal_links(content, url_index, document_url)
+
+# Индексы URL страниц и ресурсов в процессах преобразования задаются один раз при запуске процесса
+_worker_url_index: Dict[str, int] = {}
+_worker_assets: Dict[str, str] = {}
+
+def _init_transform_worker(options: argparse.Namespace, url_index: Dict[str, int],
+                           assets: Optional[Dict[str, str]] = None) -> None:
+    global args, _worker_url_index, _worker_assets
+    # Прерывание обрабатывает основной процесс, дожидаясь страниц в обработке
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    args = options
+    _worker_url_index = url_index
+    _worker_assets = assets or {}
+
+def _transform_in_worker(content: str, page_dir: str, document_url: str,
+                         assets: Dict[str, str]) -> Tuple[str, List[str]]:
+    return transform_page_html(content, page_dir, document_url, _worker_url_index, assets)
+
+class _PipelineStage:
+    """Этап конвейера: потоки, обрабатывающие страницы из ограниченной входной очереди
+    
+    Страницы с ошибкой на предыдущих этапах передаются дальше без обработки,
+    чтобы ошибка дошла до очереди результатов.
+    """
+    
+    def __init__(self, name: str, handler: Callable[[CapturedPage], None], workers: int,
+                 input_queue: queue.Queue, output_queue: queue.Queue) -> None:
+        self.handler = handler
+        self.input_queue: queue.Queue = input_queue
+        self.output_queue: queue.Queue = output_queue
+        self.threads: List[threading.Thread] = [
+            threading.Thread(target=self._run, name=f"{name}-{number}", daemon=True)
+            for number in range(1, workers + 1)
+        ]
+    
+    def start(self) -> None:
+        for thread in self.threads:
+            thread.start()
+    
+    def _run(self) -> None:
+        while True:
+            captured = self.input_queue.get()
+            if captured is None:
+                break
+            if captured.error is None:
+                try:
+                    self.handler(captured)
+                except Exception as e:
+                    captured.error = e
+            self.output_queue.put(captured)
+    
+    def close(self) -> None:
+        """Дожидается обработки всех страниц из очереди и останавливает потоки"""
+        for _ in self.threads:
+            self.input_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+class PagePipeline:
+    """Конвейер сохранения страниц: загрузка изображений -> преобразование HTML -> запись на диск
+    
+    Браузер только снимает страницы и передает их в конвейер, сразу переходя к следующей.
+    Этапы связаны очередями размера queue_size: если последующий этап не успевает,
+    предыдущие (и в конце концов браузер) ждут, поэтому память не растет на больших базах.
+    При transform_processes > 0 преобразование HTML выполняется в пуле процессов.
+    Таблицы стилей и шрифты скачиваются вместе с изображениями в общий каталог output_dir/assets.
+    """
+    
+    def __init__(self, browser: WebDriver, url_index: Dict[str, int], image_workers: int = 4,
+                 transform_workers: int = 1, transform_processes: int = 0, queue_size: int = 4,
+                 output_dir: str = 'out') -> None:
+        self.session: requests.Session = get_http_session(browser)
+        self.url_index: Dict[str, int] = url_index
+        self.assets: AssetStore = AssetStore(os.path.join(output_dir, ASSETS_DIR), self.session)
+        self.results: queue.Queue = queue.Queue()
+        self.in_flight: int = 0
+        self._downloads = ThreadPoolExecutor(max_workers=max(image_workers, 1), thread_name_prefix='image-download')
+        self._processes: Optional[ProcessPoolExecutor] = None
+        if transform_processes > 0:
+            self._processes = ProcessPoolExecutor(transform_processes, initializer=_init_transform_worker,
+                                                  initargs=(args, url_index))
+            transform_workers = transform_processes
+        
+        image_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        transform_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        write_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stages: List[_PipelineStage] = [
+            _PipelineStage('images', self._fetch_images, 2, image_queue, transform_queue),
+            _PipelineStage('transform', self._transform, max(transform_workers, 1), transform_queue, write_queue),
+            _PipelineStage('write', self._write, 1, write_queue, self.results),
+        ]
+        for stage in self._stages:
+            stage.start()
+    
+    def submit(self, captured: CapturedPage) -> None:
+        """Передает снятую страницу в конвейер, ожидая места в очереди"""
+        self.in_flight += 1
+        self._stages[0].input_queue.put(captured)
+    
+    def finished(self) -> List[CapturedPage]:
+        """Возвращает уже обработанные страницы, не дожидаясь остальных"""
+        done = []
+        while True:
+            try:
+                done.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        self.in_flight -= len(done)
+        return done
+    
+    def wait_result(self) -> CapturedPage:
+        """Дожидается следующей обработанной страницы"""
+        captured = self.results.get()
+        self.in_flight -= 1
+        return captured
+    
+    def close(self) -> None:
+        """Дожидается обработки всех переданных страниц и освобождает ресурсы"""
+        for stage in self._stages:
+            stage.close()
+        self._downloads.shutdown()
+        if self._processes:
+            self._processes.shutdown()
+    
+    def _fetch_images(self, captured: CapturedPage) -> None:
+        images_dir = os.path.join(captured.page_dir, 'images')
+        if captured.mhtml is not None:
+            if args.keep_mhtml:
+                write_file_atomic(os.path.join(captured.page_dir, PAGE_MHTML_FILE), captured.mhtml)
+            captured.html, captured.images = unpack_mhtml(captured.mhtml, captured.document_url, images_dir)
+            captured.mhtml = None
+        save_page_source(captured.page_dir, captured.html)
+        downloads = [
+            self._downloads.submit(download_image, self.session, url, os.path.join(images_dir, filename), captured.referer)
+            for url, filename in captured.images
+        ]
+        # Общие ресурсы скачиваются, пока загружаются изображения страницы
+        captured.assets = self.assets.fetch_page_assets(captured.html, captured.document_url, captured.referer)
+        for download in downloads:
+            if not download.result() and args.verbose:
+                print(f"Не удалось скачать изображение для страницы {captured.page.title}")
+    
+    def _transform(self, captured: CapturedPage) -> None:
+        original_size = len(captured.html.encode('utf-8'))
+        if self._processes:
+            content, unresolved = self._processes.submit(
+                _transform_in_worker, captured.html, captured.page_dir, captured.document_url, captured.assets
+            ).result()
+        else:
+            content, unresolved = transform_page_html(captured.html, captured.page_dir, captured.document_url,
+                                                      self.url_index, captured.assets)
+        captured.html = content
+        captured.unresolved = unresolved
+        captured.sizes = (original_size, len(content.encode('utf-8')))
+    
+    def _write(self, captured: CapturedPage) -> None:
+        # Сохраняем содержимое в файл в UTF-8 через временный файл, чтобы не оставлять недописанных страниц
+        output_file = os.path.join(captured.page_dir, 'page.html')
+        write_file_atomic(output_file, captured.html)
+        captured.html = None
+        if args.verbose:
+            print(f"Содержимое iframe сохранено в {output_file}")
+
+def add_pipeline_arguments(parser: argparse.ArgumentParser) -> None:
+    """Добавляет параметры конвейера сохранения страниц"""
+    parser.add_argument('--image-workers', type=int, default=4, help='Количество потоков загрузки изображений (по умолчанию 4)')
+    parser.add_argument('--transform-workers', type=int, default=1, help='Количество потоков преобразования HTML (по умолчанию 1)')
+    parser.add_argument('--transform-processes', type=int, default=0, help='Преобразовывать HTML в пуле из N процессов (по умолчанию 0 - в потоках)')
+    parser.add_argument('--queue-size', type=int, default=4, help='Размер очереди между этапами конвейера, в страницах (по умолчанию 4)')
+    parser.add_argument('--capture', choices=CAPTURE_MODES, default='dom',
+                        help='Способ снятия документа: dom - HTML фрейма и загрузка изображений по отдельности, '
+                             'mhtml - снимок страницы со всеми ресурсами одним вызовом DevTools (по умолчанию dom)')
+    parser.add_argument('--keep-mhtml', action='store_true', help='В режиме --capture mhtml сохранять исходный снимок page.mhtml рядом со страницей')
+    add_transform_arguments(parser)
+
+def add_transform_arguments(parser: argparse.ArgumentParser) -> None:
+    """Добавляет параметры обработки HTML страниц"""
+    parser.add_argument('--sanitize', choices=SANITIZE_LEVELS, default='basic',
+                        help='Очистка HTML: none - без изменений, basic - удалить скрипты и обработчики событий, '
+                             'strict - также лишние атрибуты (по умолчанию basic)')
+    parser.add_argument('--minify', action='store_true', help='Сжимать пробелы и удалять комментарии в HTML страниц')
+    parser.add_argument('--page-chunk-size', type=int, default=0,
+                        help='Делить страницы длиннее N КБ на части с якорями page-part-N, '
+                             'которые браузер отрисовывает по мере прокрутки (по умолчанию 0 - не делить)')
+
+def save_all_pages(browser: WebDriver, pages: List[DocPage], limit: int = None,
+                   output_dir: str = 'out', progress: Optional[Callable[[int, int], None]] = None,
+                   supervisor: Optional[BrowserSupervisor] = None, resume: bool = False,
+                   selected: Optional[Set[int]] = None) -> int:
+    """Сохраняет все страницы документации
+    
+    Браузер снимает страницы по очереди, а загрузка изображений, преобразование HTML
+    и запись на диск выполняются конвейером PagePipeline параллельно со съемкой.
+    progress, если задан, вызывается после каждой страницы с номером страницы и их текущим числом.
+    С supervisor страницы снимаются его браузером, который может перезапускаться по ходу обхода.
+    Состояние обхода ведется в журнале output_dir/.crawl_journal.sqlite; при resume список
+    страниц берется из журнала, а уже сохраненные страницы пропускаются.
+    selected (см. select_pages) задает номера страниц оглавления для выборочной загрузки:
+    остальные страницы не загружаются, а ранее сохраненные остаются на диске и в оглавлении.
+    Возвращает число страниц, оставшихся незагруженными из-за исчерпания ограничений запуска (RunBudget).
+    """
+    pages = list(pages)
+    if limit is not None and selected is None:
+        pages = pages[:limit]
+        print(f"Ограничение: будет сохранено {len(pages)} страниц")
+    if selected is not None:
+        selected = set(sorted(selected)[:limit]) if limit is not None else set(selected)
+        print(f"Выбрано страниц оглавления: {len(selected)} из {len(pages)}")
+    
+    os.makedirs(output_dir, exist_ok=True)
+    journal = CrawlJournal(os.path.join(output_dir, CRAWL_JOURNAL_FILE))
+    restored = journal.load() if resume else None
+    refresh = False
+    if restored is None and selected is not None:
+        # Выборочное обновление продолжает журнал прежней загрузки того же оглавления:
+        # выбранные страницы загружаются заново, состояние остальных сохраняется
+        previous = journal.load()
+        if previous is not None and [page.to_list() for page in previous[0][:previous[1]]] == [page.to_list() for page in pages]:
+            restored = previous
+            refresh = True
+    completed: Dict[int, Tuple[str, List[str], Optional[Tuple[int, int]]]] = {}
+    depths: Dict[int, int] = {}
+    if restored is not None:
+        pages, toc_total, depths = restored
+        completed = journal.completed(output_dir)
+        if not refresh:
+            print(f"Продолжение загрузки: сохранено {len(completed)} из {len(pages)} страниц")
+    else:
+        journal.start(pages)
+        toc_total = len(pages)
+    
+    # Адреса оглавления, перенаправляющие на другие документы (проверяются один раз за загрузку)
+    redirects: Dict[str, str] = {}
+    if args.resolve_redirects:
+        stored = journal.get('redirects') if restored is not None else None
+        if stored is not None:
+            redirects = json.loads(stored)
+        else:
+            print("Проверка перенаправлений адресов оглавления...")
+            redirects = resolve_redirects(get_http_session(browser), [page.url for page in pages[:toc_total]],
+                                          args.image_workers)
+            journal.set('redirects', json.dumps(redirects, ensure_ascii=False))
+            if redirects:
+                print(f"Адресов с перенаправлением на другой документ: {len(redirects)}")
+    
+    # Индекс для замены ссылок между страницами на локальные
+    url_index = build_url_index(pages, redirects)
+    # Записи оглавления с одним документом снимаются один раз, остальные ссылаются на общую копию
+    targets = document_targets(pages, url_index, redirects)
+    duplicates = {i for i, (target, _) in targets.items() if target != i}
+    if duplicates:
+        print(f"Записей оглавления, ведущих на уже сохраняемый документ: {len(duplicates)}")
+    
+    # При выборочной загрузке снимаются документы выбранных записей; ссылки и оглавление
+    # ведут на локальные копии только загружаемых и уже сохраненных ранее страниц
+    skipped: Set[int] = set()
+    available: Optional[Set[int]] = None
+    link_index = url_index
+    if selected is not None:
+        capturing_targets = {targets[i][0] for i in selected}
+        if refresh:
+            # Документ снимается заново, даже если он общий с невыбранной сохраненной записью
+            journal.reset(capturing_targets)
+            completed = {index: state for index, state in completed.items() if index not in capturing_targets}
+        skipped = set(range(1, len(pages) + 1)) - capturing_targets
+        available = capturing_targets | {
+            i for i in skipped if os.path.exists(os.path.join(output_dir, f"page_{i:04d}", 'page.html'))
+        }
+        link_index = {url: i for url, i in url_index.items() if i in available}
+    write_toc(pages, output_dir, targets, available)
+    unresolved_links: Dict[int, List[str]] = {}
+    document_urls: Dict[int, str] = {}
+    page_sizes: Dict[int, Tuple[int, int]] = {}
+    for index, (document_url, unresolved, sizes) in completed.items():
+        document_urls[index] = document_url
+        if unresolved:
+            unresolved_links[index] = unresolved
+        if sizes:
+            page_sizes[index] = sizes
+    
+    # Очередь ссылок, найденных внутри документов, но отсутствующих в оглавлении
+    frontier = None
+    if args.discover_depth > 0:
+        frontier = LinkFrontier(os.path.join(output_dir, LINK_FRONTIER_FILE))
+        for url in url_index:
+            frontier.add(url)
+        # Очередь в журнал не пишется: при продолжении ссылки сохраненных страниц собираются заново
+        for index in sorted(unresolved_links):
+            depth = depths.get(index, 0)
+            if depth < args.discover_depth and index not in skipped:
+                page_dir = os.path.join(output_dir, f"page_{index:04d}")
+                frontier.extend(extract_document_links(page_dir, pages[index - 1].url), depth + 1)
+    
+    def handle_result(captured: CapturedPage) -> None:
+        i = captured.index
+        page = captured.page
+        journal.record(captured)
+        if captured.error is not None:
+            print(f"Ошибка при сохранении страницы {page.title}")
+            if args.verbose:
+                print(f"Детали: {str(captured.error)}")
+        else:
+            document_urls[i] = captured.document_url
+            page_sizes[i] = captured.sizes
+            if args.verbose:
+                print(f"Размер страницы: {captured.sizes[0]} -> {captured.sizes[1]} байт")
+            if captured.unresolved:
+                unresolved_links[i] = captured.unresolved
+                if args.verbose:
+                    print(f"Не найдены локальные копии для {len(captured.unresolved)} ссылок")
+            
+            # Ставим в очередь новые страницы базы, на которые ссылается документ
+            depth = depths.get(i, 0)
+            if frontier is not None and captured.unresolved and depth < args.discover_depth:
+                queued = frontier.extend(extract_document_links(captured.page_dir, page.url), depth + 1)
+                if queued and args.verbose:
+                    print(f"Найдено новых страниц по ссылкам: {queued}")
+        
+        if progress:
+            progress(i, len(pages))
+    
+    pipeline = PagePipeline(browser, link_index, args.image_workers, args.transform_workers,
+                            args.transform_processes, args.queue_size, output_dir)
+    if restored is not None:
+        pipeline.assets.load_index()
+    
+    # Браузер с несколькими вкладками (PlaywrightBrowser) снимает до concurrency страниц одновременно,
+    # в конвейер страницы передаются в исходном порядке
+    concurrency = supervisor.concurrency if supervisor is not None else 1
+    capture_pool = ThreadPoolExecutor(concurrency, thread_name_prefix='capture') if concurrency > 1 else None
+    capturing: deque = deque()
+    
+    # Один браузер загружает следующие страницы в соседних вкладках, пока снимается текущая
+    prefetcher = TabPrefetcher(args.prefetch_pages) if args.prefetch_pages > 0 and capture_pool is None else None
+    
+    def upcoming_urls(index: int) -> List[str]:
+        urls = []
+        for number in range(index + 1, len(pages) + 1):
+            if len(urls) >= args.prefetch_pages:
+                break
+            if number not in completed and number not in duplicates and number not in skipped:
+                urls.append(pages[number - 1].url)
+        return urls
+    
+    def capture(page: DocPage, index: int) -> CapturedPage:
+        upcoming = upcoming_urls(index) if prefetcher is not None else None
+        if supervisor is not None:
+            return supervisor.run_page(lambda current: capture_page(current, page, index, output_dir, prefetcher, upcoming))
+        return capture_page(browser, page, index, output_dir, prefetcher, upcoming)
+    
+    def submit_captured(index: int, page: DocPage, get_captured: Callable[[], CapturedPage]) -> None:
+        try:
+            captured = get_captured()
+        except Exception as e:
+            print(f"Ошибка при сохранении страницы {page.title}")
+            if args.verbose:
+                print(f"Детали: {str(e)}")
+            journal.record_failure(index, e)
+            if progress:
+                progress(index, len(pages))
+            return
+        pipeline.submit(captured)
+    
+    # Снимаем страницы, список может пополняться найденными ссылками
+    i = 0
+    interrupted = False
+    stopped: Optional[str] = None
+    try:
+        while True:
+            for captured in pipeline.finished():
+                handle_result(captured)
+            
+            if i >= len(pages):
+                # Найденные по ссылкам страницы тоже учитываются в ограничении limit,
+                # при выборочной загрузке - вместе с выбранными страницами оглавления
+                loaded = len(pages) if selected is None else len(selected) + len(pages) - toc_total
+                if frontier is not None and _run_budget is not None:
+                    # После исчерпания ограничений запуска найденные страницы не добавляются
+                    stopped = _run_budget.exhausted()
+                discovered = (frontier.pop() if frontier is not None and stopped is None and (limit is None or loaded < limit)
+                              else None)
+                if discovered is None:
+                    # Дожидаемся страниц, которые еще снимаются
+                    if capturing:
+                        submit_captured(*capturing.popleft())
+                        continue
+                    # Страницы в конвейере еще могут дать новые ссылки
+                    if frontier is not None and pipeline.in_flight:
+                        handle_result(pipeline.wait_result())
+                        continue
+                    break
+                url, title, depth = discovered
+                pages.append(DocPage(url, title, 1, f"+{len(pages) - toc_total}."))
+                url_index.setdefault(normalize_url(url), len(pages))
+                link_index.setdefault(normalize_url(url), len(pages))
+                if available is not None:
+                    available.add(len(pages))
+                depths[len(pages)] = depth
+                journal.add_page(len(pages), pages[-1], depth)
+            
+            i += 1
+            page = pages[i - 1]
+            total = len(pages)
+            if i in completed or i in duplicates or i in skipped:
+                if progress:
+                    progress(i, total)
+                continue
+            # При исчерпании ограничений запуска новые страницы не снимаются, начатые дописываются
+            stopped = _run_budget.exhausted() if _run_budget is not None else None
+            if stopped is not None:
+                print(f"\nОстановка: {stopped}, дожидаемся записи страниц в обработке...")
+                while capturing:
+                    submit_captured(*capturing.popleft())
+                break
+            if args.verbose:
+                print(f"\nОбработка страницы {i}/{total}")
+                print(f"Заголовок: {page.title}")
+                print(f"Уровень: {page.level}")
+                print(f"URL: {page.url}")
+            else:
+                print(f"Обработка: {i}/{total} - {page.title}")
+            
+            if capture_pool is None:
+                submit_captured(i, page, lambda: capture(page, i))
+                continue
+            capturing.append((i, page, capture_pool.submit(capture, page, i).result))
+            if len(capturing) >= concurrency:
+                submit_captured(*capturing.popleft())
+    except KeyboardInterrupt:
+        # Страницы, уже переданные в конвейер, дописываются и попадают в журнал
+        interrupted = True
+        print("\nПрерывание: дожидаемся записи страниц в обработке...")
+    finally:
+        if capture_pool is not None:
+            # Недоснятые страницы не попадают в журнал и будут сняты при продолжении
+            capture_pool.shutdown(wait=not interrupted, cancel_futures=True)
+        pipeline.close()
+    
+    for captured in pipeline.finished():
+        handle_result(captured)
+    pipeline.assets.save_index()
+    if interrupted:
+        if frontier is not None:
+            frontier.close()
+        journal.close()
+        print(f"Состояние сохранено в {journal.path}, для продолжения запустите с параметром --resume")
+        raise KeyboardInterrupt
+    if prefetcher is not None and prefetcher.hits:
+        print(f"Страниц, загруженных заранее во вкладках: {prefetcher.hits}")
+    if pipeline.assets.downloaded:
+        print(f"Сохранено общих ресурсов (стили, шрифты, фоновые изображения): {pipeline.assets.downloaded}")
+    
+    if frontier is not None:
+        frontier.close()
+        if len(pages) > toc_total:
+            print(f"Сохранено страниц, отсутствующих в оглавлении: {len(pages) - toc_total}")
+            write_toc(pages, output_dir, targets, available)
+            
+            # Ссылки на страницы, найденные позже, теперь можно заменить локальными
+            for index in list(unresolved_links):
+                unresolved = rewrite_page_links(os.path.join(output_dir, f"page_{index:04d}"), link_index, document_urls[index])
+                if unresolved:
+                    unresolved_links[index] = unresolved
+                else:
+                    del unresolved_links[index]
+    journal.close()
+    
+    remaining: List[int] = []
+    if stopped is not None:
+        # Оглавление ссылается на сайт для страниц, которые еще не загружены
+        remaining = [index for index in range(1, len(pages) + 1)
+                     if index not in document_urls and index not in duplicates and index not in skipped]
+        write_toc(pages, output_dir, targets, set(document_urls) | ((available or set()) - set(remaining)))
+        print(f"Загрузка остановлена: {stopped}")
+        print(f"Загружено страниц: {len(document_urls)}, осталось: {len(remaining)}")
+        if remaining:
+            first = pages[remaining[0] - 1]
+            print(f"Следующая страница: {first.number} {first.title}")
+            print(f"Состояние сохранено в {journal.path}, для продолжения запустите с параметром --resume")
+    
+    write_unresolved_links_report(unresolved_links, output_dir)
+    write_page_size_report(page_sizes, output_dir)
+    return len(remaining)
+
+def clean_output_directory(directory='out'):
+    """Очищает каталог вывода, если он существует"""
+    if os.path.exists(directory):
+        print(f"Очистка каталога {directory}")
+        shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+
+def find_encoded_image_paths(value: str) -> List[Tuple[int, int]]:
+    """Находит в значении фрагменты images/...%...расширение - пути с URL-кодированными символами
+    
+    Каждый фрагмент начинается с images/, содержит % и заканчивается первым после него
+    расширением изображения. Значение просматривается один раз
+    """
+    spans = []
+    position = 0
+    while True:
+        start = value.find('images/', position)
+        if start < 0:
+            return spans
+        percent = value.find('%', start + 7)
+        if percent < 0:
+            return spans
+        extension = _IMAGE_EXTENSION.search(value, percent + 1)
+        if extension is None:
+            return spans
+        spans.append((start, extension.end()))
+        position = extension.end()
+
+def flatten_image_path(value: str) -> str:
+    """Убирает подкаталоги из путей images/каталог/.../имя.расширение, оставляя images/имя.расширение
+    
+    Для каждого images/ берется первый подкаталог, за которым следует имя файла
+    с расширением изображения. Каждый символ значения просматривается не более двух раз
+    """
+    parts = []
+    position = 0
+    while True:
+        start = value.find('images/', position)
+        if start < 0:
+            break
+        # Перед разделителем подкаталога должен быть хотя бы один символ
+        separator = value.find('/', start + 8)
+        found = None
+        while separator >= 0:
+            next_separator = value.find('/', separator + 1)
+            segment_end = next_separator if next_separator >= 0 else len(value)
+            last = None
+            for match in _IMAGE_EXTENSION.finditer(value, separator + 2, segment_end):
+                last = match
+            if last is not None:
+                found = (separator + 1, last.end())
+                break
+            separator = next_separator
+        if found is None:
+            break
+        parts.append(value[position:start])
+        parts.append('images/' + value[found[0]:found[1]])
+        position = found[1]
+    if not parts:
+        return value
+    parts.append(value[position:])
+    return ''.join(parts)
+
+def post_process_html_content(content: str) -> str:
+    """Исправляет пути к изображениям в HTML-коде страницы
+    
+    Все правки выполняются разбором тегов img (rewrite_tags), время работы линейно
+    по длине документа
+    """
+    def fix_img(tag: HtmlTag) -> None:
+        src = tag.get('src')
+        if not src:
+            return
+        
+        # Проверяем, требуется ли коррекция пути
+        if 'images/' not in src and ('/' in src or '%' in src or 'http' in src):
+            # Заменяем сложный путь на простой, оставляя имя файла
+            new_src = f"images/{src.split('/')[-1]}"
+            tag.set('src', new_src)
+            if tag.get('data-src') == src:
+                tag.set('data-src', new_src)
+            src = new_src
+        
+        # Упрощаем тег с локальным путем и размерами
+        width = tag.get('width')
+        height = tag.get('height')
+        if src.startswith('images/') and width is not None and height is not None:
+            tag.replace([('src', src), ('width', width), ('height', height), ('alt', '')])
+        
+        # Убираем атрибуты, которые могут мешать отображению
+        if 'incomplete' in (tag.get('class') or ''):
+            tag.remove('class')
+    
+    content = rewrite_tags(content, 'img', fix_img)
+    
+    # URL-закодированные пути заменяем порядковыми именами: уникальные пути нумеруются
+    # в порядке появления, начиная с их общего числа
+    encoded_paths: Dict[str, None] = {}
+    for tag in iter_tags(content, 'img'):
+        src = tag.get('src') or ''
+        for start, end in find_encoded_image_paths(src):
+            encoded_paths.setdefault(src[start:end], None)
+    if encoded_paths:
+        new_paths = {path: f"images/image{len(encoded_paths) - number}.png" for number, path in enumerate(encoded_paths)}
+        
+        def rename_encoded(tag: HtmlTag) -> None:
+            src = tag.get('src') or ''
+            spans = find_encoded_image_paths(src)
+            if spans:
+                parts = []
+                position = 0
+                for start, end in spans:
+                    parts.append(src[position:start])
+                    parts.append(new_paths[src[start:end]])
+                    position = end
+                parts.append(src[position:])
+                tag.set('src', ''.join(parts))
+        
+        content = rewrite_tags(content, 'img', rename_encoded)
+    
+    # Заменяем ссылки на файлы в подкаталогах на прямые ссылки
+    def flatten_src(tag: HtmlTag) -> None:
+        src = tag.get('src')
+        if src and 'images/' in src:
+            tag.set('src', flatten_image_path(src))
+    
+    return rewrite_tags(content, 'img', flatten_src)
+    
+def clean_img_tags(html_content):
+    """Очищает теги img от ненужных атрибутов, оставляя только src, width, height и alt"""
+    def clean(tag: HtmlTag) -> None:
+        src = tag.get('src')
+        if not src:
+            return
+        attributes = [('src', src)]
+        # Сохраняем width и height, если они есть
+        for name in ('width', 'height'):
+            value = tag.get(name)
+            if value:
+                attributes.append((name, value))
+        attributes.append(('alt', ''))
+        tag.replace(attributes)
+    
+    return rewrite_tags(html_content, 'img', clean)
+
+def copy_images_to_simple_dir(page_dir: str) -> Optional[Dict[str, str]]:
+    """Копирует все изображения из сложных путей в простую директорию изображений
+    
+    Возвращает соответствие путей относительно images/ новым именам в img/
+    или None, если у страницы нет каталога images
+    """
+    # Находим все подкаталоги с изображениями
+    images_dir = os.path.join(page_dir, 'images')
+    if not os.path.exists(images_dir):
+        return None
+        
+    # Создаем простой каталог для изображений, если его нет
+    simple_images_dir = os.path.join(page_dir, 'img')
+    os.makedirs(simple_images_dir, exist_ok=True)
+    
+    # Счетчик изображений
+    image_counter = 1
+    
+    # Словарь для отслеживания соответствий между старыми и новыми путями к файлам
+    path_mapping = {}
+    
+    # Проходим по всем файлам в images и подкаталогах
+    for root, dirs, files in os.walk(images_dir):
+        for file in files:
+            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+                # Полный путь к исходному файлу
+                src_path = os.path.join(root, file)
+                
+                # Получаем относительный путь от корня images
+                rel_path = os.path.relpath(src_path, images_dir)
+                
+                # Определяем расширение файла
+                _, ext = os.path.splitext(file)
+                
+                # Новое имя файла в формате imageNNN.ext
+                new_filename = f"image{image_counter:03d}{ext}"
+                dst_path = os.path.join(simple_images_dir, new_filename)
+                
+                # Копируем файл через временный, чтобы прерванное копирование не оставило испорченный файл
+                tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+                shutil.copy2(src_path, tmp_path)
+                os.replace(tmp_path, dst_path)
+                
+                # Сохраняем соответствие путей
+                path_mapping[rel_path] = new_filename
+                
+                if args.verbose:
+                    print(f"Скопирован файл {rel_path} -> {new_filename}")
+                
+                image_counter += 1
+    
+    return path_mapping
+
+def simplify_image_paths_content(content: str, path_mapping: Dict[str, str]) -> str:
+    """Заменяет в HTML пути images/... на пути к копиям в img/ и очищает теги img"""
+    # Получаем все ссылки на изображения в HTML
+    img_tags = [tag.get('src') for tag in iter_tags(content, 'img')]
+    
+    # Словарь для новых соответствий путей
+    new_paths = {}
+    
+    # Обрабатываем каждую ссылку
+    for src in img_tags:
+        if src and src.startswith('images/') and src not in new_paths:
+            # Удаляем префикс images/
+            rel_path = src[7:]
+            
+            # Если есть соответствие в path_mapping, используем его
+            if rel_path in path_mapping:
+                new_paths[src] = f"img/{path_mapping[rel_path]}"
+            else:
+                # Попробуем найти подходящий файл по имени
+                filename = os.path.basename(rel_path)
+                for old_path, new_name in path_mapping.items():
+                    if os.path.basename(old_path) == filename:
+                        new_paths[src] = f"img/{new_name}"
+                        break
+                else:
+                    # Если не нашли, просто копируем с порядковым номером
+                    new_name = f"image{len(new_paths)+1:03d}{os.path.splitext(filename)[1]}"
+                    new_paths[src] = f"img/{new_name}"
+    
+    # Заменяем пути в HTML
+    def replace_src(tag: HtmlTag) -> None:
+        src = tag.get('src')
+        if src in new_paths:
+            tag.set('src', new_paths[src])
+    
+    content = rewrite_tags(content, 'img', replace_src)
+    
+    # Очищаем теги img от ненужных атрибутов
+    return clean_img_tags(content)
+
+def image_dimensions(path: str) -> Optional[Tuple[int, int]]:
+    """Читает размеры изображения в пикселях из заголовка файла
+    
+    Поддерживаются PNG, GIF, JPEG, WebP и BMP. Возвращает None, если файл
+    не найден или формат не распознан
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(IMAGE_HEADER_SIZE)
+            if header.startswith(b'\xff\xd8'):
+                return _jpeg_dimensions(f)
+    except OSError:
+        return None
+    
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and header[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', header[16:24])
+    elif header[:6] in (b'GIF87a', b'GIF89a'):
+        width, height = struct.unpack('<HH', header[6:10])
+    elif header.startswith(b'BM') and len(header) >= 26:
+        width, height = struct.unpack('<ii', header[18:26])
+        # Высота отрицательна у изображений, записанных сверху вниз
+        height = abs(height)
+    elif header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        chunk = header[12:16]
+        if chunk == b'VP8 ' and len(header) >= 30:
+            width, height = struct.unpack('<HH', header[26:30])
+            width, height = width & 0x3fff, height & 0x3fff
+        elif chunk == b'VP8L' and len(header) >= 25:
+            bits = int.from_bytes(header[21:25], 'little')
+            width, height = (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        elif chunk == b'VP8X' and len(header) >= 30:
+            width = int.from_bytes(header[24:27], 'little') + 1
+            height = int.from_bytes(header[27:30], 'little') + 1
+        else:
+            return None
+    else:
+        return None
+    
+    if width <= 0 or height <= 0:
+        return None
+    return width, height
+
+def _jpeg_dimensions(f) -> Optional[Tuple[int, int]]:
+    """Ищет в JPEG маркер SOF с размерами кадра, не читая файл целиком"""
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return None
+        code = marker[1]
+        # Заполняющие байты 0xff перед маркером
+        while code == 0xff:
+            byte = f.read(1)
+            if not byte:
+                return None
+            code = byte[0]
+        # Маркеры без длины сегмента
+        if code == 0x01 or 0xd0 <= code <= 0xd9:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if length < 2:
+            return None
+        # SOF0-SOF15, кроме DHT (C4), JPG (C8) и DAC (CC)
+        if 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>HH', frame[1:5])
+            return (width, height) if width and height else None
+        f.seek(length - 2, os.SEEK_CUR)
+
+def _attribute_pixels(value: Optional[str]) -> Optional[int]:
+    """Возвращает размер из атрибута width/height в пикселях или None, если он задан иначе"""
+    if value is None:
+        return None
+    match = re.fullmatch(r'\s*(\d+)(?:px)?\s*', value)
+    return int(match.group(1)) if match and int(match.group(1)) > 0 else None
+
+def size_page_images(content: str, page_dir: str) -> str:
+    """Проставляет тегам img размеры по заголовкам скачанных файлов и отложенную загрузку
+    
+    Размеры из разметки сохраняются; если задан только один из них, второй
+    вычисляется по пропорциям изображения. Явные размеры позволяют браузеру
+    разметить страницу до загрузки изображений, а loading="lazy" и decoding="async" -
+    не загружать и не декодировать изображения за пределами экрана
+    """
+    dimensions: Dict[str, Optional[Tuple[int, int]]] = {}
+    
+    def rewrite(tag: HtmlTag) -> None:
+        src = tag.get('src') or ''
+        
+        # Размеры читаем только у локальных копий изображений
+        size = None
+        if src and not urllib.parse.urlsplit(src).scheme and not src.startswith('/'):
+            if src not in dimensions:
+                path = os.path.join(page_dir, *urllib.parse.unquote(src.split('?')[0]).split('/'))
+                dimensions[src] = image_dimensions(path)
+            size = dimensions[src]
+        
+        width = tag.get('width')
+        height = tag.get('height')
+        if size:
+            width_pixels = _attribute_pixels(width)
+            height_pixels = _attribute_pixels(height)
+            if width is None and height is None:
+                width, height = str(size[0]), str(size[1])
+            elif width is None and height_pixels:
+                width = str(max(1, round(height_pixels * size[0] / size[1])))
+            elif height is None and width_pixels:
+                height = str(max(1, round(width_pixels * size[1] / size[0])))
+        
+        # Пересобираем тег: убираем старые значения и добавляем новые после src
+        attributes = [attribute for attribute in tag.attributes
+                      if attribute[0] not in ('width', 'height', 'loading', 'decoding')]
+        added = []
+        if width is not None:
+            added.append(['width', width, '"'])
+        if height is not None:
+            added.append(['height', height, '"'])
+        added += [['loading', 'lazy', '"'], ['decoding', 'async', '"']]
+        position = next((number + 1 for number, attribute in enumerate(attributes) if attribute[0] == 'src'), 0)
+        tag.attributes = attributes[:position] + added + attributes[position:]
+        tag.changed = True
+    
+    return rewrite_tags(content, 'img', rewrite)
+
+def split_url_anchor(url: str) -> Tuple[str, str]:
+    """Приводит URL к каноническому виду и отделяет от него якорь"""
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = (parts.scheme or 'https').lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'https' and netloc.endswith(':443')) or (scheme == 'http' and netloc.endswith(':80')):
+        netloc = netloc.rsplit(':', 1)[0]
+    
+    path = urllib.parse.quote(urllib.parse.unquote(parts.path), safe="/:@!$&'()*+,;=-._~")
+    fragment = parts.fragment
+    anchor = ''
+    
+    # Маршрут из фрагмента переносим в путь: /db/edtdoc#content:1:hdoc -> /db/edtdoc/content/1/hdoc
+    if re.match(ROUTE_FRAGMENT_PATTERN, fragment):
+        route, _, anchor = fragment.partition('#')
+        path = path.rstrip('/') + '/' + route.replace(':', '/')
+    else:
+        anchor = fragment
+    
+    if len(path) > 1:
+        path = path.rstrip('/')
+    parameters = [
+        (name, value) for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not re.match(IGNORED_QUERY_PARAMETER_PATTERN, name, re.IGNORECASE)
+    ]
+    query = urllib.parse.urlencode(sorted(parameters))
+    
+    return urllib.parse.urlunsplit((scheme, netloc, path or '/', query, '')), anchor
+
+def normalize_url(url: str) -> str:
+    """Возвращает канонический URL страницы без якоря"""
+    return split_url_anchor(url)[0]
+
+def resolve_redirects(session: requests.Session, urls: List[str], workers: int = 4) -> Dict[str, str]:
+    """Выясняет, куда перенаправляют адреса страниц, HEAD-запросами в несколько потоков
+    
+    Возвращает словарь: канонический URL -> конечный URL (с якорем, если он есть в перенаправлении)
+    только для адресов, которые перенаправляются на другой документ
+    """
+    def resolve(url: str) -> Tuple[str, Optional[str]]:
+        try:
+            response = session.head(url, allow_redirects=True, timeout=30)
+        except requests.RequestException as e:
+            if args.verbose:
+                print(f"Не удалось проверить перенаправление {url}: {str(e)}")
+            return url, None
+        return url, response.url if response.history else None
+    
+    redirects: Dict[str, str] = {}
+    documents = list(dict.fromkeys(normalize_url(url) for url in urls))
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='redirects') as executor:
+        for url, target in executor.map(resolve, documents):
+            if target and normalize_url(target) != url:
+                redirects[url] = target
+    return redirects
+
+def resolve_document_url(url: str, redirects: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """Возвращает канонический URL документа с учетом перенаправлений и якорь внутри него"""
+    document, anchor = split_url_anchor(url)
+    if redirects and document in redirects:
+        document, target_anchor = split_url_anchor(redirects[document])
+        anchor = target_anchor or anchor
+    return document, anchor
+
+def build_url_index(pages: List[DocPage], redirects: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """Строит индекс: нормализованный URL -> номер сохраненной страницы (page_NNNN)
+    
+    Страницы с одним документом (адреса, отличающиеся якорем, порядком параметров или
+    перенаправляющие на один адрес) получают номер первой из них. Исходные адреса
+    перенаправлений тоже попадают в индекс, чтобы ссылки на них заменялись локальными.
+    """
+    url_index: Dict[str, int] = {}
+    for i, page in enumerate(pages, 1):
+        document = resolve_document_url(page.url, redirects)[0]
+        index = url_index.setdefault(document, i)
+        url_index.setdefault(normalize_url(page.url), index)
+    return url_index
+
+def document_targets(pages: List[DocPage], url_index: Dict[str, int],
+                     redirects: Optional[Dict[str, str]] = None) -> Dict[int, Tuple[int, str]]:
+    """Сопоставляет записям оглавления страницы с их документами: номер страницы -> (номер сохраняемой страницы, якорь)
+    
+    Запись, документ которой уже сохраняется под другим номером, не снимается повторно,
+    а ссылается на общую копию со своим якорем
+    """
+    targets: Dict[int, Tuple[int, str]] = {}
+    for i, page in enumerate(pages, 1):
+        document, anchor = resolve_document_url(page.url, redirects)
+        targets[i] = (url_index.get(document, i), anchor)
+    return targets
+
+def rewrite_internal_links(content: str, url_index: Dict[str, int], base_url: str) -> Tuple[str, List[str]]:
+    """Заменяет ссылки на страницы документации ссылками на локальные копии
+    
+    Возвращает обновленный HTML и список внутренних ссылок, для которых нет локальной копии
+    """
+    base = urllib.parse.urlsplit(base_url)
+    unresolved: List[str] = []
+    
+    def replace_href(match: re.Match) -> str:
+        prefix, href, suffix = match.groups()
+        if not href or href.startswith(('#', 'mailto:', 'javascript:', 'data:')):
+            return match.group(0)
+        # Ссылка уже заменена локальной при предыдущем проходе
+        if re.match(LOCAL_PAGE_LINK_PATTERN, href):
+            return match.group(0)
+        
+        absolute_url = urllib.parse.urljoin(base_url, href)
+        target = urllib.parse.urlsplit(absolute_url)
+        
+        # Внутренними считаем только ссылки на базы документации того же сайта
+        if target.netloc.lower() != base.netloc.lower() or not target.path.startswith('/db/'):
+            return match.group(0)
+        
+        url, anchor = split_url_anchor(absolute_url)
+        index = url_index.get(url)
+        if index is None:
+            unresolved.append(absolute_url)
+            # Оставляем абсолютную ссылку, чтобы она работала хотя бы при наличии сети
+            return f"{prefix}{absolute_url}{suffix}"
+        
+        local_href = f"../page_{index:04d}/page.html"
+        if anchor:
+            local_href += f"#{anchor}"
+        return f"{prefix}{local_href}{suffix}"
+    
+    content = re.sub(LINK_HREF_PATTERN, replace_href, content, flags=re.IGNORECASE)
+    return content, unresolved
+
+def rewrite_page_links(page_dir: str, url_index: Dict[str, int], base_url: str) -> List[str]:
+    """Переписывает ссылки в page.html сохраненной страницы, возвращает неразрешенные ссылки"""
+    html_file = os.path.join(page_dir, 'page.html')
+    if not os.path.exists(html_file):
+        return []
+    
+    with open(html_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    content, unresolved = rewrite_internal_links(content, url_index, base_url)
+    write_file_atomic(html_file, content)
+    
+    return unresolved
+
+def write_unresolved_links_report(unresolved_links: Dict[int, List[str]], output_dir: str = 'out') -> None:
+    """Сохраняет отчет о ссылках, которые не удалось заменить локальными"""
+    report_path = os.path.join(output_dir, UNRESOLVED_LINKS_FILE)
+    lines = [f"page_{index:04d}\t{url}\n" for index in sorted(unresolved_links) for url in unresolved_links[index]]
+    write_file_atomic(report_path, ''.join(lines))
+    total = len(lines)
+    
+    if total:
+        print(f"Не удалось заменить локальными {total} внутренних ссылок, см. {report_path}")
+
+def write_page_size_report(page_sizes: Dict[int, Tuple[int, int]], output_dir: str = 'out') -> None:
+    """Сохраняет отчет о размере HTML страниц до и после обработки"""
+    report_path = os.path.join(output_dir, PAGE_SIZES_FILE)
+    total_original = total_saved = 0
+    lines = ["page\toriginal_bytes\tsaved_bytes\tsaved_percent\n"]
+    for index in sorted(page_sizes):
+        original, saved = page_sizes[index]
+        percent = round(saved * 100 / original, 1) if original else 100.0
+        lines.append(f"page_{index:04d}\t{original}\t{saved}\t{percent}\n")
+        total_original += original
+        total_saved += saved
+    write_file_atomic(report_path, ''.join(lines))
+    
+    if total_original:
+        print(f"Размер HTML страниц: {total_original // 1024} КБ -> {total_saved // 1024} КБ "
+              f"({round(total_saved * 100 / total_original, 1)}%), см. {report_path}")
+
+def extract_document_links(page_dir: str, database_url: str) -> List[Tuple[str, str]]:
+    """Извлекает из сохраненной страницы ссылки на другие страницы той же базы документации
+    
+    database_url - адрес любой страницы базы, например адрес самой сохраненной страницы
+    
+    Возвращает список пар (URL, текст ссылки) в порядке появления в документе
+    """
+    html_file = os.path.join(page_dir, 'page.html')
+    if not os.path.exists(html_file):
+        return []
+    
+    with open(html_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    database = urllib.parse.urlsplit(database_url)
+    # Корень базы: /db/edtdoc/content/123 -> /db/edtdoc
+    database_root = '/'.join(database.path.split('/')[:3])
+    
+    links = []
+    for match in re.finditer(LINK_TAG_PATTERN, content, flags=re.IGNORECASE | re.DOTALL):
+        url = html.unescape(match.group(1))
+        target = urllib.parse.urlsplit(url)
+        if target.netloc.lower() != database.netloc.lower():
+            continue
+        if target.path != database_root and not target.path.startswith(database_root + '/'):
+            continue
+        if not any(keyword in url for keyword in DOC_URL_KEYWORDS):
+            continue
+        
+        title = re.sub(r'\s+', ' ', html.unescape(re.sub(r'<[^>]+>', '', match.group(2)))).strip()
+        links.append((url, title or url))
+    
+    return links
+
+class LinkFrontier:
+    """Очередь ссылок для обхода с дедупликацией по хешу нормализованного URL
+    
+    Хеши хранятся в памяти и при превышении max_memory_hashes сбрасываются
+    во временную базу SQLite, поэтому память не растет на больших базах.
+    """
+    
+    def __init__(self, spill_path: str, max_memory_hashes: int = 100_000) -> None:
+        self.spill_path: str = spill_path
+        self.max_memory_hashes: int = max_memory_hashes
+        self._memory: set = set()
+        self._spill: Optional[sqlite3.Connection] = None
+        self._queue: deque = deque()
+    
+    @staticmethod
+    def _hash(url: str) -> bytes:
+        return hashlib.blake2b(normalize_url(url).encode('utf-8'), digest_size=8).digest()
+    
+    def _seen_on_disk(self, digest: bytes) -> bool:
+        if self._spill is None:
+            return False
+        return self._spill.execute("SELECT 1 FROM seen WHERE hash = ?", (digest,)).fetchone() is not None
+    
+    def _spill_to_disk(self) -> None:
+        if self._spill is None:
+            self._spill = sqlite3.connect(self.spill_path)
+            self._spill.execute("CREATE TABLE IF NOT EXISTS seen (hash BLOB PRIMARY KEY) WITHOUT ROWID")
+        with self._spill:
+            self._spill.executemany("INSERT OR IGNORE INTO seen (hash) VALUES (?)", ((h,) for h in self._memory))
+        self._memory.clear()
+    
+    def add(self, url: str) -> bool:
+        """Отмечает URL как известный, возвращает True, если он встретился впервые"""
+        digest = self._hash(url)
+        if digest in self._memory or self._seen_on_disk(digest):
+            return False
+        self._memory.add(digest)
+        if len(self._memory) >= self.max_memory_hashes:
+            self._spill_to_disk()
+        return True
+    
+    def extend(self, links: List[Tuple[str, str]], depth: int) -> int:
+        """Ставит в очередь новые ссылки, возвращает количество добавленных"""
+        queued = 0
+        for url, title in links:
+            if self.add(url):
+                self._queue.append((url, title, depth))
+                queued += 1
+        return queued
+    
+    def pop(self) -> Optional[Tuple[str, str, int]]:
+        """Возвращает следующую ссылку (URL, заголовок, глубина) или None"""
+        return self._queue.popleft() if self._queue else None
+    
+    def __len__(self) -> int:
+        return len(self._queue)
+    
+    def close(self) -> None:
+        """Закрывает и удаляет временную базу хешей"""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+class CrawlJournal:
+    """Журнал обхода в SQLite: список страниц и состояние каждой для продолжения после сбоя
+    
+    Каждая сохраненная страница фиксируется отдельной транзакцией, поэтому после
+    аварийного завершения в журнале остаются все страницы, записанные до сбоя.
+    Страница считается сохраненной только после атомарной записи page.html.
+    """
+    
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self._db: sqlite3.Connection = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    idx INTEGER PRIMARY KEY,
+                    page TEXT NOT NULL,
+                    depth INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    document_url TEXT,
+                    unresolved TEXT,
+                    original_size INTEGER,
+                    saved_size INTEGER,
+                    error TEXT,
+                    updated REAL
+                )
+            """)
+    
+    def get(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key: str, value: str) -> None:
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    
+    def start(self, pages: List[DocPage]) -> None:
+        """Начинает новый обход: сохраняет список страниц оглавления, прежнее состояние удаляется"""
+        with self._db:
+            self._db.execute("DELETE FROM pages")
+            self._db.executemany(
+                "INSERT INTO pages (idx, page) VALUES (?, ?)",
+                ((index, json.dumps(page.to_list(), ensure_ascii=False)) for index, page in enumerate(pages, 1))
+            )
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(CRAWL_JOURNAL_VERSION),))
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('toc_total', ?)", (str(len(pages)),))
+    
+    def load_pages(self) -> Optional[List[DocPage]]:
+        """Возвращает страницы оглавления из журнала или None, если журнал пуст или другой версии"""
+        restored = self.load()
+        if restored is None:
+            return None
+        pages, toc_total, _ = restored
+        return pages[:toc_total]
+    
+    def load(self) -> Optional[Tuple[List[DocPage], int, Dict[int, int]]]:
+        """Возвращает все страницы (включая найденные по ссылкам), число страниц оглавления и глубины"""
+        if self.get('version') != str(CRAWL_JOURNAL_VERSION) or self.get('toc_total') is None:
+            return None
+        pages: List[DocPage] = []
+        depths: Dict[int, int] = {}
+        for index, page, depth in self._db.execute("SELECT idx, page, depth FROM pages ORDER BY idx"):
+            pages.append(DocPage.from_list(json.loads(page)))
+            if depth:
+                depths[index] = depth
+        if not pages:
+            return None
+        return pages, int(self.get('toc_total')), depths
+    
+    def add_page(self, index: int, page: DocPage, depth: int) -> None:
+        """Добавляет страницу, найденную по ссылкам"""
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO pages (idx, page, depth) VALUES (?, ?, ?)",
+                             (index, json.dumps(page.to_list(), ensure_ascii=False), depth))
+    
+    def record(self, captured: CapturedPage) -> None:
+        """Фиксирует результат обработки страницы"""
+        with self._db:
+            if captured.error is None:
+                original_size, saved_size = captured.sizes or (None, None)
+                self._db.execute(
+                    "UPDATE pages SET state = 'done', document_url = ?, unresolved = ?, original_size = ?, "
+                    "saved_size = ?, error = NULL, updated = ? WHERE idx = ?",
+                    (captured.document_url, json.dumps(captured.unresolved), original_size, saved_size,
+                     time.time(), captured.index)
+                )
+            else:
+                self._db.execute("UPDATE pages SET state = 'failed', error = ?, updated = ? WHERE idx = ?",
+                                 (str(captured.error), time.time(), captured.index))
+    
+    def record_failure(self, index: int, error: Exception) -> None:
+        with self._db:
+            self._db.execute("UPDATE pages SET state = 'failed', error = ?, updated = ? WHERE idx = ?",
+                             (str(error), time.time(), index))
+    
+    def reset(self, indexes: Set[int]) -> None:
+        """Помечает страницы несохраненными, чтобы они были загружены заново"""
+        with self._db:
+            self._db.executemany("UPDATE pages SET state = 'pending', error = NULL WHERE idx = ?",
+                                 ((index,) for index in sorted(indexes)))
+    
+    def completed(self, output_dir: str) -> Dict[int, Tuple[str, List[str], Optional[Tuple[int, int]]]]:
+        """Сохраненные страницы: номер -> (URL документа, неразрешенные ссылки, размеры)
+        
+        Страницы, у которых нет page.html на диске, считаются несохраненными
+        """
+        completed = {}
+        rows = self._db.execute(
+            "SELECT idx, document_url, unresolved, original_size, saved_size FROM pages WHERE state = 'done'"
+        )
+        for index, document_url, unresolved, original_size, saved_size in rows:
+            if not os.path.exists(os.path.join(output_dir, f"page_{index:04d}", 'page.html')):
+                continue
+            sizes = (original_size, saved_size) if original_size is not None else None
+            completed[index] = (document_url, json.loads(unresolved or '[]'), sizes)
+        return completed
+    
+    def close(self) -> None:
+        self._db.close()
+
+def read_page_metadata(page_dir: str) -> Dict[str, str]:
+    """Читает metadata.txt сохраненной страницы в словарь (Title, Level, URL, Document URL)"""
+    metadata: Dict[str, str] = {}
+    metadata_file = os.path.join(page_dir, 'metadata.txt')
+    if not os.path.exists(metadata_file):
+        return metadata
+    with open(metadata_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            key, separator, value = line.rstrip('\n').partition(': ')
+            if separator:
+                metadata[key] = value
+    return metadata
+
+def list_saved_pages(output_dir: str = 'out') -> List[Tuple[int, str]]:
+    """Возвращает номера и каталоги сохраненных страниц по порядку"""
+    saved = []
+    for name in os.listdir(output_dir):
+        match = re.match(r'^page_(\d+)$', name)
+        if match and os.path.isdir(os.path.join(output_dir, name)):
+            saved.append((int(match.group(1)), os.path.join(output_dir, name)))
+    return sorted(saved)
+
+def reprocess_page(page_dir: str) -> Optional[Tuple[Tuple[int, int], List[str]]]:
+    """Повторяет обработку страницы по сохраненному source.html.gz и перезаписывает page.html
+    
+    Работает в процессе пула команды reprocess. Возвращает размеры до и после обработки
+    и неразрешенные ссылки или None, если исходный HTML страницы не сохранен
+    """
+    source_file = os.path.join(page_dir, PAGE_SOURCE_FILE)
+    if not os.path.exists(source_file):
+        return None
+    with gzip.open(source_file, 'rt', encoding='utf-8') as f:
+        content = f.read()
+    metadata = read_page_metadata(page_dir)
+    document_url = metadata.get('Document URL') or metadata.get('URL', '')
+    
+    original_size = len(content.encode('utf-8'))
+    content, unresolved = transform_page_html(content, page_dir, document_url, _worker_url_index, _worker_assets)
+    
+    write_file_atomic(os.path.join(page_dir, 'page.html'), content)
+    return (original_size, len(content.encode('utf-8'))), unresolved
+
+def reprocess_output(output_dir: str = 'out', processes: Optional[int] = None) -> None:
+    """Повторяет обработку HTML всех сохраненных страниц в пуле процессов, без браузера и сети"""
+    saved = list_saved_pages(output_dir)
+    if not saved:
+        print(f"В каталоге {output_dir} нет сохраненных страниц")
+        return
+    
+    # Индекс ссылок строится по тем же номерам страниц, что и при загрузке
+    url_index: Dict[str, int] = {}
+    for index, page_dir in saved:
+        url = read_page_metadata(page_dir).get('URL')
+        if url:
+            url_index.setdefault(normalize_url(url), index)
+    # Адреса, перенаправляющие на сохраненные документы, берутся из журнала загрузки
+    journal_path = os.path.join(output_dir, CRAWL_JOURNAL_FILE)
+    if os.path.exists(journal_path):
+        journal = CrawlJournal(journal_path)
+        redirects = json.loads(journal.get('redirects') or '{}')
+        journal.close()
+        for source, target in redirects.items():
+            index = url_index.get(normalize_url(target))
+            if index is not None:
+                url_index.setdefault(source, index)
+    assets = load_assets_index(output_dir)
+    
+    processes = processes or os.cpu_count() or 1
+    print(f"Повторная обработка {len(saved)} страниц (процессов: {processes})...")
+    unresolved_links: Dict[int, List[str]] = {}
+    page_sizes: Dict[int, Tuple[int, int]] = {}
+    skipped = 0
+    with ProcessPoolExecutor(processes, initializer=_init_transform_worker,
+                             initargs=(args, url_index, assets)) as executor:
+        page_dirs = [page_dir for _, page_dir in saved]
+        chunksize = max(1, len(page_dirs) // (processes * 8))
+        for (index, page_dir), result in zip(saved, executor.map(reprocess_page, page_dirs, chunksize=chunksize)):
+            if result is None:
+                skipped += 1
+                if args.verbose:
+                    print(f"Нет исходного HTML ({PAGE_SOURCE_FILE}), пропущена {page_dir}")
+                continue
+            page_sizes[index], unresolved = result
+            if unresolved:
+                unresolved_links[index] = unresolved
+    
+    print(f"Обработано страниц: {len(page_sizes)}")
+    if skipped:
+        print(f"Пропущено страниц без {PAGE_SOURCE_FILE}: {skipped}")
+    write_unresolved_links_report(unresolved_links, output_dir)
+    write_page_size_report(page_sizes, output_dir)
+
+def reprocess_main(argv: List[str]) -> None:
+    """Команда reprocess: повторная обработка сохраненных страниц без браузера"""
+    global args
+    
+    parser = argparse.ArgumentParser(
+        prog='main.py reprocess',
+        description="""
+Повторная обработка уже сохраненных страниц: HTML каждой страницы заново
+строится из source.html.gz с текущими правилами очистки изображений,
+ссылок и разметки. Браузер и авторизация не нужны.
+
+Пример:
+  python main.py reprocess --output out --sanitize strict --minify
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--output', default='out', help='Каталог с сохраненными страницами (по умолчанию out)')
+    parser.add_argument('--processes', type=int, help='Количество процессов обработки (по умолчанию - по числу ядер)')
+    parser.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
+    add_transform_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    started = time.time()
+    reprocess_output(args.output, args.processes)
+    print(f"Готово за {time.time() - started:.1f} с")
+
+class _PageTextParser(_OffsetHTMLParser):
+    """Собирает текст страницы и ее блоков (абзацев, пунктов списков, таблиц) для поиска повторов
+    
+    Текст относится к ближайшему открытому блоку из DEDUP_BLOCK_ELEMENTS, таблица
+    считается одним блоком целиком. Для блока запоминается смещение открывающего тега,
+    чтобы при необходимости пометить его в HTML
+    """
+    
+    def __init__(self, content: str) -> None:
+        super().__init__(content, convert_charrefs=True)
+        self.text: List[str] = []
+        # Блоки: [тег, смещение открывающего тега, части текста]
+        self.blocks: List[list] = []
+        self._stack: List[int] = []
+        self._table_depth = 0
+        self._skip_depth = 0
+    
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+            return
+        if tag not in DEDUP_BLOCK_ELEMENTS:
+            return
+        if tag == 'table':
+            self._table_depth += 1
+            if self._table_depth > 1:
+                return
+        elif self._table_depth:
+            return
+        self.blocks.append([tag, self._offset(), []])
+        self._stack.append(len(self.blocks) - 1)
+    
+    def handle_endtag(self, tag: str) -> None:
+        if tag in ('script', 'style'):
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if tag == 'table' and self._table_depth:
+            self._table_depth -= 1
+            if self._table_depth:
+                return
+        elif self._table_depth:
+            return
+        # Незакрытые блоки внутри закрываемого считаются закрытыми
+        for position in range(len(self._stack) - 1, -1, -1):
+            if self.blocks[self._stack[position]][0] == tag:
+                del self._stack[position:]
+                break
+    
+    def handle_data(self, data: str) -> None:
+        if self._skip_depth:
+            return
+        self.text.append(data)
+        if self._stack:
+            self.blocks[self._stack[-1]][2].append(data)
+
+def text_words(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+def minhash_signature(hashes: List[int], size: int) -> Optional[Tuple[int, ...]]:
+    """MinHash-подпись множества 64-битных хэшей одной перестановкой с разбиением на size корзин
+    
+    Каждый хэш попадает в корзину по остатку от деления, в корзине остается наименьший.
+    Пустые корзины заполняются значением ближайшей непустой справа с поправкой на расстояние,
+    поэтому доля совпадающих позиций двух подписей оценивает сходство Жаккара множеств.
+    Вычисление линейно по числу хэшей
+    """
+    bins: List[Optional[int]] = [None] * size
+    for value in hashes:
+        position = value % size
+        value //= size
+        current = bins[position]
+        if current is None or value < current:
+            bins[position] = value
+    if all(value is None for value in bins):
+        return None
+    
+    signature = []
+    for position in range(size):
+        distance = 0
+        while bins[(position + distance) % size] is None:
+            distance += 1
+        signature.append(bins[(position + distance) % size] * size + distance)
+    return tuple(signature)
+
+def signature_similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+def analyze_page(page_dir: str) -> Optional[dict]:
+    """Вычисляет MinHash-подпись текста страницы и хэши ее блоков (выполняется в процессах пула)"""
+    html_file = os.path.join(page_dir, 'page.html')
+    if not os.path.exists(html_file):
+        return None
+    with open(html_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    parser = _PageTextParser(content)
+    parser.feed(content)
+    parser.close()
+    
+    # Шинглы - последовательности из DEDUP_SHINGLE_WORDS слов
+    words = text_words(' '.join(parser.text))
+    shingle_size = min(DEDUP_SHINGLE_WORDS, len(words))
+    hashes = [
+        int.from_bytes(hashlib.blake2b(' '.join(words[i:i + shingle_size]).encode('utf-8'), digest_size=8).digest(), 'big')
+        for i in range(len(words) - shingle_size + 1)
+    ] if words else []
+    
+    blocks = []
+    for tag, offset, parts in parser.blocks:
+        block_words = text_words(' '.join(parts))
+        if len(block_words) < DEDUP_MIN_BLOCK_WORDS:
+            continue
+        digest = hashlib.blake2b(' '.join(block_words).encode('utf-8'), digest_size=8).hexdigest()
+        excerpt = ' '.join(' '.join(parts).split())[:200]
+        blocks.append((digest, len(block_words), excerpt, tag, offset))
+    
+    return {
+        'words': len(words),
+        'signature': minhash_signature(hashes, DEDUP_SIGNATURE_SIZE),
+        'blocks': blocks,
+    }
+
+def find_near_duplicates(signatures: Dict[int, Tuple[int, ...]], threshold: float,
+                         bands: int = DEDUP_BANDS) -> Dict[int, Tuple[int, float]]:
+    """Группирует страницы с похожими подписями через LSH, возвращает дубль -> (основная страница, сходство)
+    
+    Подпись делится на bands полос; страницы с одинаковой полосой попадают в одну корзину
+    и сравниваются с первой страницей корзины. Страницы со сходством не ниже threshold
+    объединяются в группы. Дубль относится к основной странице своей группы со сходством
+    не ниже threshold, основные страницы выбираются по возрастанию номера.
+    Число сравнений в LSH линейно по числу страниц
+    """
+    parent: Dict[int, int] = {index: index for index in signatures}
+    
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+    
+    rows = DEDUP_SIGNATURE_SIZE // bands
+    for band in range(bands):
+        buckets: Dict[Tuple[int, ...], int] = {}
+        for index in sorted(signatures):
+            key = signatures[index][band * rows:(band + 1) * rows]
+            first = buckets.setdefault(key, index)
+            if first == index or find(first) == find(index):
+                continue
+            if signature_similarity(signatures[first], signatures[index]) >= threshold:
+                parent[max(find(first), find(index))] = min(find(first), find(index))
+    
+    # Объединение транзитивно, поэтому внутри группы страница считается дублем первой
+    # основной страницы со сходством не ниже threshold, иначе сама становится основной
+    members: Dict[int, List[int]] = {}
+    for index in sorted(signatures):
+        members.setdefault(find(index), []).append(index)
+    duplicates = {}
+    for group in members.values():
+        originals: List[int] = []
+        for index in group:
+            for original in originals:
+                similarity = signature_similarity(signatures[original], signatures[index])
+                if similarity >= threshold:
+                    duplicates[index] = (original, round(similarity, 3))
+                    break
+            else:
+                originals.append(index)
+    return duplicates
+
+def mark_page_duplicates(page_dir: str, duplicate_of: Optional[int], blocks: List[Tuple[str, str, int]]) -> None:
+    """Записывает пометки для последующих выгрузок: Duplicate Of в metadata.txt
+    и атрибут data-boilerplate у повторяющихся блоков page.html (прежние пометки снимаются)
+    """
+    metadata_file = os.path.join(page_dir, 'metadata.txt')
+    if os.path.exists(metadata_file):
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if not line.startswith('Duplicate Of: ')]
+        if duplicate_of is not None:
+            lines.append(f"Duplicate Of: page_{duplicate_of:04d}\n")
+        metadata = ''.join(lines)
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            if f.read() != metadata:
+                write_file_atomic(metadata_file, metadata)
+    
+    html_file = os.path.join(page_dir, 'page.html')
+    if not os.path.exists(html_file):
+        return
+    with open(html_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    # Пометки прошлого запуска снимаются: блоки могли перестать быть повторяющимися
+    # при другом пороге. Смещения блоков вычислены по исходному тексту с пометками
+    removed = [match.span(1) for match in re.finditer(r'<[a-zA-Z][a-zA-Z0-9]*(\s+data-boilerplate="[^"<>]*")', content)]
+    if not blocks and not removed:
+        return
+    parts = []
+    position = 0
+    marker = 0
+    for digest, tag, offset in sorted(blocks, key=lambda block: block[2]):
+        tag_end = offset + 1 + len(tag)
+        if content[offset:tag_end].lower() != f"<{tag}":
+            continue
+        while marker < len(removed) and removed[marker][0] < tag_end:
+            parts.append(content[position:removed[marker][0]])
+            position = removed[marker][1]
+            marker += 1
+        parts.append(content[position:tag_end])
+        parts.append(f' data-boilerplate="{digest}"')
+        position = tag_end
+    for start, end in removed[marker:]:
+        parts.append(content[position:start])
+        position = end
+    parts.append(content[position:])
+    updated = ''.join(parts)
+    if updated != content:
+        write_file_atomic(html_file, updated)
+
+def analyze_output(output_dir: str = 'out', threshold: float = 0.8, min_block_pages: int = 3,
+                   markers: bool = False, processes: Optional[int] = None) -> None:
+    """Ищет почти одинаковые страницы и повторяющиеся блоки, пишет отчеты duplicates.txt и duplicates.json"""
+    saved = list_saved_pages(output_dir)
+    if not saved:
+        print(f"В каталоге {output_dir} нет сохраненных страниц")
+        return
+    
+    processes = processes or os.cpu_count() or 1
+    print(f"Анализ {len(saved)} страниц (процессов: {processes})...")
+    titles: Dict[int, str] = {}
+    signatures: Dict[int, Tuple[int, ...]] = {}
+    page_blocks: Dict[int, list] = {}
+    block_pages: Dict[str, List[int]] = {}
+    block_info: Dict[str, Tuple[int, str]] = {}
+    with ProcessPoolExecutor(processes) as executor:
+        page_dirs = [page_dir for _, page_dir in saved]
+        chunksize = max(1, len(page_dirs) // (processes * 8))
+        for (index, page_dir), result in zip(saved, executor.map(analyze_page, page_dirs, chunksize=chunksize)):
+            if result is None:
+                continue
+            titles[index] = read_page_metadata(page_dir).get('Title', '')
+            if result['signature'] is not None:
+                signatures[index] = result['signature']
+            page_blocks[index] = result['blocks']
+            for digest, words, excerpt, _, _ in result['blocks']:
+                pages = block_pages.setdefault(digest, [])
+                if not pages or pages[-1] != index:
+                    pages.append(index)
+                block_info.setdefault(digest, (words, excerpt))
+    
+    duplicates = find_near_duplicates(signatures, threshold)
+    repeated = {digest: pages for digest, pages in block_pages.items() if len(pages) >= min_block_pages}
+    
+    # Группы почти одинаковых страниц по основной странице
+    groups: Dict[int, List[Tuple[int, float]]] = {}
+    for index, (original, similarity) in duplicates.items():
+        groups.setdefault(original, []).append((index, similarity))
+    
+    lines = [f"Почти одинаковые страницы (сходство не ниже {threshold}): групп {len(groups)}, дублей {len(duplicates)}\n"]
+    for original in sorted(groups, key=lambda index: (-len(groups[index]), index)):
+        lines.append(f"\npage_{original:04d}\t{titles.get(original, '')}\n")
+        for index, similarity in groups[original]:
+            lines.append(f"  page_{index:04d}\t{similarity}\t{titles.get(index, '')}\n")
+    
+    lines.append(f"\nПовторяющиеся блоки (не меньше чем на {min_block_pages} страницах): {len(repeated)}\n")
+    ordered_blocks = sorted(repeated, key=lambda digest: -len(repeated[digest]) * block_info[digest][0])
+    for digest in ordered_blocks:
+        words, excerpt = block_info[digest]
+        pages = repeated[digest]
+        listed = ', '.join(f"page_{index:04d}" for index in pages[:10])
+        lines.append(f"\n{digest}\tстраниц {len(pages)}, слов {words}\n  {excerpt}\n  {listed}{' ...' if len(pages) > 10 else ''}\n")
+    write_file_atomic(os.path.join(output_dir, DEDUP_REPORT_FILE), ''.join(lines))
+    
+    report = {
+        'threshold': threshold,
+        'pages': [{'page': index, 'duplicate_of': original, 'similarity': similarity}
+                  for index, (original, similarity) in sorted(duplicates.items())],
+        'blocks': [{'hash': digest, 'words': block_info[digest][0], 'text': block_info[digest][1], 'pages': repeated[digest]}
+                   for digest in ordered_blocks],
+    }
+    write_file_atomic(os.path.join(output_dir, DEDUP_INDEX_FILE), json.dumps(report, ensure_ascii=False, indent=1))
+    
+    boilerplate_words = sum(block_info[digest][0] * (len(pages) - 1) for digest, pages in repeated.items())
+    print(f"Почти одинаковых страниц: {len(duplicates)} в {len(groups)} группах")
+    print(f"Повторяющихся блоков: {len(repeated)}, повторных слов в них: {boilerplate_words}")
+    print(f"Отчет: {os.path.join(output_dir, DEDUP_REPORT_FILE)}, для выгрузок: {os.path.join(output_dir, DEDUP_INDEX_FILE)}")
+    
+    if markers:
+        marked = 0
+        for index, page_dir in saved:
+            if index not in page_blocks:
+                continue
+            blocks = [(digest, tag, offset) for digest, _, _, tag, offset in page_blocks[index] if digest in repeated]
+            mark_page_duplicates(page_dir, duplicates.get(index, (None,))[0], blocks)
+            marked += len(blocks)
+        print(f"Помечено повторяющихся блоков в page.html: {marked}")
+
+def analyze_main(argv: List[str]) -> None:
+    """Команда analyze: поиск почти одинаковых страниц и повторяющихся блоков"""
+    global args
+    
+    parser = argparse.ArgumentParser(
+        prog='main.py analyze',
+        description="""
+Поиск почти одинаковых страниц и повторяющихся блоков текста (стандартные
+предупреждения, примечания, таблицы) в сохраненной документации. Страницы
+сравниваются по MinHash-подписям шинглов текста с поиском кандидатов через LSH,
+блоки - по хэшу нормализованного текста; время работы линейно по числу страниц.
+Результат - отчет duplicates.txt и duplicates.json для последующих выгрузок.
+
+Пример:
+  python main.py analyze --output out --threshold 0.85 --markers
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--output', default='out', help='Каталог с сохраненными страницами (по умолчанию out)')
+    parser.add_argument('--threshold', type=float, default=0.8, help='Минимальное сходство почти одинаковых страниц от 0 до 1 (по умолчанию 0.8)')
+    parser.add_argument('--min-block-pages', type=int, default=3, help='Блок считается повторяющимся, если встречается на N страницах (по умолчанию 3)')
+    parser.add_argument('--markers', action='store_true',
+                        help='Пометить дубли строкой Duplicate Of в metadata.txt, а повторяющиеся блоки - атрибутом data-boilerplate в page.html')
+    parser.add_argument('--processes', type=int, help='Количество процессов анализа (по умолчанию - по числу ядер)')
+    parser.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
+    args = parser.parse_args(argv)
+    
+    started = time.time()
+    analyze_output(args.output, args.threshold, args.min_block_pages, args.markers, args.processes)
+    print(f"Готово за {time.time() - started:.1f} с")
+
+def pack_output(output_dir: str, pack_path: str) -> Tuple[int, int, int]:
+    """Упаковывает сохраненную документацию в один файл SQLite
+    
+    Каждый файл каталога записывается по относительному пути, содержимое хранится
+    в таблице blobs по хэшу, поэтому одинаковые изображения (images/ и img/ страниц,
+    повторы между страницами) занимают место один раз. Записи вставляются пачками
+    по PACK_BATCH_SIZE файлов в одной транзакции. Служебные файлы (журнал и очередь
+    ссылок) не упаковываются. Возвращает число файлов, уникальных блоков и их объем в байтах.
+    """
+    temp_path = f"{pack_path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    directory = os.path.dirname(pack_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    db = sqlite3.connect(temp_path)
+    # Файл собирается целиком и подменяется в конце, журнал транзакций не нужен
+    db.execute("PRAGMA journal_mode = OFF")
+    db.execute("PRAGMA synchronous = OFF")
+    with db:
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE blobs (hash TEXT PRIMARY KEY, size INTEGER NOT NULL, data BLOB NOT NULL)")
+        db.execute("CREATE TABLE files (path TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        db.execute("""
+            CREATE TABLE pages (
+                idx INTEGER PRIMARY KEY,
+                title TEXT,
+                level INTEGER,
+                url TEXT,
+                document_url TEXT
+            )
+        """)
+    
+    files: List[Tuple[str, str]] = []
+    blobs: Dict[str, bytes] = {}
+    seen: set = set()
+    total_files = 0
+    total_bytes = 0
+    
+    def flush() -> None:
+        with db:
+            db.executemany("INSERT OR IGNORE INTO blobs (hash, size, data) VALUES (?, ?, ?)",
+                           ((digest, len(data), data) for digest, data in blobs.items()))
+            db.executemany("INSERT INTO files (path, hash) VALUES (?, ?)", files)
+        files.clear()
+        blobs.clear()
+    
+    for root, dirnames, filenames in os.walk(output_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.startswith('.'):
+                continue
+            file_path = os.path.join(root, filename)
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if digest not in seen:
+                seen.add(digest)
+                blobs[digest] = data
+                total_bytes += len(data)
+            files.append((os.path.relpath(file_path, output_dir).replace(os.sep, '/'), digest))
+            total_files += 1
+            if len(files) >= PACK_BATCH_SIZE:
+                flush()
+    flush()
+    
+    pages = []
+    for index, page_dir in list_saved_pages(output_dir):
+        metadata = read_page_metadata(page_dir)
+        level = metadata.get('Level', '')
+        pages.append((index, metadata.get('Title'), int(level) if level.isdigit() else None,
+                      metadata.get('URL'), metadata.get('Document URL')))
+    with db:
+        db.executemany("INSERT INTO pages (idx, title, level, url, document_url) VALUES (?, ?, ?, ?, ?)", pages)
+        db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ('format', PACK_FORMAT),
+            ('version', str(PACK_VERSION)),
+            ('created', str(time.time())),
+        ])
+    db.close()
+    os.replace(temp_path, pack_path)
+    return total_files, len(seen), total_bytes
+
+class PackReader:
+    """Чтение файлов из пакета документации, созданного pack_output
+    
+    Каждый поток открывает собственное соединение только для чтения с отображением
+    файла в память (PRAGMA mmap_size), поэтому чтение не копирует страницы SQLite
+    через системные вызовы и не блокирует другие потоки.
+    """
+    
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self._local = threading.local()
+        db = self._connection()
+        meta = dict(db.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get('format') != PACK_FORMAT or meta.get('version') != str(PACK_VERSION):
+            raise ValueError(f"{path} не является пакетом документации поддерживаемой версии")
+    
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            uri = f"file:{urllib.parse.quote(os.path.abspath(self.path))}?mode=ro"
+            db = sqlite3.connect(uri, uri=True)
+            db.execute(f"PRAGMA mmap_size = {PACK_MMAP_SIZE}")
+            self._local.db = db
+        return db
+    
+    def read(self, path: str) -> Optional[Tuple[str, bytes]]:
+        """Возвращает хэш и содержимое файла по относительному пути или None, если его нет"""
+        return self._connection().execute(
+            "SELECT blobs.hash, blobs.data FROM files JOIN blobs ON blobs.hash = files.hash WHERE files.path = ?",
+            (path,)
+        ).fetchone()
+
+class _PackRequestHandler(BaseHTTPRequestHandler):
+    """Отдает файлы пакета документации как обычный каталог: / - оглавление index.html"""
+    
+    def do_GET(self) -> None:
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip('/')
+        if not path or path.endswith('/'):
+            path += 'index.html'
+        
+        found = self.server.pack.read(path)
+        if found is None:
+            self.send_error(404)
+            return
+        digest, data = found
+        
+        etag = f'"{digest}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/'):
+            content_type += '; charset=utf-8'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format: str, *log_args) -> None:
+        if args.verbose:
+            super().log_message(format, *log_args)
+
+def pack_main(argv: List[str]) -> None:
+    """Команда pack: упаковка сохраненной документации в один файл"""
+    global args
+    
+    parser = argparse.ArgumentParser(
+        prog='main.py pack',
+        description="""
+Упаковка сохраненной документации (страницы, метаданные, изображения и общие
+ресурсы) в один файл SQLite. Одинаковые файлы хранятся один раз. Такой файл
+копируется и синхронизируется как единое целое, а просматривается командой serve.
+
+Пример:
+  python main.py pack --output out --file edtdoc.itspack
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--output', default='out', help='Каталог с сохраненными страницами (по умолчанию out)')
+    parser.add_argument('--file', required=True, help='Файл пакета документации')
+    parser.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
+    args = parser.parse_args(argv)
+    
+    started = time.time()
+    files, blobs, size = pack_output(args.output, args.file)
+    print(f"Упаковано файлов: {files} (уникальных: {blobs}, {size // 1024} КБ) в {args.file} за {time.time() - started:.1f} с")
+
+def serve_main(argv: List[str]) -> None:
+    """Команда serve: просмотр пакета документации через локальный HTTP-сервер"""
+    global args
+    
+    parser = argparse.ArgumentParser(
+        prog='main.py serve',
+        description="""
+Локальный HTTP-сервер для просмотра пакета документации без распаковки.
+
+Пример:
+  python main.py serve edtdoc.itspack --port 8000
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('file', help='Файл пакета документации (создается командой pack или параметром --pack)')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес сервера (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Порт сервера (по умолчанию 8000)')
+    parser.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
+    args = parser.parse_args(argv)
+    
+    server = ThreadingHTTPServer((args.host, args.port), _PackRequestHandler)
+    server.daemon_threads = True
+    server.pack = PackReader(args.file)
+    print(f"Документация доступна на http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def split_delta_chunks(data: bytes) -> List[bytes]:
+    """Делит содержимое на фрагменты для дельта-сжатия: строки, а внутри строк - по концам тегов
+    
+    Деление по тегам нужно для страниц, сжатых в одну строку (--minify)
+    """
+    return [chunk for chunk in re.split(rb'(?<=[>\n])', data) if chunk]
+
+def encode_delta(base: bytes, data: bytes) -> bytes:
+    """Кодирует data как набор операций над фрагментами base: копирование диапазона или вставка
+    
+    Совпадения ищутся за линейное время: сначала продолжением предыдущего совпадения,
+    затем по индексу пар соседних фрагментов base
+    """
+    base_chunks = split_delta_chunks(base)
+    chunks = split_delta_chunks(data)
+    positions: Dict[Tuple[bytes, bytes], int] = {}
+    for i in range(len(base_chunks) - 1):
+        positions.setdefault((base_chunks[i], base_chunks[i + 1]), i)
+    
+    parts = []
+    inserted: List[bytes] = []
+    
+    def flush_inserted() -> None:
+        if inserted:
+            text = b''.join(inserted)
+            parts.append(b'I' + struct.pack('>I', len(text)) + text)
+            inserted.clear()
+    
+    j = 0
+    expected = 0
+    while j < len(chunks):
+        if expected < len(base_chunks) and base_chunks[expected] == chunks[j]:
+            start = expected
+        elif j + 1 < len(chunks):
+            start = positions.get((chunks[j], chunks[j + 1]))
+        else:
+            start = None
+        if start is None:
+            inserted.append(chunks[j])
+            j += 1
+            continue
+        length = 0
+        while (start + length < len(base_chunks) and j + length < len(chunks)
+               and base_chunks[start + length] == chunks[j + length]):
+            length += 1
+        flush_inserted()
+        parts.append(b'C' + struct.pack('>II', start, length))
+        j += length
+        expected = start + length
+    flush_inserted()
+    return b''.join(parts)
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Восстанавливает содержимое по base и результату encode_delta"""
+    base_chunks = split_delta_chunks(base)
+    parts = []
+    position = 0
+    while position < len(delta):
+        operation = delta[position:position + 1]
+        if operation == b'C':
+            start, count = struct.unpack('>II', delta[position + 1:position + 9])
+            parts.extend(base_chunks[start:start + count])
+            position += 9
+        elif operation == b'I':
+            length = struct.unpack('>I', delta[position + 1:position + 5])[0]
+            parts.append(delta[position + 5:position + 5 + length])
+            position += 5 + length
+        else:
+            raise ValueError(f"Поврежденная дельта: неизвестная операция {operation!r}")
+    return b''.join(parts)
+
+class HistoryStore:
+    """Хранилище истории снимков документации в SQLite
+    
+    Каждая загрузка, добавленная commit, становится версией. Содержимое файлов хранится
+    в таблице blobs один раз по хэшу и сжимается zlib; измененные текстовые файлы
+    (страницы, метаданные, стили) при delta хранятся как разница с файлом по тому же
+    пути в предыдущей версии, если так получается меньше. Длина цепочки дельт
+    ограничена HISTORY_MAX_DELTA_CHAIN. Список файлов версии (путь и хэш) тоже хранится
+    как блок, поэтому объем хранилища растет с объемом изменений, а не с числом версий.
+    """
+    
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self._db: sqlite3.Connection = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    base TEXT,
+                    depth INTEGER NOT NULL DEFAULT 0,
+                    data BLOB NOT NULL
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS versions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    label TEXT,
+                    created REAL NOT NULL,
+                    manifest TEXT NOT NULL,
+                    files INTEGER NOT NULL,
+                    size INTEGER NOT NULL
+                )
+            """)
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+            if row is None:
+                self._db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                    ('format', HISTORY_FORMAT),
+                    ('version', str(HISTORY_VERSION)),
+                ])
+            elif row[0] != HISTORY_FORMAT:
+                raise ValueError(f"{path} не является хранилищем истории документации")
+    
+    def close(self) -> None:
+        self._db.close()
+    
+    def _store(self, data: bytes, base_hash: Optional[str] = None) -> Tuple[str, int]:
+        """Сохраняет содержимое, если его еще нет; возвращает хэш и число добавленных байт"""
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone():
+            return digest, 0
+        
+        stored = zlib.compress(data, 6)
+        base, depth = None, 0
+        if base_hash is not None:
+            row = self._db.execute("SELECT depth FROM blobs WHERE hash = ?", (base_hash,)).fetchone()
+            if row is not None and row[0] < HISTORY_MAX_DELTA_CHAIN:
+                delta = zlib.compress(encode_delta(self.read(base_hash), data), 6)
+                if len(delta) < len(stored):
+                    stored, base, depth = delta, base_hash, row[0] + 1
+        
+        self._db.execute("INSERT INTO blobs (hash, size, base, depth, data) VALUES (?, ?, ?, ?, ?)",
+                         (digest, len(data), base, depth, stored))
+        return digest, len(stored)
+    
+    def read(self, digest: str) -> bytes:
+        """Возвращает содержимое блока, восстанавливая цепочку дельт"""
+        chain = []
+        while True:
+            row = self._db.execute("SELECT base, data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                raise KeyError(digest)
+            base, data = row
+            chain.append(zlib.decompress(data))
+            if base is None:
+                break
+            digest = base
+        content = chain.pop()
+        while chain:
+            content = apply_delta(content, chain.pop())
+        return content
+    
+    def commit(self, output_dir: str, label: Optional[str] = None, delta: bool = True) -> Tuple[int, int, int]:
+        """Добавляет содержимое каталога как новую версию
+        
+        Служебные файлы (журнал и очередь ссылок) не сохраняются. Возвращает номер версии,
+        число файлов и объем в байтах, добавленный в хранилище
+        """
+        latest = self.latest()
+        previous = self.files(latest) if latest is not None and delta else {}
+        manifest: Dict[str, str] = {}
+        added = 0
+        total_size = 0
+        with self._db:
+            for root, dirnames, filenames in os.walk(output_dir):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.startswith('.'):
+                        continue
+                    file_path = os.path.join(root, filename)
+                    relative_path = os.path.relpath(file_path, output_dir).replace(os.sep, '/')
+                    with open(file_path, 'rb') as f:
+                        data = f.read()
+                    base = previous.get(relative_path) if filename.endswith(HISTORY_DELTA_EXTENSIONS) else None
+                    digest, size = self._store(data, base)
+                    manifest[relative_path] = digest
+                    added += size
+                    total_size += len(data)
+            
+            # Список файлов - тоже блок, при малых изменениях хранится как дельта к предыдущему
+            manifest_data = ''.join(f"{digest} {path}\n" for path, digest in manifest.items()).encode('utf-8')
+            previous_manifest = self._manifest_hash(latest) if latest is not None and delta else None
+            manifest_hash, size = self._store(manifest_data, previous_manifest)
+            added += size
+            cursor = self._db.execute(
+                "INSERT INTO versions (label, created, manifest, files, size) VALUES (?, ?, ?, ?, ?)",
+                (label, time.time(), manifest_hash, len(manifest), total_size)
+            )
+        return cursor.lastrowid, len(manifest), added
+    
+    def versions(self) -> List[Tuple[int, Optional[str], float, int, int]]:
+        """Возвращает версии: номер, метка, время создания, число файлов и их объем"""
+        return self._db.execute("SELECT id, label, created, files, size FROM versions ORDER BY id").fetchall()
+    
+    def latest(self) -> Optional[int]:
+        row = self._db.execute("SELECT MAX(id) FROM versions").fetchone()
+        return row[0]
+    
+    def resolve(self, reference: str) -> int:
+        """Находит версию по номеру, метке или слову latest"""
+        if reference == 'latest':
+            version = self.latest()
+        elif reference.isdigit():
+            row = self._db.execute("SELECT id FROM versions WHERE id = ?", (int(reference),)).fetchone()
+            version = row[0] if row else None
+        else:
+            row = self._db.execute("SELECT MAX(id) FROM versions WHERE label = ?", (reference,)).fetchone()
+            version = row[0]
+        if version is None:
+            raise ValueError(f"Версия не найдена: {reference}")
+        return version
+    
+    def _manifest_hash(self, version: int) -> str:
+        row = self._db.execute("SELECT manifest FROM versions WHERE id = ?", (version,)).fetchone()
+        if row is None:
+            raise ValueError(f"Версия не найдена: {version}")
+        return row[0]
+    
+    def files(self, version: int) -> Dict[str, str]:
+        """Возвращает файлы версии: относительный путь -> хэш содержимого"""
+        files = {}
+        for line in self.read(self._manifest_hash(version)).decode('utf-8').splitlines():
+            digest, path = line.split(' ', 1)
+            files[path] = digest
+        return files
+    
+    def checkout(self, version: int, target_dir: str) -> int:
+        """Восстанавливает версию в каталог target_dir, который должен быть пустым или отсутствовать"""
+        if os.path.isdir(target_dir) and os.listdir(target_dir):
+            raise ValueError(f"Каталог {target_dir} не пуст")
+        files = self.files(version)
+        for path, digest in files.items():
+            file_path = os.path.join(target_dir, *path.split('/'))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            write_file_atomic(file_path, self.read(digest))
+        return len(files)
+    
+    def diff(self, old_version: int, new_version: int) -> Tuple[List[str], List[str], List[str]]:
+        """Сравнивает версии по спискам файлов, возвращает добавленные, удаленные и измененные пути"""
+        old_files = self.files(old_version)
+        new_files = self.files(new_version)
+        added = sorted(path for path in new_files if path not in old_files)
+        removed = sorted(path for path in old_files if path not in new_files)
+        changed = sorted(path for path, digest in new_files.items()
+                         if path in old_files and old_files[path] != digest)
+        return added, removed, changed
+
+def history_main(argv: List[str]) -> None:
+    """Команда history: версии сохраненной документации в хранилище истории"""
+    global args
+    
+    parser = argparse.ArgumentParser(
+        prog='main.py history',
+        description="""
+Хранилище истории снимков документации. Каждая загрузка добавляется как версия,
+одинаковые файлы хранятся один раз, а измененные страницы - как разница с
+предыдущей версией. Любую версию можно восстановить в каталог или сравнить с другой.
+Версия задается номером, меткой или словом latest.
+
+Примеры:
+  python main.py history commit --store history.itshist --output out --label 2024-05-01
+  python main.py history list --store history.itshist
+  python main.py history diff 3 latest --store history.itshist --text
+  python main.py history checkout 3 --store history.itshist --to restored
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    # Общие параметры указываются после команды
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--store', required=True, help='Файл хранилища истории')
+    common.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    commit_parser = commands.add_parser('commit', parents=[common], help='Добавить каталог с документацией как новую версию')
+    commit_parser.add_argument('--output', default='out', help='Каталог с сохраненными страницами (по умолчанию out)')
+    commit_parser.add_argument('--label', help='Метка версии, например дата загрузки')
+    commit_parser.add_argument('--no-delta', action='store_true', help='Хранить измененные файлы целиком, без дельт')
+    
+    commands.add_parser('list', parents=[common], help='Показать версии')
+    
+    checkout_parser = commands.add_parser('checkout', parents=[common], help='Восстановить версию в каталог')
+    checkout_parser.add_argument('version', help='Номер, метка версии или latest')
+    checkout_parser.add_argument('--to', required=True, help='Пустой или несуществующий каталог для восстановления')
+    
+    diff_parser = commands.add_parser('diff', parents=[common], help='Сравнить две версии')
+    diff_parser.add_argument('old', help='Номер, метка версии или latest')
+    diff_parser.add_argument('new', help='Номер, метка версии или latest')
+    diff_parser.add_argument('--text', action='store_true', help='Показать построчные изменения текстовых файлов')
+    
+    args = parser.parse_args(argv)
+    
+    store = HistoryStore(args.store)
+    try:
+        if args.command == 'commit':
+            started = time.time()
+            version, files, added = store.commit(args.output, args.label, not args.no_delta)
+            print(f"Версия {version}: файлов {files}, добавлено в хранилище {added // 1024} КБ за {time.time() - started:.1f} с")
+        elif args.command == 'list':
+            for version, label, created, files, size in store.versions():
+                created_text = time.strftime('%Y-%m-%d %H:%M', time.localtime(created))
+                print(f"{version:>5}  {created_text}  {label or '-':<20} файлов {files}, {size // 1024} КБ")
+            print(f"Размер хранилища: {os.path.getsize(args.store) // 1024} КБ")
+        elif args.command == 'checkout':
+            version = store.resolve(args.version)
+            files = store.checkout(version, args.to)
+            print(f"Версия {version} восстановлена в {args.to}: файлов {files}")
+        elif args.command == 'diff':
+            old_version, new_version = store.resolve(args.old), store.resolve(args.new)
+            added, removed, changed = store.diff(old_version, new_version)
+            for marker, paths in (('+', added), ('-', removed), ('M', changed)):
+                for path in paths:
+                    print(f"{marker} {path}")
+            print(f"Версии {old_version} -> {new_version}: добавлено {len(added)}, удалено {len(removed)}, изменено {len(changed)}")
+            if args.text:
+                old_files, new_files = store.files(old_version), store.files(new_version)
+                for path in changed:
+                    if not path.endswith(HISTORY_DELTA_EXTENSIONS):
+                        continue
+                    old_lines = store.read(old_files[path]).decode('utf-8', 'replace').splitlines(keepends=True)
+                    new_lines = store.read(new_files[path]).decode('utf-8', 'replace').splitlines(keepends=True)
+                    sys.stdout.writelines(difflib.unified_diff(old_lines, new_lines, f"{old_version}/{path}", f"{new_version}/{path}"))
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+    finally:
+        store.close()
 
+def create_browser(headless: bool = False) -> WebDriver:
+    """Запускает Chrome с настройками для загрузки документации"""
+    from selenium import webdriver
+    
     options = webdriver.ChromeOptions()
-    if args.headless:
+    if headless:
         options.add_argument('--headless=new')  # Использование современной реализации headless режима
         options.add_argument('--disable-gpu')  # Отключение GPU для headless режима
         options.add_argument('--disable-dev-shm-usage')  # Предотвращение ошибок в контейнерах
@@ -1544,6 +4847,10 @@ def main():
     options.add_argument('--disable-notifications')  # Отключение уведомлений
     options.add_argument('--disable-popup-blocking')  # Отключение блокировки всплывающих окон
     options.add_argument('--blink-settings=imagesEnabled=true')  # Включение загрузки изображений
+    # Фоновые вкладки (--prefetch-pages) загружаются без замедления таймеров и отрисовки
+    options.add_argument('--disable-background-timer-throttling')
+    options.add_argument('--disable-renderer-backgrounding')
+    options.add_argument('--disable-backgrounding-occluded-windows')
     options.page_load_strategy = 'eager'  # Загрузка страницы не дожидаясь полной загрузки ресурсов
     
     # Дополнительные настройки для ускорения
@@ -1556,45 +4863,1076 @@ def main():
     
     browser = webdriver.Chrome(options=options)
     browser.maximize_window()
+    return browser
+
+def login(browser: WebDriver, login_url: str, username: str, password: str) -> None:
+    """Выполняет авторизацию через форму входа"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    
+    print("Авторизация...")
+    browser.get(login_url)
+    
+    username_input = WebDriverWait(browser, 10).until(
+        EC.presence_of_element_located((By.NAME, "username"))
+    )
+    password_input = browser.find_element(By.NAME, "password")
+    
+    username_input.send_keys(username)
+    password_input.send_keys(password)
+    
+    login_button = browser.find_element(By.CSS_SELECTOR, "input[type='submit']")
+    login_button.click()
     
+    time.sleep(2)
+
+class _LoginFormParser(HTMLParser):
+    """Собирает формы страницы: адрес отправки, метод и поля ввода со значениями по умолчанию"""
+    
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.forms: List[dict] = []
+        self._form: Optional[dict] = None
+    
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        attributes = {name: value or '' for name, value in attrs}
+        if tag == 'form':
+            self._form = {'action': attributes.get('action', ''), 'method': attributes.get('method', 'get').lower(), 'fields': []}
+            self.forms.append(self._form)
+        elif tag in ('input', 'button') and self._form is not None and attributes.get('name'):
+            field_type = attributes.get('type', 'submit' if tag == 'button' else 'text').lower()
+            if field_type in ('checkbox', 'radio') and 'checked' not in attributes:
+                return
+            self._form['fields'].append((attributes['name'], attributes.get('value', ''), field_type))
+    
+    def handle_endtag(self, tag: str) -> None:
+        if tag == 'form':
+            self._form = None
+
+def _find_login_form(content: str) -> Optional[dict]:
+    """Возвращает форму с полями username и password или None"""
+    parser = _LoginFormParser()
+    parser.feed(content)
+    for form in parser.forms:
+        names = {name for name, _, _ in form['fields']}
+        if 'username' in names and 'password' in names:
+            return form
+    return None
+
+def http_login(session: requests.Session, login_url: str, username: str, password: str) -> None:
+    """Выполняет авторизацию через форму входа HTTP-запросами, без браузера
+    
+    Форма разбирается из страницы входа: скрытые поля передаются как есть, первая кнопка
+    отправки - как нажатая, перенаправления выполняются до конца. Куки авторизации
+    остаются в session. ValueError - если форма изменилась или вход не удался.
+    """
+    print("Авторизация по HTTP...")
+    response = session.get(login_url, timeout=30)
+    response.raise_for_status()
+    form = _find_login_form(response.text)
+    if form is None:
+        raise ValueError("на странице входа не найдена форма с полями username и password")
+    
+    data: List[Tuple[str, str]] = []
+    submitted = False
+    for name, value, field_type in form['fields']:
+        if name == 'username':
+            value = username
+        elif name == 'password':
+            value = password
+        elif field_type in ('submit', 'image'):
+            # Браузер отправляет только нажатую кнопку
+            if submitted:
+                continue
+            submitted = True
+        data.append((name, value))
+    
+    action = urllib.parse.urljoin(response.url, form['action'] or response.url)
+    if form['method'] == 'post':
+        response = session.post(action, data=data, timeout=30, headers={'Referer': response.url})
+    else:
+        response = session.get(action, params=data, timeout=30, headers={'Referer': response.url})
+    if response.status_code >= 400 or _find_login_form(response.text) is not None:
+        raise ValueError(f"вход не выполнен (HTTP {response.status_code}, {response.url})")
+
+def http_login_session(login_url: str, username: str, password: str, required: bool = False) -> Optional[requests.Session]:
+    """Создает HTTP-сессию и авторизуется в ней через http_login
+    
+    При неудаче возвращает None (вход нужно выполнить в браузере), а при required - передает ошибку
+    """
+    session = requests.Session()
     try:
-        print("Авторизация...")
-        browser.get(args.login)
+        http_login(session, login_url, username, password)
+        return session
+    except (requests.RequestException, ValueError) as e:
+        session.close()
+        if required:
+            raise
+        print(f"Авторизация по HTTP не удалась ({str(e)}), вход будет выполнен в браузере")
+        return None
+
+def session_cookies(session: requests.Session) -> List[dict]:
+    """Куки HTTP-сессии в формате WebDriver (get_cookies) для передачи в браузер"""
+    cookies = []
+    for cookie in session.cookies:
+        converted = {
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'secure': bool(cookie.secure),
+            'httpOnly': cookie.has_nonstandard_attr('HttpOnly'),
+        }
+        if cookie.expires:
+            converted['expiry'] = cookie.expires
+        cookies.append(converted)
+    return cookies
+
+class BrowserSupervisor:
+    """Следит за браузером во время обхода и перезапускает его при необходимости
+    
+    Браузер перезапускается после recycle_pages страниц, при превышении max_memory_mb
+    суммарной памятью chromedriver и Chrome (нужен psutil) или если он перестал отвечать.
+    Снятие страницы дольше page_timeout секунд считается зависанием: сторожевой поток
+    завершает процессы браузера, чтобы заблокированный вызов WebDriver прервался,
+    и страница повторяется в новом браузере. После перезапуска куки авторизации
+    переносятся в новый браузер, при неудаче выполняется повторный вход.
+    
+    При login_mode auto и http вход выполняется HTTP-запросами, пока запускается Chrome,
+    и куки передаются в браузер через DevTools. В режиме auto при неудаче
+    выполняется обычный вход через форму в браузере.
+    """
+    
+    def __init__(self, headless: bool, login_url: str, username: str, password: str,
+                 recycle_pages: int = 0, max_memory_mb: float = 0, page_timeout: float = 0,
+                 login_mode: str = 'auto') -> None:
+        self.headless: bool = headless
+        self.login_url: str = login_url
+        self.username: str = username
+        self.password: str = password
+        self.recycle_pages: int = recycle_pages
+        self.max_memory_mb: float = max_memory_mb
+        self.page_timeout: float = page_timeout
+        self.login_mode: str = login_mode
+        self.concurrency: int = 1  # WebDriver снимает страницы по одной
+        self.browser: Optional[WebDriver] = None
+        self.restarts: int = 0
+        self.pages_since_start: int = 0
+        self._cookies: List[dict] = []
+        self._deadline: Optional[float] = None
+        self._timed_out: bool = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        if max_memory_mb and psutil is None:
+            print("Ограничение памяти браузера не действует: не установлен пакет psutil")
+    
+    def start(self) -> WebDriver:
+        """Запускает браузер, авторизуется и включает сторожевой поток"""
+        session = None
+        if self.login_mode == 'browser':
+            self.browser = self._launch()
+        else:
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix='http-login') as executor:
+                login_future = executor.submit(http_login_session, self.login_url, self.username,
+                                               self.password, self.login_mode == 'http')
+                self.browser = self._launch()
+                session = login_future.result()
         
-        username_input = WebDriverWait(browser, 10).until(
-            EC.presence_of_element_located((By.NAME, "username"))
-        )
-        password_input = browser.find_element(By.NAME, "password")
+        if session is not None:
+            self._cookies = session_cookies(session)
+            try:
+                self._inject_cookies()
+                # Конвейер сразу получает авторизованную HTTP-сессию
+                register_http_session(self.browser, session)
+            except Exception as e:
+                if self.login_mode == 'http':
+                    raise
+                print("Не удалось передать куки в браузер, вход через браузер")
+                if args.verbose:
+                    print(f"Детали: {str(e)}")
+                session.close()
+                session = None
+        if session is None:
+            login(self.browser, self.login_url, self.username, self.password)
+            self._cookies = self.browser.get_cookies()
+        if self.page_timeout and self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name='browser-watchdog', daemon=True)
+            self._watchdog.start()
+        return self.browser
+    
+    def _launch(self) -> WebDriver:
+        browser = create_browser(self.headless)
+        if self.page_timeout:
+            browser.set_page_load_timeout(self.page_timeout)
+            browser.set_script_timeout(self.page_timeout)
+        self.pages_since_start = 0
+        return browser
+    
+    def _watch(self) -> None:
+        while not self._stop.wait(1):
+            with self._lock:
+                expired = self._deadline is not None and time.time() > self._deadline
+                if expired:
+                    self._deadline = None
+                    self._timed_out = True
+            if expired:
+                print(f"Страница не снята за {self.page_timeout:.0f} с, браузер будет перезапущен")
+                self._kill()
+    
+    def _processes(self) -> list:
+        """Процессы chromedriver и Chrome текущего браузера (нужен psutil)"""
+        try:
+            driver = psutil.Process(self.browser.service.process.pid)
+            return [driver] + driver.children(recursive=True)
+        except Exception:
+            return []
+    
+    def memory_mb(self) -> Optional[float]:
+        """Суммарная память (RSS) процессов браузера в МБ или None, если ее не узнать"""
+        if psutil is None:
+            return None
+        processes = self._processes()
+        if not processes:
+            return None
+        rss = 0
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss / 1024 / 1024
+    
+    def _kill(self) -> None:
+        """Принудительно завершает процессы браузера"""
+        if psutil is not None:
+            for process in reversed(self._processes()):
+                try:
+                    process.kill()
+                except psutil.Error:
+                    pass
+            return
+        try:
+            self.browser.service.process.kill()
+        except Exception:
+            pass
+    
+    def _responsive(self) -> bool:
+        try:
+            self.browser.current_url
+            return True
+        except Exception:
+            return False
+    
+    def restart(self, reason: str) -> WebDriver:
+        """Перезапускает браузер с сохранением авторизации"""
+        print(f"Перезапуск браузера: {reason}")
+        old_browser = self.browser
+        if self._responsive():
+            try:
+                self._cookies = old_browser.get_cookies()
+            except Exception:
+                pass
+        try:
+            old_browser.quit()
+        except Exception:
+            self._kill()
+        
+        self.browser = self._launch()
+        transfer_http_session(old_browser, self.browser)
+        self.restarts += 1
+        try:
+            self._inject_cookies()
+        except Exception as e:
+            if args.verbose:
+                print(f"Не удалось перенести куки в новый браузер, повторный вход: {str(e)}")
+            login(self.browser, self.login_url, self.username, self.password)
+        return self.browser
+    
+    def _inject_cookies(self) -> None:
+        """Переносит сохраненные куки в новый браузер через DevTools, не открывая страниц"""
+        if not self._cookies:
+            raise ValueError("нет сохраненных кук")
+        cookies = []
+        for cookie in self._cookies:
+            converted = {key: cookie[key] for key in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly') if key in cookie}
+            if 'expiry' in cookie:
+                converted['expires'] = cookie['expiry']
+            if cookie.get('sameSite') in ('Strict', 'Lax', 'None'):
+                converted['sameSite'] = cookie['sameSite']
+            cookies.append(converted)
+        self.browser.execute_cdp_cmd('Network.setCookies', {'cookies': cookies})
+    
+    def run_page(self, action: Callable[[WebDriver], CapturedPage]) -> CapturedPage:
+        """Выполняет action(browser) под контролем времени и после этого проверяет браузер
         
-        username_input.send_keys(args.username)
-        password_input.send_keys(args.password)
+        Если браузер завис или перестал отвечать, он перезапускается, а action повторяется один раз
+        """
+        for attempt in (1, 2):
+            with self._lock:
+                self._timed_out = False
+                self._deadline = time.time() + self.page_timeout if self.page_timeout else None
+            try:
+                result = action(self.browser)
+            except Exception:
+                with self._lock:
+                    self._deadline = None
+                    timed_out = self._timed_out
+                if attempt == 2 or not (timed_out or not self._responsive()):
+                    raise
+                self.restart("браузер завис" if timed_out else "браузер не отвечает")
+                continue
+            with self._lock:
+                self._deadline = None
+            self.after_page()
+            return result
+    
+    def after_page(self) -> None:
+        """Перезапускает браузер, если он обработал recycle_pages страниц или превысил лимит памяти"""
+        self.pages_since_start += 1
+        if self.recycle_pages and self.pages_since_start >= self.recycle_pages:
+            self.restart(f"обработано {self.pages_since_start} страниц")
+            return
+        if self.max_memory_mb:
+            memory = self.memory_mb()
+            if memory is not None and memory > self.max_memory_mb:
+                self.restart(f"браузер занимает {memory:.0f} МБ")
+    
+    def close(self) -> None:
+        """Останавливает сторожевой поток и закрывает браузер"""
+        self._stop.set()
+        if self.browser is not None:
+            close_http_session(self.browser)
+            try:
+                self.browser.quit()
+            except Exception:
+                self._kill()
+
+class _PlaywrightTab:
+    """Вкладка в собственном контексте браузера Playwright"""
+    
+    __slots__ = ('context', 'page', 'pages')
+    
+    def __init__(self, context, page) -> None:
+        self.context = context
+        self.page = page
+        self.pages: int = 0  # сколько страниц снято во вкладке
+
+class PlaywrightBrowser:
+    """Асинхронный браузер на Playwright: одна копия Chromium и несколько изолированных вкладок
+    
+    Каждая вкладка открыта в отдельном контексте (своя память страницы, кэш и куки),
+    а состояние авторизации один раз снимается после входа и передается всем контекстам.
+    Цикл asyncio работает в отдельном потоке, синхронные методы можно вызывать из
+    нескольких потоков одновременно: каждый вызов занимает свободную вкладку, поэтому
+    до concurrency страниц снимаются параллельно в одном процессе браузера.
+    
+    Объект заменяет и WebDriver, и BrowserSupervisor: поддерживает те же операции разбора
+    оглавления и снятия iframe (через get_doc_structure и capture_page) и run_page.
+    Зависшая дольше page_timeout или закрывшаяся вкладка пересоздается вместе с контекстом,
+    вкладка пересоздается и после recycle_pages страниц; процесс браузера при этом не перезапускается.
+    """
+    
+    def __init__(self, headless: bool, login_url: str, username: str, password: str,
+                 concurrency: int = 4, recycle_pages: int = 0, page_timeout: float = 0,
+                 login_mode: str = 'auto') -> None:
+        self.headless: bool = headless
+        self.login_url: str = login_url
+        self.username: str = username
+        self.password: str = password
+        self.concurrency: int = max(concurrency, 1)
+        self.recycle_pages: int = recycle_pages
+        self.page_timeout: float = page_timeout
+        self.login_mode: str = login_mode
+        self.browser: Optional[PlaywrightBrowser] = None
+        self.restarts: int = 0
+        self.current_url: Optional[str] = None
+        self._cookies: List[dict] = []
+        self._storage_state: Optional[dict] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._playwright = None
+        self._chromium = None
+        self._tabs: Optional[asyncio.Queue] = None
+    
+    def _call(self, coroutine):
+        """Выполняет корутину в цикле браузера и дожидается результата в вызывающем потоке"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+    
+    def start(self) -> PlaywrightBrowser:
+        """Запускает Chromium, авторизуется и открывает вкладки"""
+        try:
+            from playwright.async_api import async_playwright
+        except ImportError:
+            raise RuntimeError("Для --browser-backend playwright установите пакет playwright "
+                               "(pip install playwright && playwright install chromium)")
         
-        login_button = browser.find_element(By.CSS_SELECTOR, "input[type='submit']")
-        login_button.click()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='playwright-loop', daemon=True)
+        self._thread.start()
+        self._call(self._start(async_playwright))
+        self.browser = self
+        return self
+    
+    async def _start(self, async_playwright) -> None:
+        # Вход по HTTP выполняется, пока запускается Chromium
+        login_task = None
+        if self.login_mode != 'browser':
+            login_task = asyncio.ensure_future(asyncio.to_thread(
+                http_login_session, self.login_url, self.username, self.password, self.login_mode == 'http'
+            ))
+        self._playwright = await async_playwright().start()
+        self._chromium = await self._playwright.chromium.launch(headless=self.headless)
+        session = await login_task if login_task is not None else None
         
-        time.sleep(2)
+        if session is not None:
+            self._cookies = session_cookies(session)
+            cookies = [
+                {
+                    'name': cookie['name'], 'value': cookie['value'], 'domain': cookie['domain'],
+                    'path': cookie['path'] or '/', 'expires': cookie.get('expiry', -1),
+                    'httpOnly': cookie['httpOnly'], 'secure': cookie['secure'], 'sameSite': 'Lax',
+                }
+                for cookie in self._cookies
+            ]
+            self._storage_state = {'cookies': cookies, 'origins': []}
+            register_http_session(self, session)
+        else:
+            context = await self._chromium.new_context()
+            page = await context.new_page()
+            print("Авторизация...")
+            await page.goto(self.login_url)
+            await page.fill('[name="username"]', self.username, timeout=10000)
+            await page.fill('[name="password"]', self.password)
+            await page.click("input[type='submit']")
+            await asyncio.sleep(2)
+            self._storage_state = await context.storage_state()
+            self._cookies = self._storage_state.get('cookies', [])
+            await context.close()
         
-        print("Загрузка документации...")
-        browser.get(args.url)
-        time.sleep(2)
+        self._tabs = asyncio.Queue()
+        for _ in range(self.concurrency):
+            self._tabs.put_nowait(await self._new_tab())
+        print(f"Браузер Playwright готов: вкладок {self.concurrency}")
+    
+    async def _new_tab(self) -> _PlaywrightTab:
+        context = await self._chromium.new_context(storage_state=self._storage_state)
+        return _PlaywrightTab(context, await context.new_page())
+    
+    async def _replace_tab(self, tab: _PlaywrightTab) -> _PlaywrightTab:
+        try:
+            await tab.context.close()
+        except Exception:
+            pass
+        self.restarts += 1
+        return await self._new_tab()
+    
+    def get_cookies(self) -> List[dict]:
+        """Куки авторизации в формате WebDriver (для HTTP-сессии конвейера)"""
+        return list(self._cookies)
+    
+    def run_page(self, action: Callable[[PlaywrightBrowser], CapturedPage]) -> CapturedPage:
+        """Выполняет action(browser); контроль времени и пересоздание вкладок - внутри снятия страницы"""
+        return action(self)
+    
+    def extract_doc_structure(self, url: str) -> List[DocPage]:
+        """Извлекает структуру документации из оглавления теми же скриптами, что и WebDriver"""
+        print("Извлекаем структуру документации...")
+        items = self._call(self._extract_tree_links(url)) or []
+        if args.verbose:
+            print(f"JavaScript метод нашел {len(items)} ссылок")
         
-        pages = extract_doc_structure(browser)
+        pages = doc_pages_from_tree_links(items, set())
+        if pages:
+            print(f"Найдено {len(pages)} страниц")
+        else:
+            print("Внимание: не найдено ни одной страницы в дереве")
+        return pages
+    
+    async def _extract_tree_links(self, url: str) -> list:
+        tab = await self._tabs.get()
+        try:
+            await tab.page.goto(url, wait_until='domcontentloaded')
+            self.current_url = tab.page.url
+            await tab.page.wait_for_selector('.tree', timeout=15000)
+            await tab.page.evaluate(f"function () {{ {TREE_EXPAND_SCRIPT} }}")
+            # Ждем разворачивания сложного дерева, как и при работе через WebDriver
+            await asyncio.sleep(10)
+            return await tab.page.evaluate(f"function () {{ {TREE_LINKS_SCRIPT} }}")
+        finally:
+            self._tabs.put_nowait(tab)
+    
+    def capture_document(self, url: str, iframe_id: str) -> Tuple[Optional[str], Optional[str], str, List[Tuple[str, str]], str]:
+        """Открывает страницу в свободной вкладке и снимает документ из iframe
+        
+        Возвращает HTML (режим dom) или снимок MHTML (режим mhtml), URL документа,
+        список изображений для загрузки и URL страницы
+        """
+        return self._call(self._capture(url, iframe_id))
+    
+    async def _capture(self, url: str, iframe_id: str) -> tuple:
+        tab = await self._tabs.get()
+        try:
+            for attempt in (1, 2):
+                try:
+                    result = await asyncio.wait_for(self._capture_in_tab(tab, url, iframe_id), self.page_timeout or None)
+                except asyncio.TimeoutError:
+                    print(f"Страница не снята за {self.page_timeout:.0f} с, вкладка будет открыта заново")
+                    tab = await self._replace_tab(tab)
+                    if attempt == 2:
+                        raise
+                    continue
+                except Exception:
+                    if tab.page.is_closed():
+                        tab = await self._replace_tab(tab)
+                    raise
+                
+                tab.pages += 1
+                if self.recycle_pages and tab.pages >= self.recycle_pages:
+                    tab = await self._replace_tab(tab)
+                return result
+        finally:
+            self._tabs.put_nowait(tab)
+    
+    async def _capture_in_tab(self, tab: _PlaywrightTab, url: str, iframe_id: str) -> tuple:
+        page = tab.page
+        await page.goto(url, wait_until='domcontentloaded')
+        self.current_url = page.url
+        # Как и при работе через WebDriver, даем странице время подставить документ во фрейм
+        await asyncio.sleep(3)
+        element = await page.wait_for_selector(f'#{iframe_id}', timeout=15000)
+        frame = await element.content_frame()
+        await frame.wait_for_load_state('load', timeout=15000)
+        document_url = frame.url
+        
+        html_content, mhtml, images = None, None, []
+        if args.capture == 'mhtml':
+            session = await tab.context.new_cdp_session(page)
+            try:
+                snapshot = await session.send('Page.captureSnapshot', {'format': 'mhtml'})
+            finally:
+                await session.detach()
+            mhtml = snapshot['data']
+            if args.verbose:
+                print(f"Снимок MHTML: {len(mhtml)} байт")
+        else:
+            sources = await frame.evaluate(f"function () {{ {IFRAME_IMAGE_SOURCES_SCRIPT} }}") or []
+            local_paths, processed_images = assign_image_paths(sources)
+            if processed_images:
+                await frame.evaluate(f"function () {{ {IFRAME_IMAGE_PATHS_SCRIPT} }}", local_paths)
+            html_content = await frame.content()
+            images = [(urllib.parse.urljoin(document_url, src), filename) for src, filename in processed_images.items()]
+        
+        self._cookies = await tab.context.cookies()
+        return html_content, mhtml, document_url, images, page.url
+    
+    def close(self) -> None:
+        """Закрывает браузер и останавливает цикл asyncio"""
+        if self._loop is None:
+            return
+        if self.browser is not None:
+            close_http_session(self)
+        try:
+            self._call(self._close())
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+    
+    async def _close(self) -> None:
+        if self._chromium is not None:
+            await self._chromium.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+
+def create_browser_backend(options: argparse.Namespace, headless: bool, login_url: str, username: str, password: str):
+    """Создает BrowserSupervisor (Selenium) или PlaywrightBrowser по параметру --browser-backend"""
+    if options.browser_backend == 'playwright':
+        if options.max_browser_memory:
+            print("Ограничение памяти браузера не действует для --browser-backend playwright")
+        return PlaywrightBrowser(headless, login_url, username, password, options.browser_pages,
+                                 options.recycle_pages, options.page_timeout, options.login_mode)
+    return BrowserSupervisor(headless, login_url, username, password, options.recycle_pages,
+                             options.max_browser_memory, options.page_timeout, options.login_mode)
+
+def add_browser_arguments(parser: argparse.ArgumentParser) -> None:
+    """Добавляет параметры контроля браузера при длительном обходе"""
+    parser.add_argument('--browser-backend', choices=BROWSER_BACKENDS, default='selenium',
+                        help='Способ управления браузером: selenium - Chrome через WebDriver, '
+                             'playwright - несколько изолированных вкладок в одном Chromium (нужен playwright, по умолчанию selenium)')
+    parser.add_argument('--login-mode', choices=LOGIN_MODES, default='auto',
+                        help='Способ авторизации: auto - HTTP-запросами с переходом на вход через браузер при неудаче, '
+                             'http - только HTTP-запросами, browser - через форму в браузере (по умолчанию auto). '
+                             'Режим входа не отменяет запуск браузера: оглавление и страницы всегда снимаются в Chrome/Chromium')
+    parser.add_argument('--browser-pages', type=int, default=4,
+                        help='Количество вкладок, снимающих страницы параллельно, для --browser-backend playwright (по умолчанию 4)')
+    parser.add_argument('--prefetch-pages', type=int, default=0,
+                        help='Загружать заранее N следующих страниц в соседних вкладках браузера Selenium, '
+                             'пока снимается текущая (по умолчанию 0 - не загружать)')
+    parser.add_argument('--recycle-pages', type=int, default=1000,
+                        help='Перезапускать браузер после указанного числа страниц (по умолчанию 1000, 0 - не перезапускать)')
+    parser.add_argument('--max-browser-memory', type=float, default=0,
+                        help='Перезапускать браузер, если его процессы занимают больше указанного числа МБ (нужен psutil, по умолчанию 0 - без ограничения)')
+    parser.add_argument('--page-timeout', type=float, default=180,
+                        help='Максимальное время снятия одной страницы в секундах, после него браузер перезапускается (по умолчанию 180, 0 - без ограничения)')
+
+def resolve_credentials(options: argparse.Namespace) -> None:
+    """Подставляет учетные данные из окружения, если они не указаны в аргументах"""
+    # Использование переменных окружения, если не указаны аргументы
+    if not options.username:
+        options.username = os.environ.get('USERNAME')
+    if not options.password:
+        options.password = os.environ.get('PASSWORD')
+    
+    # Проверка наличия учетных данных
+    if not options.username or not options.password:
+        raise ValueError("Необходимо указать username и password в аргументах или в файле .env")
+
+class CrawlJob:
+    """Задание на загрузку документации в режиме демона"""
+    
+    def __init__(self, job_id: int, url: str, output_dir: str, limit: Optional[int] = None, section: str = "") -> None:
+        self.id: int = job_id
+        self.url: str = url
+        self.output_dir: str = output_dir
+        self.limit: Optional[int] = limit
+        self.section: str = section
+        self.state: str = 'queued'
+        self.done: int = 0
+        self.total: int = 0
+        self.error: Optional[str] = None
+        self.created: float = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+    
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'url': self.url,
+            'output': self.output_dir,
+            'limit': self.limit,
+            'section': self.section,
+            'state': self.state,
+            'done': self.done,
+            'total': self.total,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+class CrawlDaemon:
+    """Пул авторизованных браузеров, выполняющий задания на загрузку из очереди
+    
+    Каждый рабочий поток один раз запускает браузер и авторизуется, после чего
+    выполняет задания без повторного запуска Chrome. С --browser-backend playwright
+    все потоки используют один общий браузер с несколькими вкладками. Структура
+    документации кэшируется в памяти на structure_ttl часов.
+    """
+    
+    def __init__(self, login_url: str, username: str, password: str, workers: int = 1,
+                 headless: bool = True, output_root: str = 'out', structure_ttl: float = 24) -> None:
+        self.login_url: str = login_url
+        self.username: str = username
+        self.password: str = password
+        self.workers: int = workers
+        self.headless: bool = headless
+        self.output_root: str = output_root
+        self.structure_ttl: float = structure_ttl
+        self.jobs: Dict[int, CrawlJob] = {}
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._structures: Dict[str, Tuple[float, List[DocPage]]] = {}
+        self._threads: List[threading.Thread] = []
+        self._shared_browser: Optional[PlaywrightBrowser] = None
+    
+    def start(self) -> None:
+        """Запускает рабочие потоки, браузеры стартуют и авторизуются параллельно"""
+        if args.browser_backend == 'playwright':
+            self._shared_browser = create_browser_backend(args, self.headless, self.login_url, self.username, self.password)
+            self._shared_browser.start()
+        for number in range(1, self.workers + 1):
+            thread = threading.Thread(target=self._worker, args=(number,), name=f"crawler-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self) -> None:
+        """Дожидается завершения текущих заданий и закрывает браузеры"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._shared_browser is not None:
+            self._shared_browser.close()
+    
+    def job_directory(self, output_dir: str) -> str:
+        """Каталог задания внутри output_root; ValueError, если output_dir указывает за его пределы
+        
+        Каталог задания очищается перед загрузкой, поэтому ни сам output_root,
+        ни каталоги вне него задание получить не может
+        """
+        root = os.path.realpath(self.output_root)
+        path = os.path.realpath(os.path.join(root, output_dir))
+        if os.path.commonpath([root, path]) != root or path == root:
+            raise ValueError(f"каталог задания должен находиться внутри {self.output_root}")
+        return path
+    
+    def submit(self, url: str, limit: Optional[int] = None, section: str = "", output_dir: Optional[str] = None) -> CrawlJob:
+        """Ставит задание в очередь
+        
+        ValueError - если output_dir вне output_root, FileExistsError - если каталог
+        уже занят заданием, которое ждет в очереди или выполняется
+        """
+        with self._lock:
+            job_id = len(self.jobs) + 1
+            path = self.job_directory(output_dir or f"job_{job_id:04d}")
+            for other in self.jobs.values():
+                if other.state in ('queued', 'running') and other.output_dir == path:
+                    raise FileExistsError(f"каталог {path} уже используется заданием {other.id}")
+            job = CrawlJob(job_id, url, path, limit, section)
+            self.jobs[job_id] = job
+        self._queue.put(job)
+        print(f"Задание {job.id} поставлено в очередь: {url}")
+        return job
+    
+    def _worker(self, number: int) -> None:
+        supervisor = self._shared_browser
+        try:
+            if supervisor is None:
+                supervisor = create_browser_backend(args, self.headless, self.login_url, self.username, self.password)
+                supervisor.start()
+                print(f"Браузер {number} готов к работе")
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                self._run_job(supervisor, job)
+        except Exception as e:
+            print(f"Браузер {number} остановлен из-за ошибки")
+            if args.verbose:
+                print(f"Детали: {str(e)}")
+        finally:
+            if supervisor is not None and supervisor is not self._shared_browser:
+                supervisor.close()
+    
+    def _get_structure(self, browser: WebDriver, url: str) -> List[DocPage]:
+        key = normalize_url(url)
+        with self._lock:
+            cached = self._structures.get(key)
+        if cached and (self.structure_ttl <= 0 or time.time() - cached[0] < self.structure_ttl * 3600):
+            return cached[1]
+        
+        pages = get_doc_structure(browser, url)
+        with self._lock:
+            self._structures[key] = (time.time(), pages)
+        return pages
+    
+    def _run_job(self, supervisor: BrowserSupervisor, job: CrawlJob) -> None:
+        job.state = 'running'
+        job.started = time.time()
+        print(f"Задание {job.id} запущено")
+        try:
+            pages = self._get_structure(supervisor.browser, job.url)
+            if job.section:
+                section = select_pages(pages, [job.section])
+                pages = [page for index, page in enumerate(pages, 1) if index in section]
+            job.total = len(pages) if job.limit is None else min(job.limit, len(pages))
+            
+            def update_progress(done: int, total: int) -> None:
+                job.done = done
+                job.total = total
+            
+            clean_output_directory(job.output_dir)
+            save_all_pages(supervisor.browser, pages, job.limit, job.output_dir,
+                           progress=update_progress, supervisor=supervisor)
+            job.state = 'done'
+            print(f"Задание {job.id} выполнено: {job.done} страниц")
+        except Exception as e:
+            job.state = 'failed'
+            job.error = str(e)
+            print(f"Задание {job.id} завершилось с ошибкой: {str(e)}")
+        finally:
+            job.finished = time.time()
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    """HTTP API демона: POST /jobs - новое задание, GET /jobs и GET /jobs/<id> - состояние"""
+    
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self) -> None:
+        daemon = self.server.crawl_daemon
+        path = self.path.rstrip('/')
+        if path == '/jobs':
+            self._send_json(200, [job.to_dict() for job in list(daemon.jobs.values())])
+            return
+        
+        match = re.match(r'^/jobs/(\d+)$', path)
+        job = daemon.jobs.get(int(match.group(1))) if match else None
+        if job is None:
+            self._send_json(404, {'error': 'Задание не найдено'})
+            return
+        self._send_json(200, job.to_dict())
+    
+    def do_POST(self) -> None:
+        if self.path.rstrip('/') != '/jobs':
+            self._send_json(404, {'error': 'Неизвестный адрес'})
+            return
+        # Страницы из браузера могут отправить запрос на локальный адрес: без preflight CORS
+        # возможны только "простые" типы тела, поэтому требуется JSON и собственный Origin
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            self._send_json(415, {'error': 'Тело запроса должно иметь тип application/json'})
+            return
+        origin = self.headers.get('Origin')
+        if origin is not None and origin not in self.server.allowed_origins:
+            self._send_json(403, {'error': f"Запросы с {origin} не принимаются"})
+            return
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            url = params['url']
+            limit = params.get('limit')
+            if limit is not None:
+                limit = int(limit)
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {'error': f"Некорректное задание: {str(e)}"})
+            return
+        
+        try:
+            job = self.server.crawl_daemon.submit(url, limit, params.get('section', ''), params.get('output'))
+        except FileExistsError as e:
+            self._send_json(409, {'error': str(e)})
+            return
+        except ValueError as e:
+            self._send_json(400, {'error': f"Некорректное задание: {str(e)}"})
+            return
+        self._send_json(202, job.to_dict())
+    
+    def log_message(self, format: str, *log_args) -> None:
+        if args.verbose:
+            super().log_message(format, *log_args)
+
+def daemon_main(argv: List[str]) -> None:
+    """Режим демона: держит авторизованные браузеры и принимает задания по HTTP"""
+    global args
+    
+    parser = argparse.ArgumentParser(
+        prog='main.py daemon',
+        description="""
+Режим демона: браузеры запускаются и авторизуются один раз, задания на загрузку
+принимаются через локальный HTTP API.
+
+Пример:
+  python main.py daemon --login https://login.1c.ru/login --workers 2 --headless
+  curl -X POST http://127.0.0.1:8765/jobs -H 'Content-Type: application/json' -d '{"url": "https://its.1c.ru/db/edtdoc", "section": "7.3", "limit": 50}'
+  curl http://127.0.0.1:8765/jobs/1
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--login', required=True, help='URL страницы авторизации (например, https://login.1c.ru/login)')
+    parser.add_argument('--username', required=False, help='Имя пользователя (если не указано, берется из .env файла)')
+    parser.add_argument('--password', required=False, help='Пароль пользователя (если не указано, берется из .env файла)')
+    parser.add_argument('--workers', type=int, default=1, help='Количество браузеров в пуле (по умолчанию 1)')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес для HTTP API (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Порт для HTTP API (по умолчанию 8765)')
+    parser.add_argument('--output', default='out', help='Каталог, в котором создаются каталоги заданий; поле output задания - путь внутри него (по умолчанию out)')
+    parser.add_argument('--headless', action='store_true', help='Запуск браузеров в фоновом режиме без отображения окна')
+    parser.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
+    parser.add_argument('--discover-depth', type=int, default=0, help='Глубина обхода ссылок внутри документов (по умолчанию 0 - не искать)')
+    parser.add_argument('--resolve-redirects', action='store_true', help='Проверять перенаправления адресов оглавления перед загрузкой')
+    add_pipeline_arguments(parser)
+    add_browser_arguments(parser)
+    parser.add_argument('--structure-ttl', type=float, default=24, help='Сколько часов хранить структуру документации в памяти (по умолчанию 24, 0 - без ограничения)')
+    args = parser.parse_args(argv)
+    
+    resolve_credentials(args)
+    
+    daemon = CrawlDaemon(args.login, args.username, args.password, args.workers,
+                         args.headless, args.output, args.structure_ttl)
+    daemon.start()
+    
+    server = ThreadingHTTPServer((args.host, args.port), _DaemonRequestHandler)
+    server.crawl_daemon = daemon
+    server.allowed_origins = {f"http://{host}:{args.port}" for host in (args.host, '127.0.0.1', 'localhost')}
+    print(f"Демон принимает задания на http://{args.host}:{args.port}/jobs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Остановка демона, ожидание завершения текущих заданий...")
+    finally:
+        server.server_close()
+        daemon.stop()
+
+def _raise_keyboard_interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+def main():
+    global args, _run_budget, _memory_profiler  # Перемещаем объявление в начало функции
+    
+    if len(sys.argv) > 1 and sys.argv[1] == 'daemon':
+        daemon_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'reprocess':
+        reprocess_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'analyze':
+        analyze_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'pack':
+        pack_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'history':
+        history_main(sys.argv[2:])
+        return
+    
+    parser = argparse.ArgumentParser(
+        description="""
+Парсер документации 1С ИТС - инструмент для локального сохранения документации.
+
+Примеры запуска:
+  Простой запуск:
+    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login
+  
+  С авторизацией через командную строку:
+    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login --username user --password pass
+  
+  С ограничением количества страниц и запуском в фоновом режиме:
+    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login --limit 20 --headless
+  
+  С расширенным выводом для отладки:
+    python main.py --url https://its.1c.ru/db/edtdoc --login https://login.1c.ru/login --verbose
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--url', required=True, help='URL документации для загрузки (например, https://its.1c.ru/db/edtdoc)')
+    parser.add_argument('--login', required=True, help='URL страницы авторизации (например, https://login.1c.ru/login)')
+    parser.add_argument('--username', required=False, help='Имя пользователя (если не указано, берется из .env файла)')
+    parser.add_argument('--password', required=False, help='Пароль пользователя (если не указано, берется из .env файла)')
+    parser.add_argument('--limit', type=int, help='Ограничение количества страниц для загрузки (по умолчанию - все страницы)')
+    parser.add_argument('--headless', action='store_true', help='Запуск браузера в фоновом режиме без отображения окна')
+    parser.add_argument('--verbose', action='store_true', help='Включить расширенный вывод для отладки')
+    parser.add_argument('--discover-depth', type=int, default=0, help='Глубина обхода ссылок внутри документов на страницы, отсутствующие в оглавлении (по умолчанию 0 - не искать)')
+    parser.add_argument('--resolve-redirects', action='store_true', help='Перед загрузкой проверить перенаправления адресов оглавления, чтобы записи, ведущие на один документ, сохранялись один раз')
+    add_pipeline_arguments(parser)
+    add_browser_arguments(parser)
+    parser.add_argument('--resume', action='store_true', help='Продолжить прерванную загрузку по журналу в каталоге out, пропуская уже сохраненные страницы')
+    parser.add_argument('--section', action='append', help='Загрузить только раздел с указанным номером вместе с вложенными (например, 7.3; можно указать несколько раз)')
+    parser.add_argument('--from-section', help='Загрузить страницы, начиная с раздела с указанным номером, и все следующие за ним')
+    parser.add_argument('--match', help='Загрузить только страницы, заголовок или URL которых соответствует регулярному выражению (без учета регистра)')
+    parser.add_argument('--max-depth', type=int, help='Загрузить только страницы первых N уровней оглавления (1 - только разделы верхнего уровня)')
+    parser.add_argument('--max-duration', type=float, default=0, help='Остановить загрузку через указанное число минут (по умолчанию 0 - без ограничения)')
+    parser.add_argument('--max-bytes', type=parse_size, default=0, help='Остановить загрузку после получения указанного объема данных, например 500M или 2G (по умолчанию 0 - без ограничения)')
+    parser.add_argument('--max-requests-per-minute', type=float, default=0, help='Не больше указанного числа запросов к сайту в минуту, включая страницы и изображения (по умолчанию 0 - без ограничения)')
+    parser.add_argument('--memory-profile', action='store_true',
+                        help='Замерять память по этапам сохранения (tracemalloc) и RSS процессов Python и браузера, '
+                             'в конце вывести отчет и сохранить его в out/memory_profile.json')
+    parser.add_argument('--pack', help='После загрузки упаковать каталог out в указанный файл (см. команды pack и serve)')
+    parser.add_argument('--history', help='После загрузки добавить каталог out как новую версию в хранилище истории (см. команду history)')
+    parser.add_argument('--structure-file', help='Файл для кэширования структуры документации: если он есть и не устарел, оглавление на сайте не разбирается')
+    parser.add_argument('--structure-ttl', type=float, default=24, help='Срок годности файла структуры в часах (по умолчанию 24, 0 - без ограничения)')
+    args = parser.parse_args()
+    
+    resolve_credentials(args)
+    if args.max_duration or args.max_bytes or args.max_requests_per_minute:
+        _run_budget = RunBudget(args.max_duration * 60, args.max_bytes, args.max_requests_per_minute)
+    if args.memory_profile:
+        _memory_profiler = MemoryProfiler({
+            'browser': capture_page,
+            'images': PagePipeline._fetch_images,
+            'transform': PagePipeline._transform,
+            'write': PagePipeline._write,
+        })
+        _memory_profiler.start()
+    
+    # Прерывание по SIGTERM обрабатывается так же, как Ctrl+C: состояние сохраняется в журнал
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    
+    output_dir = 'out'
+    journal_path = os.path.join(output_dir, CRAWL_JOURNAL_FILE)
+    resume_pages = None
+    if args.resume:
+        if os.path.exists(journal_path):
+            journal = CrawlJournal(journal_path)
+            if journal.get('url') in (None, args.url):
+                resume_pages = journal.load_pages()
+            else:
+                print(f"Журнал относится к другой документации: {journal.get('url')}")
+            journal.close()
+        if resume_pages is None:
+            print("Нет журнала предыдущего запуска для продолжения, загрузка начнется заново")
+    # При выборочной загрузке ранее сохраненные страницы остаются в каталоге out
+    selective = bool(args.section or args.from_section or args.match is not None or args.max_depth is not None)
+    if resume_pages is None and not selective:
+        clean_output_directory(output_dir)
+    
+    supervisor = create_browser_backend(args, args.headless, args.login, args.username, args.password)
+    
+    try:
+        browser = supervisor.start()
+        
+        if resume_pages is not None:
+            pages = resume_pages
+        else:
+            pages = get_doc_structure(browser, args.url, args.structure_file, args.structure_ttl)
+        selected = select_pages(pages, args.section, args.match, args.max_depth, args.from_section)
         
         if args.limit:
             print(f"Сохранение {args.limit} страниц...")
         else:
             print("Сохранение всех страниц...")
         
-        save_all_pages(browser, pages, args.limit)
+        os.makedirs(output_dir, exist_ok=True)
+        journal = CrawlJournal(journal_path)
+        journal.set('url', args.url)
+        journal.close()
+        remaining = save_all_pages(browser, pages, args.limit, output_dir, supervisor=supervisor,
+                                   resume=resume_pages is not None, selected=selected)
+        if _memory_profiler is not None:
+            write_memory_report(_memory_profiler.stop(), output_dir)
+        if _run_budget is not None:
+            print(f"Запросов к сайту: {_run_budget.requests}, получено {_run_budget.bytes // 1024} КБ "
+                  f"за {_run_budget.elapsed() / 60:.1f} мин, ожидание из-за ограничения частоты {_run_budget.waited:.0f} с")
+        if remaining:
+            # Неполная копия не упаковывается и не попадает в историю до завершения загрузки
+            sys.exit(BUDGET_EXIT_CODE)
+        if args.pack:
+            files, blobs, size = pack_output(output_dir, args.pack)
+            print(f"Документация упакована в {args.pack}: файлов {files}, уникальных {blobs}, {size // 1024} КБ")
+        if args.history:
+            store = HistoryStore(args.history)
+            try:
+                version, files, added = store.commit(output_dir, time.strftime('%Y-%m-%d %H:%M'))
+            finally:
+                store.close()
+            print(f"Версия {version} добавлена в {args.history}: файлов {files}, новых данных {added // 1024} КБ")
+        if supervisor.restarts:
+            print(f"Браузер перезапускался {supervisor.restarts} раз")
         print("Готово!")
             
+    except KeyboardInterrupt:
+        print("Загрузка прервана")
+        sys.exit(130)
     except Exception as e:
         print("Ошибка при выполнении")
         if args.verbose:
             print(f"Детали: {str(e)}")
-            print("URL в момент ошибки:", browser.current_url)
+            if supervisor.browser is not None:
+                print("URL в момент ошибки:", supervisor.browser.current_url)
     finally:
-        browser.quit()
+        supervisor.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,112 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import main
+from main import AssetStore
+
+class FakeResponse:
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+
+class FakeSession:
+    """Отдает ресурсы из словаря URL -> содержимое, для остальных URL - 404"""
+    
+    def __init__(self, resources):
+        self.resources = resources
+        self.requested = []
+        self._lock = threading.Lock()
+    
+    def get(self, url, headers=None, allow_redirects=True):
+        with self._lock:
+            self.requested.append(url)
+        if url in self.resources:
+            return FakeResponse(200, self.resources[url])
+        return FakeResponse(404)
+
+class AssetStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch.object(main, 'args', argparse.Namespace(verbose=False), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def store(self, resources):
+        return AssetStore(os.path.join(self.directory, 'assets'), FakeSession(resources))
+    
+    def read(self, store, name):
+        with open(os.path.join(store.assets_dir, name), 'rb') as f:
+            return f.read()
+    
+    def test_failed_stylesheet_is_not_mapped(self):
+        store = self.store({})
+        self.assertIsNone(store.fetch('https://its.1c.ru/style.css', True))
+        self.assertIsNone(store.fetch('https://its.1c.ru/style.css', True))
+        self.assertEqual(store.fetch_page_assets('<link rel="stylesheet" href="/style.css">', 'https://its.1c.ru/db/', ''), {})
+        self.assertEqual(store.session.requested, ['https://its.1c.ru/style.css'])
+        self.assertFalse(os.path.exists(store.assets_dir))
+    
+    def test_stylesheet_requested_during_failed_download(self):
+        store = self.store({})
+        started = threading.Event()
+        release = threading.Event()
+        get = store.session.get
+        
+        def slow_get(url, headers=None, allow_redirects=True):
+            started.set()
+            release.wait(10)
+            return get(url, headers, allow_redirects)
+        
+        store.session.get = slow_get
+        results = {}
+        first = threading.Thread(target=lambda: results.setdefault('first', store.fetch('https://its.1c.ru/style.css', True)))
+        first.start()
+        started.wait(10)
+        second = threading.Thread(target=lambda: results.setdefault('second', store.fetch('https://its.1c.ru/style.css', True)))
+        second.start()
+        second.join(0.2)
+        release.set()
+        first.join(10)
+        second.join(10)
+        self.assertEqual(results, {'first': None, 'second': None})
+    
+    def test_stylesheet_references_are_localized(self):
+        store = self.store({
+            'https://its.1c.ru/a.css': b'@import "b.css"; body { background: url(bg.png) } p { background: url(missing.png) }',
+            'https://its.1c.ru/b.css': b'@import "a.css"; h1 { color: red }',
+            'https://its.1c.ru/bg.png': b'png',
+        })
+        name = store.fetch('https://its.1c.ru/a.css', True)
+        css = self.read(store, name).decode('utf-8')
+        b_name = store.fetch('https://its.1c.ru/b.css', True)
+        self.assertIn(b_name, css)
+        self.assertIn(store.fetch('https://its.1c.ru/bg.png'), css)
+        self.assertIn('https://its.1c.ru/missing.png', css)
+        self.assertIn(name, self.read(store, b_name).decode('utf-8'))
+    
+    def test_same_content_is_stored_once(self):
+        store = self.store({'https://its.1c.ru/1.png': b'png', 'https://its.1c.ru/2.png': b'png'})
+        self.assertEqual(store.fetch('https://its.1c.ru/1.png'), store.fetch('https://its.1c.ru/2.png'))
+        self.assertEqual(store.downloaded, 1)
+    
+    def test_concurrent_fetches_download_once(self):
+        store = self.store({'https://its.1c.ru/a.css': b'@import "b.css";', 'https://its.1c.ru/b.css': b'@import "a.css";'})
+        results = []
+        threads = [threading.Thread(target=lambda url=url: results.append(store.fetch(url, True)))
+                   for url in ['https://its.1c.ru/a.css', 'https://its.1c.ru/b.css'] * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(len(set(results)), 2)
+        self.assertEqual(sorted(store.session.requested), ['https://its.1c.ru/a.css', 'https://its.1c.ru/b.css'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from main import analyze_page, find_near_duplicates, mark_page_duplicates, minhash_signature, signature_similarity
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second)
+
+class MinhashSignatureTest(unittest.TestCase):
+    def test_empty_set(self):
+        self.assertIsNone(minhash_signature([], 64))
+    
+    def test_signature_does_not_depend_on_order_and_repeats(self):
+        generator = random.Random(1)
+        hashes = [generator.getrandbits(64) for _ in range(500)]
+        signature = minhash_signature(hashes, 64)
+        self.assertEqual(len(signature), 64)
+        self.assertEqual(minhash_signature(list(reversed(hashes)) + hashes[:100], 64), signature)
+    
+    def test_empty_bins_are_filled(self):
+        signature = minhash_signature([5], 64)
+        self.assertEqual(len(set(signature)), 64)
+        self.assertEqual(signature_similarity(signature, signature), 1.0)
+    
+    def test_similarity_estimates_jaccard(self):
+        generator = random.Random(42)
+        common = {generator.getrandbits(64) for _ in range(3000)}
+        first = common | {generator.getrandbits(64) for _ in range(1000)}
+        second = common | {generator.getrandbits(64) for _ in range(1000)}
+        estimate = signature_similarity(minhash_signature(list(first), 256), minhash_signature(list(second), 256))
+        self.assertAlmostEqual(estimate, jaccard(first, second), delta=0.1)
+    
+    def test_disjoint_sets(self):
+        generator = random.Random(7)
+        first = [generator.getrandbits(64) for _ in range(1000)]
+        second = [generator.getrandbits(64) for _ in range(1000)]
+        self.assertLess(signature_similarity(minhash_signature(first, 64), minhash_signature(second, 64)), 0.1)
+
+class FindNearDuplicatesTest(unittest.TestCase):
+    def test_duplicate_similarity_is_not_below_threshold(self):
+        # 1 и 3 связаны только через 2, их сходство ниже порога
+        first = tuple(range(64))
+        second = tuple(range(56)) + tuple(range(100, 108))
+        third = tuple(range(48)) + tuple(range(100, 116))
+        duplicates = find_near_duplicates({1: first, 2: second, 3: third}, 0.85)
+        self.assertEqual(duplicates, {2: (1, 0.875)})
+    
+    def test_group_original_is_lowest_page(self):
+        signature = tuple(range(64))
+        duplicates = find_near_duplicates({3: signature, 1: signature, 2: signature}, 0.9)
+        self.assertEqual(duplicates, {2: (1, 1.0), 3: (1, 1.0)})
+
+class MarkPageDuplicatesTest(unittest.TestCase):
+    def setUp(self):
+        self.page_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.page_dir)
+        self.html_file = os.path.join(self.page_dir, 'page.html')
+    
+    def blocks(self, content):
+        with open(self.html_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return analyze_page(self.page_dir)['blocks']
+    
+    def mark(self, content, digests):
+        blocks = [(digest, tag, offset) for digest, _, _, tag, offset in self.blocks(content) if digest in digests]
+        mark_page_duplicates(self.page_dir, None, blocks)
+        with open(self.html_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    def test_markers_are_replaced(self):
+        words = ' '.join(f"слово{i}" for i in range(10))
+        content = f'<p>{words}</p><p class="x">{words} еще</p>'
+        digests = [block[0] for block in self.blocks(content)]
+        marked = self.mark(content, {digests[0], digests[1]})
+        self.assertEqual(marked.count('data-boilerplate'), 2)
+        remarked = self.mark(marked, {digests[1]})
+        self.assertEqual(remarked, f'<p>{words}</p><p data-boilerplate="{digests[1]}" class="x">{words} еще</p>')
+        self.assertEqual(self.mark(remarked, set()), content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from main import apply_delta, encode_delta
+
+class DeltaTest(unittest.TestCase):
+    def assertRoundTrip(self, base, data):
+        delta = encode_delta(base, data)
+        self.assertEqual(apply_delta(base, delta), data)
+        return delta
+    
+    def test_identical_content_is_one_copy(self):
+        base = b''.join(b'<p>line %d</p>\n' % i for i in range(100))
+        delta = self.assertRoundTrip(base, base)
+        self.assertEqual(delta[:1], b'C')
+        self.assertEqual(len(delta), 9)
+    
+    def test_small_change_is_small_delta(self):
+        base = b''.join(b'<p>line %d</p>\n' % i for i in range(1000))
+        data = base.replace(b'<p>line 500</p>', b'<p>changed</p>')
+        delta = self.assertRoundTrip(base, data)
+        self.assertLess(len(delta), 100)
+    
+    def test_minified_pages_split_by_tags(self):
+        base = b''.join(b'<div>block %d</div>' % i for i in range(500))
+        data = base.replace(b'<div>block 250</div>', b'<div>new</div><div>block 250</div>')
+        delta = self.assertRoundTrip(base, data)
+        self.assertLess(len(delta), 100)
+    
+    def test_moved_and_repeated_fragments(self):
+        base = b'a\nb\nc\nd\ne\n'
+        self.assertRoundTrip(base, b'd\ne\na\nb\nc\nd\ne\n')
+        self.assertRoundTrip(base, b'b\nc\nb\nc\nx\n')
+    
+    def test_empty_content(self):
+        self.assertRoundTrip(b'', b'new\n')
+        self.assertEqual(self.assertRoundTrip(b'old\n', b''), b'')
+        self.assertRoundTrip(b'', b'')
+    
+    def test_data_without_line_end(self):
+        self.assertRoundTrip(b'one\ntwo', b'one\ntwo three')
+    
+    def test_damaged_delta(self):
+        with self.assertRaises(ValueError):
+            apply_delta(b'a\n', b'X')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from main import parse_tag, rewrite_tags
+
+class ParseTagTest(unittest.TestCase):
+    def test_attributes_keep_order_and_quotes(self):
+        content = '<img src="a.png" alt=\'x\' width=10 hidden>'
+        tag = parse_tag(content, 0, 'img')
+        self.assertEqual(tag.end, len(content))
+        self.assertEqual(tag.attributes, [['src', 'a.png', '"'], ['alt', 'x', "'"], ['width', '10', ''], ['hidden', None, '']])
+        self.assertFalse(tag.closed)
+    
+    def test_names_are_lowercased_and_values_kept_raw(self):
+        tag = parse_tag('<img SRC="a.png?x=1&amp;y=2">', 0, 'img')
+        self.assertEqual(tag.get('src'), 'a.png?x=1&amp;y=2')
+        self.assertIsNone(tag.get('alt'))
+    
+    def test_greater_than_inside_quotes_does_not_end_tag(self):
+        content = '<img alt="a > b" src=x.png>tail'
+        tag = parse_tag(content, 0, 'img')
+        self.assertEqual(content[tag.end:], 'tail')
+        self.assertEqual(tag.get('alt'), 'a > b')
+    
+    def test_self_closing(self):
+        tag = parse_tag('<img src="a.png" />', 0, 'img')
+        self.assertTrue(tag.closed)
+        self.assertEqual(tag.render(), '<img src="a.png" />')
+    
+    def test_unterminated_tag(self):
+        self.assertIsNone(parse_tag('<img src="a.png', 0, 'img'))
+        self.assertIsNone(parse_tag('<img src=a.png', 0, 'img'))
+    
+    def test_start_offset(self):
+        content = '<p>text</p><img src=a.png>'
+        tag = parse_tag(content, content.index('<img'), 'img')
+        self.assertEqual((tag.start, tag.end), (11, len(content)))
+
+class RewriteTagsTest(unittest.TestCase):
+    def test_unchanged_document_is_returned_as_is(self):
+        content = '<IMG  src = "a.png"><p>x</p>'
+        self.assertIs(rewrite_tags(content, 'img', lambda tag: None), content)
+    
+    def test_only_changed_tags_are_rendered(self):
+        content = '<img src="a.png"> <img  src=b.png  alt=b> <imgx src="c.png">'
+        
+        def rewrite(tag):
+            if tag.get('src') == 'a.png':
+                tag.set('src', 'image001.png')
+        
+        self.assertEqual(rewrite_tags(content, 'img', rewrite),
+                         '<img src="image001.png"> <img  src=b.png  alt=b> <imgx src="c.png">')
+    
+    def test_set_remove_and_quotes(self):
+        def rewrite(tag):
+            tag.remove('onclick', 'srcset')
+            tag.set('alt', 'say "hi"')
+        
+        content = '<img src=a.png srcset="a2.png 2x" onclick="x()">'
+        self.assertEqual(rewrite_tags(content, 'img', rewrite), '<img src="a.png" alt=\'say "hi"\'>')
+    
+    def test_unterminated_tag_stops_rewriting(self):
+        content = '<img src=a.png><img alt="open'
+        result = rewrite_tags(content, 'img', lambda tag: tag.set('src', 'b.png'))
+        self.assertEqual(result, '<img src="b.png"><img alt="open')
+
+if __name__ == '__main__':
+    unittest.main()
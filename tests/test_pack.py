@@ -0,0 +1,110 @@
+import argparse
+import http.client
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+import main
+from main import PackReader, _PackRequestHandler, pack_output
+
+class PackTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.output = os.path.join(self.directory, 'out')
+        self.files = {
+            'index.html': b'<html>toc</html>',
+            'assets/style.css': b'body {}',
+            'page_0001/page.html': '<html>Страница 1</html>'.encode('utf-8'),
+            'page_0001/metadata.txt': 'Title: Введение\nLevel: 0\nURL: https://its.1c.ru/db/doc/content/1/hdoc\n'.encode('utf-8'),
+            'page_0001/images/image001.png': b'png-1',
+            'page_0002/page.html': b'<html>2</html>',
+            'page_0002/metadata.txt': b'Title: Two\nLevel: 1\nURL: https://its.1c.ru/db/doc/content/2/hdoc\n',
+            'page_0002/images/image001.png': b'png-1',
+        }
+        for path, data in self.files.items():
+            self.write(path, data)
+        # Служебные файлы не упаковываются
+        self.write('.crawl_journal.sqlite', b'journal')
+        self.pack_path = os.path.join(self.directory, 'doc.itspack')
+    
+    def write(self, path, data):
+        full_path = os.path.join(self.output, *path.split('/'))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(data)
+    
+    def test_round_trip(self):
+        files, blobs, size = pack_output(self.output, self.pack_path)
+        self.assertEqual(files, len(self.files))
+        reader = PackReader(self.pack_path)
+        for path, data in self.files.items():
+            self.assertEqual(reader.read(path)[1], data)
+        self.assertIsNone(reader.read('.crawl_journal.sqlite'))
+        self.assertIsNone(reader.read('page_0003/page.html'))
+        self.assertFalse(os.path.exists(f"{self.pack_path}.tmp"))
+        
+        db = sqlite3.connect(self.pack_path)
+        self.addCleanup(db.close)
+        self.assertEqual(db.execute("SELECT idx, title, level FROM pages ORDER BY idx").fetchall(),
+                         [(1, 'Введение', 0), (2, 'Two', 1)])
+    
+    def test_identical_files_are_stored_once(self):
+        files, blobs, size = pack_output(self.output, self.pack_path)
+        self.assertEqual(blobs, len(self.files) - 1)
+        self.assertEqual(size, sum(len(data) for path, data in self.files.items() if path != 'page_0002/images/image001.png'))
+        reader = PackReader(self.pack_path)
+        self.assertEqual(reader.read('page_0001/images/image001.png')[0], reader.read('page_0002/images/image001.png')[0])
+    
+    def test_other_files_are_rejected(self):
+        db = sqlite3.connect(self.pack_path)
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.commit()
+        db.close()
+        with self.assertRaises(ValueError):
+            PackReader(self.pack_path)
+    
+    def test_server_etag(self):
+        pack_output(self.output, self.pack_path)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _PackRequestHandler)
+        server.daemon_threads = True
+        server.pack = PackReader(self.pack_path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        patcher = mock.patch.object(main, 'args', argparse.Namespace(verbose=False), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        def get(path, headers=None):
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+            connection.request('GET', path, headers=headers or {})
+            response = connection.getresponse()
+            body = response.read()
+            connection.close()
+            return response, body
+        
+        response, body = get('/')
+        self.assertEqual((response.status, body), (200, self.files['index.html']))
+        self.assertEqual(response.getheader('Content-Type'), 'text/html; charset=utf-8')
+        etag = response.getheader('ETag')
+        
+        response, body = get('/', {'If-None-Match': etag})
+        self.assertEqual((response.status, body), (304, b''))
+        self.assertEqual(response.getheader('ETag'), etag)
+        
+        response, body = get('/page_0001/page.html', {'If-None-Match': etag})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.files['page_0001/page.html'])
+        
+        response, _ = get('/page_0001/missing.png')
+        self.assertEqual(response.status, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import contextlib
+import io
+import unittest
+
+from main import DocPage, SectionIndex, select_pages
+
+def make_pages():
+    # (номер, уровень, заголовок)
+    entries = [
+        ('1.', 0, 'Введение'),
+        ('1.1.', 1, 'Установка'),
+        ('1.2.', 1, 'Настройка'),
+        ('1.2.1.', 2, 'Параметры запуска'),
+        ('2.', 0, 'Справочник'),
+        ('2.1.', 1, 'Функции'),
+        ('2.2.', 1, 'Настройка отчетов'),
+        ('3.', 0, 'Приложения'),
+    ]
+    return [DocPage(f"https://its.1c.ru/db/doc/content/{i}/hdoc", title, level, number)
+            for i, (number, level, title) in enumerate(entries, 1)]
+
+def select(pages, **conditions):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return select_pages(pages, **conditions)
+
+class SelectPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.pages = make_pages()
+    
+    def test_no_conditions(self):
+        self.assertIsNone(select(self.pages))
+    
+    def test_sections_include_subsections(self):
+        self.assertEqual(select(self.pages, sections=['1']), {1, 2, 3, 4})
+        self.assertEqual(select(self.pages, sections=['1.2.', '3']), {3, 4, 8})
+    
+    def test_unknown_section(self):
+        self.assertEqual(select(self.pages, sections=['9']), set())
+    
+    def test_from_section(self):
+        self.assertEqual(select(self.pages, from_section='2.2'), {7, 8})
+        self.assertEqual(select(self.pages, from_section='9'), set())
+    
+    def test_max_depth(self):
+        self.assertEqual(select(self.pages, max_depth=1), {1, 5, 8})
+    
+    def test_pattern_matches_title_or_url(self):
+        self.assertEqual(select(self.pages, pattern='настройка'), {3, 7})
+        self.assertEqual(select(self.pages, pattern=r'content/6/'), {6})
+    
+    def test_conditions_are_combined(self):
+        self.assertEqual(select(self.pages, sections=['1', '2'], pattern='настройка', max_depth=2), {3, 7})
+        self.assertEqual(select(self.pages, sections=['1'], from_section='1.2'), {3, 4})
+
+class SectionIndexTest(unittest.TestCase):
+    def test_section_without_own_entry_uses_number_prefix(self):
+        pages = [page for page in make_pages() if page.number != '1.2.']
+        index = SectionIndex(pages)
+        self.assertIsNone(index.position('1.2'))
+        self.assertEqual(index.subtree('1.2'), [2])
+
+if __name__ == '__main__':
+    unittest.main()
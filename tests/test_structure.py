@@ -0,0 +1,82 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from main import DocPage, STRUCTURE_FILE_FORMAT, STRUCTURE_FILE_VERSION, load_structure, save_structure
+
+URL = 'https://its.1c.ru/db/edtdoc'
+
+class StructureFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'structure.json.gz')
+    
+    def load(self, ttl_hours=0):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return load_structure(self.path, URL, ttl_hours)
+    
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(gzip.compress(json.dumps(data).encode('utf-8')))
+    
+    def valid_data(self):
+        return {'format': STRUCTURE_FILE_FORMAT, 'version': STRUCTURE_FILE_VERSION, 'created': 0, 'url': URL,
+                'pages': [[URL + '/content/1/hdoc', 'Введение', 0, '1.']]}
+    
+    def test_round_trip(self):
+        pages = [DocPage(URL + '/content/1/hdoc', 'Введение', 0, '1.'), DocPage(URL + '/content/2/hdoc', 'Установка', 1, '1.1.')]
+        with contextlib.redirect_stdout(io.StringIO()):
+            save_structure(pages, self.path, URL)
+        self.assertEqual([page.to_list() for page in self.load()], [page.to_list() for page in pages])
+    
+    def test_missing_file(self):
+        self.assertIsNone(self.load())
+    
+    def test_other_documentation_or_version(self):
+        data = self.valid_data()
+        data['url'] = 'https://its.1c.ru/db/other'
+        self.write(data)
+        self.assertIsNone(self.load())
+        data = self.valid_data()
+        data['version'] = STRUCTURE_FILE_VERSION + 1
+        self.write(data)
+        self.assertIsNone(self.load())
+    
+    def test_expired(self):
+        self.write(self.valid_data())
+        self.assertIsNone(self.load(ttl_hours=1))
+        self.assertIsNotNone(self.load())
+    
+    def test_corrupt_file_is_a_cache_miss(self):
+        corrupt = [
+            {'pages': [[URL, 'Введение', 0]]},
+            {'pages': [[URL, 'Введение', 0, '1.', 'лишнее']]},
+            {'pages': [None]},
+            {'pages': [[URL, 'Введение', 'первый', '1.']]},
+            {'pages': 5},
+            {'created': 'вчера'},
+            {'url': None},
+        ]
+        for change in corrupt:
+            data = self.valid_data()
+            data.update(change)
+            self.write(data)
+            self.assertIsNone(self.load(), change)
+        self.write([1, 2, 3])
+        self.assertIsNone(self.load())
+        data = self.valid_data()
+        del data['pages']
+        self.write(data)
+        self.assertIsNone(self.load())
+        with open(self.path, 'wb') as f:
+            f.write(b'not gzip')
+        self.assertIsNone(self.load())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from main import normalize_url, split_url_anchor
+
+class SplitUrlAnchorTest(unittest.TestCase):
+    def test_route_fragment_becomes_path(self):
+        self.assertEqual(split_url_anchor('https://its.1c.ru/db/edtdoc#content:1:hdoc'),
+                         ('https://its.1c.ru/db/edtdoc/content/1/hdoc', ''))
+    
+    def test_anchor_after_route(self):
+        self.assertEqual(split_url_anchor('https://its.1c.ru/db/edtdoc#content:1:hdoc#sec2'),
+                         ('https://its.1c.ru/db/edtdoc/content/1/hdoc', 'sec2'))
+    
+    def test_plain_anchor(self):
+        self.assertEqual(split_url_anchor('https://its.1c.ru/db/edtdoc/content/1/hdoc#sec2'),
+                         ('https://its.1c.ru/db/edtdoc/content/1/hdoc', 'sec2'))
+    
+    def test_scheme_host_and_default_port(self):
+        self.assertEqual(split_url_anchor(' HTTPS://ITS.1C.ru:443/db/doc/ ')[0], 'https://its.1c.ru/db/doc')
+        self.assertEqual(split_url_anchor('http://its.1c.ru:80/db/doc')[0], 'http://its.1c.ru/db/doc')
+        self.assertEqual(split_url_anchor('http://127.0.0.1:8800/db/doc')[0], 'http://127.0.0.1:8800/db/doc')
+        self.assertEqual(split_url_anchor('https://its.1c.ru')[0], 'https://its.1c.ru/')
+    
+    def test_path_quoting_is_canonical(self):
+        self.assertEqual(normalize_url('https://its.1c.ru/db/a b'), normalize_url('https://its.1c.ru/db/a%20b'))
+        self.assertEqual(normalize_url('https://its.1c.ru/db/%D0%B4'), normalize_url('https://its.1c.ru/db/д'))
+    
+    def test_query_is_sorted_without_ignored_parameters(self):
+        self.assertEqual(split_url_anchor('https://its.1c.ru/db/x/?b=2&a=1&utm_source=z&_=123&rnd=5'),
+                         ('https://its.1c.ru/db/x?a=1&b=2', ''))
+
+if __name__ == '__main__':
+    unittest.main()